@@ -0,0 +1,40 @@
+"""add llm response cache
+
+Revision ID: 5b8e2f1c7a90
+Revises: c19a024610f3
+Create Date: 2026-10-17 09:12:41.218305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e2f1c7a90'
+down_revision: Union[str, Sequence[str], None] = 'c19a024610f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('llm_response_cache',
+        sa.Column('cache_key', sa.String(length=64), nullable=False),
+        sa.Column('model_name', sa.String(), nullable=False),
+        sa.Column('response', sa.Text(), nullable=False),
+        sa.Column('hit_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_accessed_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('cache_key')
+    )
+    op.create_index(op.f('ix_llm_response_cache_last_accessed_at'), 'llm_response_cache', ['last_accessed_at'], unique=False)
+    op.create_index(op.f('ix_llm_response_cache_expires_at'), 'llm_response_cache', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_llm_response_cache_expires_at'), table_name='llm_response_cache')
+    op.drop_index(op.f('ix_llm_response_cache_last_accessed_at'), table_name='llm_response_cache')
+    op.drop_table('llm_response_cache')
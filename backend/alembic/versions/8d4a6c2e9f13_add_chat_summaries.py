@@ -0,0 +1,41 @@
+"""add chat summaries
+
+Revision ID: 8d4a6c2e9f13
+Revises: 5b8e2f1c7a90
+Create Date: 2026-10-17 15:20:07.481126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4a6c2e9f13'
+down_revision: Union[str, Sequence[str], None] = '5b8e2f1c7a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chat_summaries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('tab', sa.String(), nullable=False),
+        sa.Column('session_id', sa.String(), nullable=False),
+        sa.Column('summary', sa.Text(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_chat_summaries_id'), 'chat_summaries', ['id'], unique=False)
+    op.create_index(op.f('ix_chat_summaries_session_id'), 'chat_summaries', ['session_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_chat_summaries_session_id'), table_name='chat_summaries')
+    op.drop_index(op.f('ix_chat_summaries_id'), table_name='chat_summaries')
+    op.drop_table('chat_summaries')
@@ -18,6 +18,8 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from app.core.runtime_settings import runtime_settings
+
 # Configurar logging
 _ENV_PATH = Path(__file__).resolve().parents[3] / ".env"
 load_dotenv(dotenv_path=_ENV_PATH)
@@ -79,13 +81,7 @@ class ChatBotModel:
         Returns:
             Respuesta del chatbot
         """
-        # Recarga .env para reflejar cambios recientes sin depender de reinicio del proceso.
-        load_dotenv(dotenv_path=_ENV_PATH, override=True)
-        raw_skip = os.getenv("SKIP_LLM_INVOKE")
-        raw_value = raw_skip if raw_skip is not None and raw_skip.strip() else os.getenv("DEBUG_SKIP_LLM_INVOKE", "false")
-        skip_invoke = str(raw_value).strip().lower() in {"1", "true", "yes", "on"}
-
-        if skip_invoke:
+        if runtime_settings.current.skip_llm_invoke:
             logger.info(f"⏭️ Gemini invoke omitido por SKIP_LLM_INVOKE para tab={tab}")
             return (
                 "[DEBUG] Llamada a Gemini omitida (SKIP_LLM_INVOKE=true). "
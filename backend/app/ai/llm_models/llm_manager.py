@@ -5,22 +5,29 @@ Soporta múltiples proveedores (Groq, Gemini, etc) y gestiona
 prompts dinámicos, historial de conversación y contexto del modelo.
 """
 
+import asyncio
 import os
 import json
 import logging
 import re
+from dataclasses import dataclass, field
 from time import perf_counter
 from pathlib import Path
-from typing import Optional
+from typing import Any, AsyncIterator, Iterator, List, Optional
 from dotenv import load_dotenv
 
 from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
 from app.core.database import SessionLocal
+from app.core.runtime_settings import runtime_settings
 from app.ai.rag import RAGManager
+from app.ai.llm_models.provider_pool import ProviderPool
+from app.ai.llm_models.rate_limiter import LLMRateLimited, retry_after_from_error
+from app.ai.llm_models.prompt_budget import BudgetSection, PromptBudgeter, split_context_blocks
+from app.ai.llm_models.response_cache import build_cache_key, create_response_cache
+from app.ai.llm_models.semantic_cache import SemanticAnswerCache
 from sqlalchemy.orm import Session
 
 # Configurar logging y cargar .env del root del backend de forma explícita
@@ -28,6 +35,143 @@ _ENV_PATH = Path(__file__).resolve().parents[3] / ".env"
 load_dotenv(dotenv_path=_ENV_PATH)
 logger = logging.getLogger(__name__)
 
+_ERROR_MESSAGE = "Lo siento, ocurrió un error al procesar tu pregunta. Intenta de nuevo."
+
+
+class LLMStreamInterrupted(RuntimeError):
+    """El proveedor falló después de emitir `emitted_chars` caracteres: la respuesta quedó incompleta."""
+
+    def __init__(self, message: str, emitted_chars: int):
+        super().__init__(message)
+        self.emitted_chars = emitted_chars
+
+
+@dataclass
+class _LLMTurn:
+    """
+    Estado de una llamada a `ask`/`stream`/`aask`/`astream`.
+
+    Los cuatro puntos de entrada comparten los pasos previos (caches, prompt,
+    presupuesto) y posteriores (escritura en caches, tiempos) a través de este
+    objeto; solo difieren en invoke vs stream y sync vs async.
+    """
+
+    question: str
+    tab: str
+    context: Any
+    chat_history: Optional[list]
+    session_id: Optional[str]
+    conversation_summary: Optional[str]
+    stream: bool
+    async_: bool
+    context_text: str
+    semantic_variant: str
+    total_start: float = field(default_factory=perf_counter)
+    rag_ms: float = 0.0
+    rag_context: str = ""
+    inputs: dict = field(default_factory=dict)
+    budget: Any = None
+    prompt_value: Any = None
+    cache_key: str = ""
+    cache_status: str = "miss"
+    provider_name: str = "cache"
+    llm_start: float = 0.0
+    ttft_ms: Optional[float] = None
+    emitted_chars: int = 0
+    parts: List[str] = field(default_factory=list)
+
+    @property
+    def has_history(self) -> bool:
+        # Con historial o resumen la respuesta depende de la conversación: fuera del cache semántico
+        return bool(self.chat_history or self.conversation_summary)
+
+    @property
+    def flags(self) -> str:
+        """Marcas para las líneas de tiempos (` stream=true async=true`)."""
+        return (" stream=true" if self.stream else "") + (" async=true" if self.async_ else "")
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.parts)
+
+    def emit(self, text: str) -> None:
+        if self.ttft_ms is None:
+            self.ttft_ms = (perf_counter() - self.llm_start) * 1000
+        self.emitted_chars += len(text)
+        self.parts.append(text)
+
+
+_HISTORY_HEADER = "Contexto de la conversación anterior:\n" + "-" * 50
+_HISTORY_FOOTER = "-" * 50
+_SUMMARY_BLOCK_PREFIX = "Resumen de la conversación anterior:"
+_SUMMARY_PROMPT = PromptTemplate(
+    template=(
+        "Eres un asistente que mantiene el resumen de una conversación sobre un proyecto "
+        "de inversión pública (metodología MGA).\n\n"
+        "Resumen actual:\n{previous_summary}\n\n"
+        "Mensajes nuevos a incorporar:\n{messages}\n\n"
+        "Escribe el resumen actualizado en español, en máximo {max_words} palabras. "
+        "Conserva decisiones, datos del proyecto y preguntas pendientes; omite saludos y repeticiones. "
+        "Responde solo con el resumen."
+    ),
+    input_variables=["previous_summary", "messages", "max_words"],
+)
+_SKIPPED_INVOKE_MESSAGE = (
+    "[DEBUG] Llamada al modelo omitida (SKIP_LLM_INVOKE=true). "
+    "Desactiva esta variable para volver a consultar el LLM real."
+)
+_TEMPLATES_PATH = Path(__file__).resolve().parent.parent / "data" / "prompt_templates.json"
+# Remueve líneas tipo: "Pregunta: {question}" o "Pregunta del usuario: {question}"
+_QUESTION_PLACEHOLDER_PATTERN = re.compile(r"(?im)^\s*Pregunta(?:\s+del\s+usuario)?\s*:\s*\{question\}\s*$")
+# Clave interna de la plantilla para tabs sin entrada propia en el JSON
+_FALLBACK_PROMPT_KEY = "__fallback__"
+
+
+def _strip_question_placeholder(template_value: str) -> str:
+    """Elimina placeholders heredados de pregunta para evitar duplicidades."""
+    if not template_value:
+        return ""
+    return _QUESTION_PLACEHOLDER_PATTERN.sub("", template_value).strip()
+
+
+def _build_prompt_template(templates: dict, tab_key: str) -> PromptTemplate:
+    """Arma la plantilla final de un tab: instrucciones generales + módulo + variables."""
+    general_template = _strip_question_placeholder(templates.get("general", ""))
+    module_template = _strip_question_placeholder(templates.get(tab_key, templates.get("default")))
+
+    if not module_template:
+        module_template = _strip_question_placeholder(templates.get("default", "Responde de forma clara y concisa."))
+
+    # Regla solicitada: el prompt final debe ser general + módulo.
+    # Si el módulo ya es "general", evitar duplicarlo.
+    if general_template and tab_key != "general":
+        instruction_block = f"{general_template}\n\n{module_template}"
+    else:
+        instruction_block = module_template or general_template or "Responde de forma clara y concisa."
+
+    template_text = (
+        f"{instruction_block}\n\n"
+        "Informacion del proyecto:\n"
+        "{project_context}\n\n"
+        "Contexto de la conversacion:\n"
+        "{chat_history}\n\n"
+        "Pregunta del usuario:\n"
+        "{question}"
+    )
+
+    return PromptTemplate(
+        template=template_text,
+        input_variables=["project_context", "chat_history", "question"]
+    )
+
+
+def compile_prompt_templates(templates: dict) -> dict:
+    """Compila la plantilla de cada tab del JSON, más la de respaldo para tabs sin entrada propia."""
+    compiled = {tab_key.lower(): _build_prompt_template(templates, tab_key.lower()) for tab_key in templates}
+    compiled.setdefault("general", _build_prompt_template(templates, "general"))
+    compiled[_FALLBACK_PROMPT_KEY] = _build_prompt_template(templates, _FALLBACK_PROMPT_KEY)
+    return compiled
+
 # ==============================
 # 🔹 DEPENDENCIA DB
 # ==============================
@@ -55,59 +199,103 @@ class LLMManager:
         """Inicializa el modelo LLM según la configuración del .env con LLM_PROVIDER"""
         self.llm_provider = os.getenv("LLM_PROVIDER", "groq").lower()
         self.templates = self._load_templates()
+        # Plantillas compiladas una vez por tab; se reemplazan al cambiar el JSON
+        self._prompt_templates = compile_prompt_templates(self.templates)
+        runtime_settings.watch_file(_TEMPLATES_PATH, self.reload_templates)
         self.rag_manager = RAGManager()
         self.max_chat_history_messages = max(int(os.getenv("LLM_MAX_CHAT_HISTORY_MESSAGES", "6")), 1)
-        self.max_project_context_chars = max(int(os.getenv("LLM_MAX_PROJECT_CONTEXT_CHARS", "12000")), 1000)
-        self.model = self._initialize_llm()
-        logger.info(f"✅ LLMManager inicializado con provider: {self.llm_provider}")
+        # Proveedores en orden de preferencia (LLM_PROVIDERS) con failover y hedging
+        self.provider_pool = ProviderPool.from_env(self.llm_provider)
+        self.llm_provider = self.provider_pool.primary.name
+        self.model_name = self.provider_pool.primary.model_name
+        self.temperature = self.provider_pool.primary.temperature
+        self.prompt_budgeter = PromptBudgeter.from_env(self.model_name)
+        self.summary_enabled = os.getenv("LLM_SUMMARY_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+        self.summary_max_words = max(int(os.getenv("LLM_SUMMARY_MAX_WORDS", "150")), 30)
+        # El resumen es de fondo: espera poco en la cola del proveedor y cede el cupo al chat
+        self.summary_max_wait_seconds = max(float(os.getenv("LLM_SUMMARY_QUEUE_MAX_WAIT_SECONDS", "1")), 0.0)
+        self.summary_model = self._initialize_summary_llm()
+        self._summary_chain = self.summary_model | StrOutputParser()
+        self.response_cache = create_response_cache()
+        self.semantic_cache = SemanticAnswerCache.from_env(
+            encoder=self.rag_manager.encode_queries,
+            version_provider=lambda: self.rag_manager.index_version,
+        )
+        logger.info(
+            f"✅ LLMManager inicializado con provider: {self.llm_provider} "
+            f"(pool: {', '.join(provider.name for provider in self.provider_pool.providers)})"
+        )
+
+    @property
+    def model(self):
+        """Modelo del proveedor principal del pool."""
+        return self.provider_pool.primary.model
+
+    @model.setter
+    def model(self, value) -> None:
+        self.provider_pool.primary.model = value
 
-    def _initialize_llm(self):
-        """Inicializa el modelo LLM según el provider configurado."""
+    def _initialize_summary_llm(self):
+        """
+        Modelo económico para resumir conversaciones (`LLM_SUMMARY_MODEL`).
+
+        Con Groq se usa un modelo pequeño con temperatura baja; con otros
+        proveedores se reutiliza el modelo principal.
+        """
         if self.llm_provider == "groq":
-            api_key = os.getenv("GROQ_API_KEY")
-            model_name = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
-            
-            if not api_key:
-                raise ValueError("GROQ_API_KEY no configurada en .env")
-            
-            logger.info(f"Inicializando Groq LLM con modelo: {model_name}")
+            summary_model_name = os.getenv("LLM_SUMMARY_MODEL", "llama-3.1-8b-instant")
             return ChatGroq(
-                model_name=model_name,
-                groq_api_key=api_key,
-                temperature=0.7,
-            )
-            
-        elif self.llm_provider == "gemini":
-            api_key = os.getenv("GOOGLE_API_KEY")
-            if not api_key:
-                raise ValueError("GOOGLE_API_KEY no configurada en .env")
-            
-            logger.info("Inicializando Gemini LLM")
-            return ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash",
-                google_api_key=api_key,
-                convert_system_message_to_human=True,
+                model_name=summary_model_name,
+                groq_api_key=os.getenv("GROQ_API_KEY"),
+                temperature=0.2,
             )
-        else:
-            raise ValueError(f"LLM Provider no soportado: {self.llm_provider}")
+        return self.model
+
+    @staticmethod
+    def _read_templates() -> dict:
+        """Lee los templates del archivo JSON (lanza si no existe o es inválido)."""
+        with open(_TEMPLATES_PATH, "r", encoding="utf-8") as f:
+            templates = json.load(f)
+        if not isinstance(templates, dict):
+            raise ValueError("prompt_templates.json debe ser un objeto {tab: template}")
+        return templates
 
     def _load_templates(self) -> dict:
         """Carga los templates desde un archivo JSON."""
-        data_path = os.path.join(os.path.dirname(__file__), "../data/prompt_templates.json")
         try:
-            with open(data_path, "r", encoding="utf-8") as f:
-                templates = json.load(f)
-                logger.info(f"✅ {len(templates)} templates cargados")
-                return templates
+            templates = self._read_templates()
+            logger.info(f"✅ {len(templates)} templates cargados")
+            return templates
         except Exception as e:
             logger.warning(f"⚠️ Error cargando templates: {e}")
             return {
                 "default": "Eres un asistente útil para proyectos de inversión pública MGA. Responde de forma clara y concisa."
             }
 
+    def reload_templates(self) -> bool:
+        """
+        Relee `prompt_templates.json` y reemplaza las plantillas compiladas.
+
+        Si el archivo no se puede leer (p. ej. se está editando) se conservan
+        las plantillas vigentes. Retorna True si se recargaron.
+        """
+        try:
+            templates = self._read_templates()
+            compiled = compile_prompt_templates(templates)
+        except Exception as e:
+            logger.warning(f"⚠️ Templates no recargados, se conservan los vigentes: {e}")
+            return False
+        self.templates = templates
+        self._prompt_templates = compiled
+        logger.info(f"🔄 {len(templates)} templates recargados y compilados")
+        return True
+
     def get_prompt_template(self, tab: str) -> PromptTemplate:
         """
         Obtiene la plantilla de prompt para un componente MGA.
+
+        Las plantillas se compilan una vez (al iniciar y al recargar el JSON);
+        aquí solo se consulta el diccionario.
         
         Args:
             tab: Componente MGA (problems, participants, population, etc)
@@ -115,93 +303,40 @@ class LLMManager:
         Returns:
             PromptTemplate configurado
         """
-        def _strip_question_placeholder(template_value: str) -> str:
-            """Elimina placeholders heredados de pregunta para evitar duplicidades."""
-            if not template_value:
-                return ""
-            # Remueve líneas tipo: "Pregunta: {question}" o "Pregunta del usuario: {question}"
-            cleaned = re.sub(
-                r"(?im)^\s*Pregunta(?:\s+del\s+usuario)?\s*:\s*\{question\}\s*$",
-                "",
-                template_value,
-            )
-            return cleaned.strip()
-
         tab_key = (tab or "general").lower()
-        general_template = _strip_question_placeholder(self.templates.get("general", ""))
-        module_template = _strip_question_placeholder(
-            self.templates.get(tab_key, self.templates.get("default"))
-        )
-
-        if not module_template:
-            module_template = _strip_question_placeholder(
-                self.templates.get("default", "Responde de forma clara y concisa.")
-            )
-
-        # Regla solicitada: el prompt final debe ser general + módulo.
-        # Si el módulo ya es "general", evitar duplicarlo.
-        if general_template and tab_key != "general":
-            instruction_block = f"{general_template}\n\n{module_template}"
-        else:
-            instruction_block = module_template or general_template or "Responde de forma clara y concisa."
-
-        template_text = (
-            f"{instruction_block}\n\n"
-            "Informacion del proyecto:\n"
-            "{project_context}\n\n"
-            "Contexto de la conversacion:\n"
-            "{chat_history}\n\n"
-            "Pregunta del usuario:\n"
-            "{question}"
-        )
-        
-        return PromptTemplate(
-            template=template_text,
-            input_variables=["project_context", "chat_history", "question"]
-        )
+        prompts = self._prompt_templates
+        # Un tab sin plantilla propia usa general + default, igual para todos
+        return prompts.get(tab_key) or prompts[_FALLBACK_PROMPT_KEY]
 
-    def _build_chat_context(self, chat_history: list) -> str:
+    def _build_chat_context(self, chat_history: list) -> list:
         """
-        Construye el contexto del historial de chat de forma natural.
+        Convierte el historial de chat en bloques (un mensaje completo por bloque).
         
         Args:
             chat_history: Lista de mensajes anteriores
             
         Returns:
-            Contexto formateado del historial
+            Líneas "Tú: ..." / "Yo: ..." en orden cronológico
         """
         if not chat_history:
-            return ""
-        
-        context_lines = []
-        context_lines.append("Contexto de la conversación anterior:")
-        context_lines.append("-" * 50)
-        
-        # Usar una ventana pequeña para reducir latencia/tokens.
-        for msg in chat_history[-self.max_chat_history_messages:]:
-            sender = "Tú" if msg.get("sender") == "user" else "Yo"
-            message_text = msg.get("message", "")[:400]  # Truncar mensajes largos
-            context_lines.append(f"{sender}: {message_text}")
-        
-        context_lines.append("-" * 50)
+            return []
         
-        return "\n".join(context_lines)
+        # Ventana de mensajes; el presupuesto de tokens decide cuántos entran completos.
+        return [self._format_message(msg) for msg in chat_history[-self.max_chat_history_messages:]]
+
+    @staticmethod
+    def _format_message(msg: dict) -> str:
+        """Línea "Tú: ..." / "Yo: ..." de un mensaje del historial."""
+        return f"{'Tú' if msg.get('sender') == 'user' else 'Yo'}: {msg.get('message', '')}"
 
     def _is_invoke_skipped(self) -> bool:
         """Permite desactivar llamadas al LLM durante debug para evitar consumo de tokens."""
-        # Recarga .env para reflejar cambios recientes sin depender de reinicio del proceso.
-        load_dotenv(dotenv_path=_ENV_PATH, override=True)
-
-        # SKIP_LLM_INVOKE tiene prioridad solo si viene con valor no vacío.
-        raw_skip = os.getenv("SKIP_LLM_INVOKE")
-        raw_value = raw_skip if raw_skip is not None and raw_skip.strip() else os.getenv("DEBUG_SKIP_LLM_INVOKE", "false")
-        return str(raw_value).strip().lower() in {"1", "true", "yes", "on"}
+        # Snapshot en memoria: los cambios del .env llegan por el watcher o /admin/settings/reload.
+        return runtime_settings.current.skip_llm_invoke
 
     def _merge_project_and_rag_context(self, project_context: str, rag_context: str) -> str:
         """Combina el contexto funcional del proyecto con el contexto recuperado por RAG."""
         project_context = (project_context or "").strip()
-        if len(project_context) > self.max_project_context_chars:
-            project_context = project_context[: self.max_project_context_chars]
         rag_context = (rag_context or "").strip()
 
         if project_context and rag_context:
@@ -214,6 +349,236 @@ class LLMManager:
             return rag_context
         return project_context
 
+    @staticmethod
+    def _context_text(context) -> str:
+        """Contexto del módulo como texto (acepta bloques o texto plano)."""
+        if not context:
+            return ""
+        return context if isinstance(context, str) else "\n".join(context)
+
+    def _build_chain_inputs(
+        self,
+        prompt: PromptTemplate,
+        question: str,
+        context,
+        chat_history: Optional[list],
+        rag_hits: list,
+        conversation_summary: Optional[str] = None,
+    ) -> tuple:
+        """
+        Construye las variables de entrada del prompt dentro del presupuesto de tokens.
+
+        Prioridad: datos del proyecto, fragmentos RAG (por similitud) e historial
+        (del más reciente al más antiguo, con el resumen de la sesión como el
+        bloque más antiguo). Se descartan bloques completos.
+
+        Returns:
+            Tupla (inputs, rag_context, budget)
+        """
+        history_blocks = self._build_chat_context(chat_history) if chat_history else []
+        if conversation_summary:
+            history_blocks.insert(0, f"{_SUMMARY_BLOCK_PREFIX} {conversation_summary}")
+        sections = [
+            BudgetSection("project", split_context_blocks(context)),
+            BudgetSection(
+                "rag",
+                [self.rag_manager.format_hit(hit) for hit in rag_hits],
+                header=self.rag_manager.CONTEXT_HEADER,
+                skippable=True,
+            ),
+            BudgetSection(
+                "history",
+                list(reversed(history_blocks)),
+                header=_HISTORY_HEADER,
+                footer=_HISTORY_FOOTER,
+            ),
+        ]
+        fixed_text = prompt.format(project_context="", chat_history="", question=question)
+        budget = self.prompt_budgeter.fit(fixed_text, sections)
+
+        project_context = "\n".join(budget.selected["project"])
+        if budget.dropped["project"]:
+            project_context += (
+                f"\n(Se omitieron {budget.dropped['project']} bloques de información "
+                "del proyecto por límite de contexto)"
+            )
+
+        rag_blocks = budget.selected["rag"]
+        rag_context = "\n".join([self.rag_manager.CONTEXT_HEADER, *rag_blocks]) if rag_blocks else ""
+
+        history = list(reversed(budget.selected["history"]))
+        chat_history_text = "\n".join([_HISTORY_HEADER, *history, _HISTORY_FOOTER]) if history else ""
+
+        inputs = {
+            "project_context": self._merge_project_and_rag_context(project_context, rag_context),
+            "chat_history": chat_history_text,
+            "question": question,
+        }
+        return inputs, rag_context, budget
+
+    def _prepare_turn(self, turn: "_LLMTurn", rag_hits: list, rag_ms: float) -> None:
+        """
+        Arma el prompt del turno con los hits RAG ya recuperados, dentro del
+        presupuesto de tokens, y calcula su clave de cache.
+
+        La clave usa el modelo y la temperatura del proveedor principal: solo se
+        guardan respuestas de ese proveedor (ver `_is_cacheable`).
+        """
+        prompt = self.get_prompt_template(turn.tab)
+        turn.rag_ms = rag_ms
+        turn.inputs, turn.rag_context, turn.budget = self._build_chain_inputs(
+            prompt, turn.question, turn.context, turn.chat_history, rag_hits, turn.conversation_summary
+        )
+        turn.prompt_value = prompt.format_prompt(**turn.inputs)
+        turn.cache_key = build_cache_key(turn.prompt_value.to_string(), self.model_name, self.temperature)
+
+    def _retrieve(self, turn: "_LLMTurn") -> tuple:
+        """Fragmentos RAG del documento conceptual según la pregunta. Retorna (hits, rag_ms)."""
+        rag_start = perf_counter()
+        rag_hits = self.rag_manager.retrieve(turn.question, turn.tab)
+        return rag_hits, (perf_counter() - rag_start) * 1000
+
+    def _is_cacheable(self, provider) -> bool:
+        """Una respuesta de failover/hedging no se guarda bajo la clave del proveedor principal."""
+        return provider is self.provider_pool.primary
+
+    def _semantic_variant(self, tab: str, context_text: str) -> str:
+        """Huella de lo que arma el prompt salvo la pregunta: plantilla del tab, contexto del módulo y modelo."""
+        template = self.get_prompt_template(tab).template
+        return build_cache_key(f"{template}\x00{context_text}", self.model_name, self.temperature)
+
+    def _start_turn(
+        self,
+        question: str,
+        tab: str,
+        context,
+        chat_history: Optional[list],
+        session_id: Optional[str],
+        conversation_summary: Optional[str],
+        stream: bool = False,
+        async_: bool = False,
+    ) -> "_LLMTurn":
+        context_text = self._context_text(context)
+        return _LLMTurn(
+            question=question,
+            tab=tab,
+            context=context,
+            chat_history=chat_history,
+            session_id=session_id,
+            conversation_summary=conversation_summary,
+            stream=stream,
+            async_=async_,
+            context_text=context_text,
+            semantic_variant=self._semantic_variant(tab, context_text),
+        )
+
+    def _is_turn_skipped(self, turn: "_LLMTurn") -> bool:
+        if not self._is_invoke_skipped():
+            return False
+        kind = "stream" if turn.stream else "invoke"
+        logger.info(f"LLM {kind} omitido por SKIP_LLM_INVOKE para tab={turn.tab}, session={turn.session_id}")
+        return True
+
+    def _semantic_answer(self, turn: "_LLMTurn") -> Optional[str]:
+        """Respuesta del cache semántico (o None). Vectoriza la pregunta: en async, correr en un thread."""
+        hit = self.semantic_cache.lookup(
+            turn.tab, turn.question, turn.context_text, turn.semantic_variant, turn.has_history
+        )
+        if not hit:
+            return None
+        stats = self.semantic_cache.stats()
+        logger.info(
+            "⏱️ LLM timing | tab=%s session=%s%s semantic_cache=hit score=%.3f total_ms=%.1f "
+            "semantic_hits=%s semantic_misses=%s",
+            turn.tab,
+            turn.session_id,
+            turn.flags,
+            hit["score"],
+            (perf_counter() - turn.total_start) * 1000,
+            stats["hits"],
+            stats["misses"],
+        )
+        return hit["answer"]
+
+    def _cached_response(self, turn: "_LLMTurn") -> Optional[str]:
+        """Respuesta del cache exacto (o None); marca el inicio de la fase LLM. El backend postgres hace IO síncrono."""
+        turn.llm_start = perf_counter()
+        cached = self.response_cache.get(turn.cache_key)
+        turn.cache_status = "hit" if cached is not None else "miss"
+        return cached
+
+    def _finish_turn(self, turn: "_LLMTurn", provider=None) -> None:
+        """
+        Guarda la respuesta en los caches (solo si la generó el proveedor
+        principal) y registra la línea de tiempos. `provider` es None cuando la
+        respuesta salió del cache exacto. Hace IO síncrono: en async, correr en un thread.
+        """
+        answer = turn.answer
+        if provider is not None:
+            turn.provider_name = provider.name
+            if self._is_cacheable(provider):
+                self.response_cache.set(turn.cache_key, answer, provider.model_name)
+                self.semantic_cache.add(
+                    turn.tab, turn.question, answer, turn.context_text, turn.semantic_variant, turn.has_history
+                )
+        llm_ms = (perf_counter() - turn.llm_start) * 1000
+        total_ms = (perf_counter() - turn.total_start) * 1000
+
+        if not turn.stream:
+            logger.info(
+                f"Respuesta generada para tab={turn.tab}, session={turn.session_id}, "
+                f"con historial={bool(turn.chat_history)}, con datos={bool(turn.context)}, "
+                f"con rag={bool(turn.rag_context)} (rag_listo={self.rag_manager.is_ready})"
+            )
+        stream_fields = (
+            f" ttft_ms={turn.ttft_ms if turn.ttft_ms is not None else -1.0:.1f} answer_chars={turn.emitted_chars}"
+            if turn.stream
+            else ""
+        )
+        logger.info(
+            "⏱️ LLM timing | tab=%s session=%s provider=%s%s rag_ms=%.1f llm_ms=%.1f total_ms=%.1f "
+            "question_chars=%s context_chars=%s rag_chars=%s%s cache=%s cache_hits=%s cache_misses=%s "
+            "prompt_tokens=%s budget=%s",
+            turn.tab,
+            turn.session_id,
+            turn.provider_name,
+            turn.flags,
+            turn.rag_ms,
+            llm_ms,
+            total_ms,
+            len(turn.question or ""),
+            len(turn.inputs["project_context"] or ""),
+            len(turn.rag_context or ""),
+            stream_fields,
+            turn.cache_status,
+            self.response_cache.hits,
+            self.response_cache.misses,
+            turn.budget.total_tokens,
+            turn.budget.summary(),
+        )
+
+    def _log_turn_rejected(self, turn: "_LLMTurn", error: LLMRateLimited) -> None:
+        # Saturación: el llamador la propaga para que el endpoint responda 429 con Retry-After
+        logger.warning(
+            "⏱️ LLM timing rechazado | tab=%s session=%s%s total_ms=%.1f retry_after=%.1f",
+            turn.tab,
+            turn.session_id,
+            turn.flags,
+            (perf_counter() - turn.total_start) * 1000,
+            error.retry_after,
+        )
+
+    def _log_turn_failed(self, turn: "_LLMTurn", error: Exception) -> None:
+        logger.error(
+            "⏱️ LLM timing fallo | tab=%s session=%s%s total_ms=%.1f emitted_chars=%s",
+            turn.tab,
+            turn.session_id,
+            turn.flags,
+            (perf_counter() - turn.total_start) * 1000,
+            turn.emitted_chars,
+        )
+        kind = "LLM stream" if turn.stream else "LLM"
+        logger.error(f"Error en {kind} ({turn.tab}): {str(error)}", exc_info=True)
 
     def ask(
         self,
@@ -222,6 +587,7 @@ class LLMManager:
         context: str = "",
         chat_history: list = None,
         session_id: str = None,
+        conversation_summary: Optional[str] = None,
     ) -> str:
         """
         Invoca el LLM con la pregunta, contexto e historial de chat.
@@ -229,65 +595,253 @@ class LLMManager:
         Args:
             question: Pregunta del usuario
             tab: Componente MGA para usar template específico
-            context: Contexto adicional (datos del modelo)
+            context: Contexto adicional (datos del modelo: texto o lista de bloques)
             chat_history: Historial de mensajes anteriores de la conversación
             session_id: ID de sesión (opcional, para tracking)
+            conversation_summary: Resumen de los turnos que ya no entran literales (opcional)
             
         Returns:
             Respuesta del LLM
+
+        Raises:
+            LLMRateLimited: Si ningún proveedor admite la llamada dentro del plazo de cola
         """
-        total_start = perf_counter()
+        turn = self._start_turn(question, tab, context, chat_history, session_id, conversation_summary)
         try:
-            if self._is_invoke_skipped():
-                logger.info(f"LLM invoke omitido por SKIP_LLM_INVOKE para tab={tab}, session={session_id}")
-                return (
-                    "[DEBUG] Llamada al modelo omitida (SKIP_LLM_INVOKE=true). "
-                    "Desactiva esta variable para volver a consultar el LLM real."
-                )
+            if self._is_turn_skipped(turn):
+                return _SKIPPED_INVOKE_MESSAGE
+            answer = self._semantic_answer(turn)
+            if answer is not None:
+                return answer
 
-            # Obtener template
-            prompt = self.get_prompt_template(tab)
+            self._prepare_turn(turn, *self._retrieve(turn))
+            response = self._cached_response(turn)
+            provider = None
+            if response is None:
+                response, provider = self.provider_pool.invoke(turn.prompt_value, turn.budget.total_tokens)
+            turn.emit(response)
+            self._finish_turn(turn, provider)
+            return response
+        except LLMRateLimited as e:
+            self._log_turn_rejected(turn, e)
+            raise
+        except Exception as e:
+            self._log_turn_failed(turn, e)
+            return _ERROR_MESSAGE
 
-            # Recuperar contexto RAG del documento conceptual según la pregunta
-            rag_start = perf_counter()
-            rag_context = self.rag_manager.get_relevant_context(question)
-            rag_ms = (perf_counter() - rag_start) * 1000
-            merged_context = self._merge_project_and_rag_context(context, rag_context)
-            
-            # Crear cadena LLM
-            chain = prompt | self.model | StrOutputParser()
-            llm_start = perf_counter()
-            response = chain.invoke({
-                "project_context": merged_context,
-                "chat_history": self._build_chat_context(chat_history) if chat_history else "",
-                "question": question,
-            })
-            llm_ms = (perf_counter() - llm_start) * 1000
-            total_ms = (perf_counter() - total_start) * 1000
-            
-            logger.info(
-                f"Respuesta generada para tab={tab}, session={session_id}, "
-                f"con historial={bool(chat_history)}, con datos={bool(context)}, con rag={bool(rag_context)}"
-            )
-            logger.info(
-                "⏱️ LLM timing | tab=%s session=%s rag_ms=%.1f llm_ms=%.1f total_ms=%.1f "
-                "question_chars=%s context_chars=%s rag_chars=%s",
-                tab,
-                session_id,
-                rag_ms,
-                llm_ms,
-                total_ms,
-                len(question or ""),
-                len(merged_context or ""),
-                len(rag_context or ""),
-            )
+    def stream(
+        self,
+        question: str,
+        tab: str = "general",
+        context: str = "",
+        chat_history: list = None,
+        session_id: str = None,
+        conversation_summary: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Variante de `ask` que emite los tokens a medida que el proveedor los genera.
+
+        Usa el stream del pool de proveedores: si un proveedor falla antes del
+        primer token se pasa al siguiente, y si fallan todos se emite el mensaje
+        de error genérico. Si falla a mitad de la respuesta se lanza
+        `LLMStreamInterrupted`: lo emitido hasta ahí no es una respuesta completa.
+
+        Args:
+            question: Pregunta del usuario
+            tab: Componente MGA para usar template específico
+            context: Contexto adicional (datos del modelo: texto o lista de bloques)
+            chat_history: Historial de mensajes anteriores de la conversación
+            session_id: ID de sesión (opcional, para tracking)
+            conversation_summary: Resumen de los turnos que ya no entran literales (opcional)
+
+        Yields:
+            Fragmentos de texto de la respuesta
+
+        Raises:
+            LLMRateLimited: Si ningún proveedor admite la llamada dentro del plazo de cola
+            LLMStreamInterrupted: Si el proveedor falla después de emitir parte de la respuesta
+        """
+        turn = self._start_turn(question, tab, context, chat_history, session_id, conversation_summary, stream=True)
+        try:
+            if self._is_turn_skipped(turn):
+                yield _SKIPPED_INVOKE_MESSAGE
+                return
+            answer = self._semantic_answer(turn)
+            if answer is not None:
+                yield answer
+                return
+
+            self._prepare_turn(turn, *self._retrieve(turn))
+            cached = self._cached_response(turn)
+            provider = None
+            if cached is not None:
+                turn.emit(cached)
+                yield cached
+            else:
+                tokens = self.provider_pool.stream(turn.prompt_value, turn.budget.total_tokens)
+                for token in tokens:
+                    if token:
+                        turn.emit(token)
+                        yield token
+                provider = tokens.provider
+            self._finish_turn(turn, provider)
+        except LLMRateLimited as e:
+            self._log_turn_rejected(turn, e)
+            raise
+        except Exception as e:
+            self._log_turn_failed(turn, e)
+            if turn.emitted_chars > 0:
+                raise LLMStreamInterrupted(str(e), turn.emitted_chars) from e
+            yield _ERROR_MESSAGE
+
+    async def aask(
+        self,
+        question: str,
+        tab: str = "general",
+        context: str = "",
+        chat_history: list = None,
+        session_id: str = None,
+        conversation_summary: Optional[str] = None,
+    ) -> str:
+        """
+        Versión async de `ask`: usa `ainvoke` del pool (con hedging) y no bloquea el event loop.
+
+        La vectorización de la pregunta, el retrieval RAG y los caches hacen
+        CPU/IO síncrono, por lo que corren en un executor.
+
+        Args:
+            question: Pregunta del usuario
+            tab: Componente MGA para usar template específico
+            context: Contexto adicional (datos del modelo: texto o lista de bloques)
+            chat_history: Historial de mensajes anteriores de la conversación
+            session_id: ID de sesión (opcional, para tracking)
+            conversation_summary: Resumen de los turnos que ya no entran literales (opcional)
+
+        Returns:
+            Respuesta del LLM
+
+        Raises:
+            LLMRateLimited: Si ningún proveedor admite la llamada dentro del plazo de cola
+        """
+        turn = self._start_turn(question, tab, context, chat_history, session_id, conversation_summary, async_=True)
+        try:
+            if self._is_turn_skipped(turn):
+                return _SKIPPED_INVOKE_MESSAGE
+            answer = await asyncio.to_thread(self._semantic_answer, turn)
+            if answer is not None:
+                return answer
+
+            self._prepare_turn(turn, *await asyncio.to_thread(self._retrieve, turn))
+            response = await asyncio.to_thread(self._cached_response, turn)
+            provider = None
+            if response is None:
+                response, provider = await self.provider_pool.ainvoke(turn.prompt_value, turn.budget.total_tokens)
+            turn.emit(response)
+            await asyncio.to_thread(self._finish_turn, turn, provider)
             return response
-            
+        except LLMRateLimited as e:
+            self._log_turn_rejected(turn, e)
+            raise
+        except Exception as e:
+            self._log_turn_failed(turn, e)
+            return _ERROR_MESSAGE
+
+    async def astream(
+        self,
+        question: str,
+        tab: str = "general",
+        context: str = "",
+        chat_history: list = None,
+        session_id: str = None,
+        conversation_summary: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Versión async de `stream`: emite tokens con `astream` del pool (con hedging).
+
+        Yields:
+            Fragmentos de texto de la respuesta
+
+        Raises:
+            LLMRateLimited: Si ningún proveedor admite la llamada dentro del plazo de cola
+            LLMStreamInterrupted: Si el proveedor falla después de emitir parte de la respuesta
+        """
+        turn = self._start_turn(
+            question, tab, context, chat_history, session_id, conversation_summary, stream=True, async_=True
+        )
+        try:
+            if self._is_turn_skipped(turn):
+                yield _SKIPPED_INVOKE_MESSAGE
+                return
+            answer = await asyncio.to_thread(self._semantic_answer, turn)
+            if answer is not None:
+                yield answer
+                return
+
+            self._prepare_turn(turn, *await asyncio.to_thread(self._retrieve, turn))
+            cached = await asyncio.to_thread(self._cached_response, turn)
+            provider = None
+            if cached is not None:
+                turn.emit(cached)
+                yield cached
+            else:
+                tokens = self.provider_pool.astream(turn.prompt_value, turn.budget.total_tokens)
+                async for token in tokens:
+                    if token:
+                        turn.emit(token)
+                        yield token
+                provider = tokens.provider
+            await asyncio.to_thread(self._finish_turn, turn, provider)
+        except LLMRateLimited as e:
+            self._log_turn_rejected(turn, e)
+            raise
+        except Exception as e:
+            self._log_turn_failed(turn, e)
+            if turn.emitted_chars > 0:
+                raise LLMStreamInterrupted(str(e), turn.emitted_chars) from e
+            yield _ERROR_MESSAGE
+
+    async def asummarize(self, previous_summary: Optional[str], messages: list) -> Optional[str]:
+        """
+        Incorpora mensajes al resumen de la sesión con el modelo económico.
+
+        Usa la misma cuenta que el proveedor principal, así que pasa por su
+        limitador con una espera corta (`LLM_SUMMARY_QUEUE_MAX_WAIT_SECONDS`): si
+        no hay cupo se omite y los mensajes se resumen en un turno posterior.
+
+        Args:
+            previous_summary: Resumen vigente (o None)
+            messages: Mensajes a incorporar, en orden cronológico
+
+        Returns:
+            Resumen actualizado, o None si no se pudo generar o no hubo cupo
+        """
+        if not messages or self._is_invoke_skipped():
+            return None
+
+        prompt_value = _SUMMARY_PROMPT.format_prompt(
+            previous_summary=previous_summary or "(sin resumen previo)",
+            messages="\n".join(self._format_message(msg) for msg in messages),
+            max_words=self.summary_max_words,
+        )
+        limiter = self.provider_pool.primary.limiter
+        try:
+            await limiter.aacquire(
+                self.prompt_budgeter.counter.count(prompt_value.to_string()),
+                max_wait=self.summary_max_wait_seconds,
+            )
+        except LLMRateLimited as e:
+            logger.info(f"⏭️ Resumen omitido: proveedor {limiter.name} sin cupo (reintentar en {e.retry_after:.1f}s)")
+            return None
+        try:
+            summary = (await self._summary_chain.ainvoke(prompt_value)).strip()
         except Exception as e:
-            total_ms = (perf_counter() - total_start) * 1000
-            logger.error("⏱️ LLM timing fallo | tab=%s session=%s total_ms=%.1f", tab, session_id, total_ms)
-            logger.error(f"Error en LLM ({tab}): {str(e)}", exc_info=True)
-            return "Lo siento, ocurrió un error al procesar tu pregunta. Intenta de nuevo."
+            retry_after = retry_after_from_error(e)
+            if retry_after is not None:
+                limiter.pause(retry_after)
+            raise
+        finally:
+            limiter.release()
+        return summary or None
 
     def validate_configuration(self) -> bool:
         """Valida que el LLM esté correctamente configurado."""
@@ -0,0 +1,193 @@
+"""
+Presupuesto de tokens para el armado del prompt.
+
+El prompt se compone de secciones variables (datos del proyecto, fragmentos RAG,
+historial) además de las instrucciones y la pregunta, que siempre se envían.
+El presupuesto total por modelo se reparte entre las secciones según su peso;
+lo que una sección no usa pasa a las siguientes en orden de prioridad.
+
+Cada sección es una lista de bloques completos (un registro, un chunk, un
+mensaje): cuando no caben se descartan bloques enteros desde el final, nunca se
+corta un texto a la mitad.
+
+El conteo usa `tiktoken` (en `requirements.txt`; `cl100k_base` aproxima bien
+los tokenizadores de Llama y Gemini). Si no está instalado o no puede cargar la
+codificación (la descarga la primera vez), se usa una heurística local
+(palabras y signos, ~4 caracteres por token en palabras largas).
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto de tokens del prompt (entrada) por modelo
+_DEFAULT_MODEL_BUDGETS = {
+    "llama-3.1-8b-instant": 6000,
+    "gemini-2.5-flash": 12000,
+}
+_FALLBACK_BUDGET = 6000
+_DEFAULT_SHARES = {"project": 0.45, "rag": 0.35, "history": 0.20}
+
+_HEURISTIC_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+class TokenCounter:
+    """Cuenta tokens con tiktoken (si está disponible) o con una heurística local."""
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self._encoding = None
+        self.backend = "heuristic"
+        try:
+            import tiktoken
+
+            self._encoding = tiktoken.get_encoding(encoding_name)
+            self.backend = "tiktoken"
+        except Exception as e:
+            logger.info(f"ℹ️ tiktoken no disponible ({type(e).__name__}); usando conteo heurístico de tokens")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        # Palabras cortas y signos ~1 token; las largas se parten en ~4 caracteres por token.
+        return sum(1 if len(piece) <= 4 else (len(piece) + 3) // 4 for piece in _HEURISTIC_PATTERN.findall(text))
+
+
+@dataclass
+class BudgetSection:
+    """
+    Sección variable del prompt: bloques en orden de importancia.
+
+    Con `skippable` los bloques son independientes (p. ej. hits RAG) y uno que no
+    cabe se salta; sin él se toma un prefijo, porque un bloque puede depender del
+    anterior (encabezado de un registro, turno previo de la conversación).
+    """
+
+    name: str
+    blocks: Sequence[str]
+    header: str = ""
+    footer: str = ""
+    skippable: bool = False
+
+
+@dataclass
+class BudgetResult:
+    """Bloques seleccionados por sección y su costo en tokens."""
+
+    budget: int
+    fixed_tokens: int
+    selected: Dict[str, List[str]] = field(default_factory=dict)
+    dropped: Dict[str, int] = field(default_factory=dict)
+    tokens: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.fixed_tokens + sum(self.tokens.values())
+
+    def summary(self) -> str:
+        """Resumen compacto para las líneas de tiempos."""
+        return ",".join(
+            f"{name}:{self.tokens.get(name, 0)}t/-{self.dropped.get(name, 0)}" for name in self.selected
+        )
+
+
+class PromptBudgeter:
+    """Reparte un presupuesto de tokens entre las secciones del prompt."""
+
+    def __init__(self, counter: TokenCounter, budget_tokens: int, shares: Optional[Dict[str, float]] = None):
+        self.counter = counter
+        self.budget_tokens = budget_tokens
+        shares = shares or _DEFAULT_SHARES
+        total_share = sum(shares.values()) or 1.0
+        self.shares = {name: value / total_share for name, value in shares.items()}
+
+    @classmethod
+    def from_env(cls, model_name: str) -> "PromptBudgeter":
+        budget = os.getenv("LLM_PROMPT_TOKEN_BUDGET")
+        budget_tokens = int(budget) if budget else _DEFAULT_MODEL_BUDGETS.get(model_name, _FALLBACK_BUDGET)
+        return cls(
+            counter=TokenCounter(),
+            budget_tokens=max(budget_tokens, 500),
+            shares=_parse_shares(os.getenv("LLM_PROMPT_BUDGET_SHARES", "")),
+        )
+
+    def fit(self, fixed_text: str, sections: List[BudgetSection]) -> BudgetResult:
+        """
+        Selecciona, por sección, los bloques que caben en su cupo en orden de importancia.
+
+        Se corta en el primer bloque que no cabe, salvo en secciones `skippable`,
+        donde ese bloque se descarta y se sigue con los siguientes.
+
+        Args:
+            fixed_text: Texto que siempre se envía (instrucciones + pregunta)
+            sections: Secciones en orden de prioridad
+
+        Returns:
+            BudgetResult con los bloques elegidos
+        """
+        fixed_tokens = self.counter.count(fixed_text)
+        available = max(self.budget_tokens - fixed_tokens, 0)
+        result = BudgetResult(budget=self.budget_tokens, fixed_tokens=fixed_tokens)
+
+        costs = {}
+        demand = {}
+        for section in sections:
+            block_costs = [self.counter.count(block) + 1 for block in section.blocks]
+            overhead = self.counter.count(section.header) + self.counter.count(section.footer) if block_costs else 0
+            costs[section.name] = (overhead, block_costs)
+            demand[section.name] = overhead + sum(block_costs)
+
+        # Cupo inicial por peso; el sobrante de secciones pequeñas pasa a las siguientes por prioridad.
+        allowance = {
+            section.name: min(int(available * self.shares.get(section.name, 0.0)), demand[section.name])
+            for section in sections
+        }
+        surplus = available - sum(allowance.values())
+        for section in sections:
+            extra = min(surplus, demand[section.name] - allowance[section.name])
+            allowance[section.name] += extra
+            surplus -= extra
+
+        for section in sections:
+            overhead, block_costs = costs[section.name]
+            used = overhead
+            kept: List[str] = []
+            for block, cost in zip(section.blocks, block_costs):
+                if used + cost > allowance[section.name]:
+                    if section.skippable:
+                        continue
+                    break
+                kept.append(block)
+                used += cost
+            result.selected[section.name] = kept
+            result.dropped[section.name] = len(section.blocks) - len(kept)
+            result.tokens[section.name] = used if kept else 0
+        return result
+
+
+def _parse_shares(raw: str) -> Dict[str, float]:
+    """Lee pesos tipo 'project=0.5,rag=0.3,history=0.2' (valores ausentes usan el default)."""
+    shares = dict(_DEFAULT_SHARES)
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        if not value:
+            continue
+        try:
+            shares[name.strip()] = max(float(value), 0.0)
+        except ValueError:
+            logger.warning(f"⚠️ Peso de presupuesto inválido ignorado: {item}")
+    return shares
+
+
+def split_context_blocks(context) -> List[str]:
+    """Normaliza el contexto del módulo a bloques (lista ya armada o texto separado por líneas en blanco)."""
+    if not context:
+        return []
+    if isinstance(context, str):
+        return [block for block in re.split(r"\n\s*\n", context.strip()) if block.strip()]
+    return [block for block in context if block]
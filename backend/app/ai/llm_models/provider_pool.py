@@ -0,0 +1,557 @@
+"""
+Pool de proveedores LLM con failover y hedging.
+
+`LLMManager` ya no queda atado a un único proveedor: el pool mantiene los
+clientes configurados (Groq, Gemini, Ollama local), los ordena por salud y
+latencia, y si uno falla o no responde a tiempo pasa al siguiente. Con hedging
+activo, si el primero no entrega su primer token (o su respuesta, en llamadas
+sin stream) tras su p95 reciente, se lanza en paralelo el siguiente proveedor
+y gana el que responda primero; la latencia de cola queda acotada por el
+proveedor sano más rápido.
+
+Variables de entorno:
+- `LLM_PROVIDERS=groq,gemini,ollama`: proveedores en orden de preferencia
+  (por defecto solo `LLM_PROVIDER`). Los que no tienen credenciales se omiten.
+- `LLM_ROUTING=priority|latency`: orden fijo o por latencia mediana reciente.
+- `LLM_PROVIDER_TIMEOUT_SECONDS=30`: plazo de cada intento hasta el primer token.
+- `LLM_PROVIDER_MAX_FAILURES=3` / `LLM_PROVIDER_COOLDOWN_SECONDS=30`: fallos
+  seguidos que ponen a un proveedor en cooldown (pasa al final del orden).
+- `LLM_HEDGE_ENABLED=false`, `LLM_HEDGE_MIN_DELAY_MS=300`,
+  `LLM_HEDGE_DEFAULT_DELAY_MS=2000` (retraso mientras no hay muestras de p95).
+- `GEMINI_MODEL`, `OLLAMA_MODEL`, `OLLAMA_BASE_URL`.
+
+El hedging y el plazo por intento aplican a las rutas async (`ainvoke`,
+`astream`), que son las del chat; las rutas síncronas solo hacen failover.
+
+Cada intento pasa antes por el `ProviderLimiter` del proveedor (ver
+`rate_limiter.py`). Un proveedor que rechaza por cola llena o plazo se salta sin
+contar como fallo; si todos rechazan se lanza `LLMRateLimited`.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.output_parsers import StrOutputParser
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_groq import ChatGroq
+
+from app.ai.llm_models.rate_limiter import LLMRateLimited, ProviderLimiter, RateLimitConfig, retry_after_from_error
+
+logger = logging.getLogger(__name__)
+
+# Muestras de latencia por proveedor usadas para p50/p95
+_LATENCY_WINDOW = 100
+
+
+class AllProvidersFailed(RuntimeError):
+    """Ningún proveedor del pool pudo responder."""
+
+
+@dataclass
+class LLMProvider:
+    """Cliente de un proveedor con sus métricas de salud y latencia."""
+
+    name: str
+    model: Any
+    model_name: str
+    temperature: Optional[float] = None
+    limiter: Optional[ProviderLimiter] = None
+    # Latencia hasta el primer token (stream) y de la respuesta completa (invoke)
+    latencies_ms: Dict[str, Deque[float]] = field(
+        default_factory=lambda: {"stream": deque(maxlen=_LATENCY_WINDOW), "invoke": deque(maxlen=_LATENCY_WINDOW)}
+    )
+    requests: int = 0
+    successes: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0
+    last_error: Optional[str] = None
+    _chain: Any = field(default=None, init=False, repr=False)
+    _chain_model: Any = field(default=None, init=False, repr=False)
+
+    @property
+    def chain(self):
+        """`model | StrOutputParser()` armado una vez (se rehace solo si se reemplaza el modelo)."""
+        if self._chain is None or self._chain_model is not self.model:
+            self._chain, self._chain_model = self.model | StrOutputParser(), self.model
+        return self._chain
+
+    def is_healthy(self) -> bool:
+        return monotonic() >= self.cooldown_until
+
+    def latency_percentile(self, kind: str, percentile: float) -> Optional[float]:
+        samples = self.latencies_ms[kind]
+        return float(np.percentile(samples, percentile)) if samples else None
+
+    def stats(self) -> dict:
+        def _rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 1) if value is not None else None
+
+        return {
+            "name": self.name,
+            "model": self.model_name,
+            "healthy": self.is_healthy(),
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "ttft_p50_ms": _rounded(self.latency_percentile("stream", 50)),
+            "ttft_p95_ms": _rounded(self.latency_percentile("stream", 95)),
+            "latency_p50_ms": _rounded(self.latency_percentile("invoke", 50)),
+            "latency_p95_ms": _rounded(self.latency_percentile("invoke", 95)),
+            "last_error": self.last_error,
+            "limiter": self.limiter.stats() if self.limiter is not None else None,
+        }
+
+
+def _build_groq(timeout: float, max_retries: int) -> LLMProvider:
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY no configurada en .env")
+    model_name = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+    model = ChatGroq(
+        model_name=model_name,
+        groq_api_key=api_key,
+        temperature=0.7,
+        request_timeout=timeout,
+        max_retries=max_retries,
+    )
+    return LLMProvider("groq", model, model_name, temperature=0.7)
+
+
+def _build_gemini(timeout: float, max_retries: int) -> LLMProvider:
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY no configurada en .env")
+    model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    model = ChatGoogleGenerativeAI(
+        model=model_name,
+        google_api_key=api_key,
+        convert_system_message_to_human=True,
+        timeout=timeout,
+        max_retries=max_retries,
+    )
+    return LLMProvider("gemini", model, model_name)
+
+
+def _build_ollama(timeout: float, max_retries: int) -> LLMProvider:
+    try:
+        from app.ai.llm_models.ollama_llm import OllamaLLM
+    except ImportError as exc:
+        raise ValueError("El proveedor ollama requiere el paquete 'langchain-ollama'") from exc
+
+    client = OllamaLLM(
+        model_name=os.getenv("OLLAMA_MODEL", "mistral"),
+        base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+    )
+    if not client.is_available:
+        raise ValueError(f"Ollama no está disponible en {client.base_url}")
+    return LLMProvider("ollama", client.get_model(), client.model_name, temperature=0.7)
+
+
+_PROVIDER_FACTORIES: Dict[str, Callable[[float, int], LLMProvider]] = {
+    "groq": _build_groq,
+    "gemini": _build_gemini,
+    "ollama": _build_ollama,
+}
+
+
+class ProviderPool:
+    """Proveedores LLM ordenados por salud/latencia, con failover y hedging."""
+
+    def __init__(
+        self,
+        providers: List[LLMProvider],
+        routing: str = "priority",
+        timeout_seconds: float = 30.0,
+        max_failures: int = 3,
+        cooldown_seconds: float = 30.0,
+        hedge_enabled: bool = False,
+        hedge_min_delay_ms: float = 300.0,
+        hedge_default_delay_ms: float = 2000.0,
+    ):
+        if not providers:
+            raise ValueError("El pool de proveedores LLM está vacío")
+        self.providers = providers
+        for provider in providers:
+            if provider.limiter is None:
+                provider.limiter = ProviderLimiter(provider.name)
+        self.routing = routing if routing in {"priority", "latency"} else "priority"
+        self.timeout_seconds = timeout_seconds
+        self.max_failures = max(max_failures, 1)
+        self.cooldown_seconds = cooldown_seconds
+        self.hedge_enabled = hedge_enabled and len(providers) > 1
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.hedge_default_delay_ms = hedge_default_delay_ms
+        self._lock = Lock()
+
+    @classmethod
+    def from_env(cls, default_provider: str) -> "ProviderPool":
+        names = [
+            name.strip().lower()
+            for name in os.getenv("LLM_PROVIDERS", default_provider).split(",")
+            if name.strip()
+        ]
+        names = list(dict.fromkeys(names)) or [default_provider]
+        timeout = max(float(os.getenv("LLM_PROVIDER_TIMEOUT_SECONDS", "30")), 1.0)
+        # Con varios proveedores se cambia de proveedor en lugar de reintentar el mismo
+        max_retries = 0 if len(names) > 1 else 2
+
+        providers: List[LLMProvider] = []
+        errors: List[Exception] = []
+        for name in names:
+            factory = _PROVIDER_FACTORIES.get(name)
+            if factory is None:
+                raise ValueError(f"LLM Provider no soportado: {name}")
+            try:
+                provider = factory(timeout, max_retries)
+            except ValueError as exc:
+                logger.warning(f"⚠️ Proveedor LLM {name} omitido: {exc}")
+                errors.append(exc)
+                continue
+            provider.limiter = ProviderLimiter(name, RateLimitConfig.from_env(name))
+            logger.info(f"Inicializando {name} LLM con modelo: {provider.model_name}")
+            providers.append(provider)
+        if not providers:
+            raise errors[0]
+
+        return cls(
+            providers,
+            routing=os.getenv("LLM_ROUTING", "priority").strip().lower(),
+            timeout_seconds=timeout,
+            max_failures=int(os.getenv("LLM_PROVIDER_MAX_FAILURES", "3")),
+            cooldown_seconds=max(float(os.getenv("LLM_PROVIDER_COOLDOWN_SECONDS", "30")), 0.0),
+            hedge_enabled=os.getenv("LLM_HEDGE_ENABLED", "false").strip().lower() in {"1", "true", "yes", "on"},
+            hedge_min_delay_ms=max(float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "300")), 0.0),
+            hedge_default_delay_ms=max(float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_MS", "2000")), 0.0),
+        )
+
+    @property
+    def primary(self) -> LLMProvider:
+        return self.providers[0]
+
+    def ordered(self, kind: str = "stream") -> List[LLMProvider]:
+        """Orden de intento: sanos primero (por prioridad o latencia), luego los que están en cooldown."""
+        healthy = [provider for provider in self.providers if provider.is_healthy()]
+        cooling = sorted(
+            (provider for provider in self.providers if not provider.is_healthy()),
+            key=lambda provider: provider.cooldown_until,
+        )
+        if self.routing == "latency":
+            # Sin muestras cuenta como 0: un proveedor nuevo se prueba antes de descartarlo
+            healthy.sort(key=lambda provider: provider.latency_percentile(kind, 50) or 0.0)
+        return healthy + cooling
+
+    def _record_success(self, provider: LLMProvider, kind: str, latency_ms: float) -> None:
+        with self._lock:
+            provider.successes += 1
+            provider.consecutive_failures = 0
+            provider.cooldown_until = 0.0
+            provider.latencies_ms[kind].append(latency_ms)
+
+    def _record_failure(self, provider: LLMProvider, error: BaseException) -> None:
+        timed_out = isinstance(error, asyncio.TimeoutError)
+        with self._lock:
+            provider.failures += 1
+            provider.timeouts += int(timed_out)
+            provider.consecutive_failures += 1
+            provider.last_error = "timeout" if timed_out else f"{type(error).__name__}: {error}"
+            if provider.consecutive_failures >= self.max_failures:
+                provider.cooldown_until = monotonic() + self.cooldown_seconds
+        retry_after = retry_after_from_error(error)
+        if retry_after is not None:
+            provider.limiter.pause(retry_after)
+        logger.warning(
+            "⚠️ Proveedor LLM %s falló (%s, fallos_seguidos=%s)%s",
+            provider.name,
+            provider.last_error,
+            provider.consecutive_failures,
+            f"; en cooldown {self.cooldown_seconds:.0f}s" if not provider.is_healthy() else "",
+        )
+
+    def _hedge_delay(self, provider: LLMProvider, kind: str) -> float:
+        """Segundos a esperar antes de lanzar el siguiente proveedor: p95 reciente del actual."""
+        p95 = provider.latency_percentile(kind, 95)
+        delay_ms = p95 if p95 is not None else self.hedge_default_delay_ms
+        return max(delay_ms, self.hedge_min_delay_ms) / 1000
+
+    async def _admitted(
+        self,
+        provider: LLMProvider,
+        attempt: Callable[[LLMProvider], Awaitable[Any]],
+        tokens: int,
+        hedge: bool,
+        hold: bool,
+    ) -> Any:
+        """
+        Espera cupo en el limitador del proveedor y ejecuta el intento con su plazo.
+
+        Con `hold` el cupo queda tomado al retornar (lo libera quien consume el
+        resultado, p. ej. el stream al cerrarse).
+        """
+        # Un hedge solo sirve si el proveedor puede atender ya: no hace cola
+        await provider.limiter.aacquire(tokens, max_wait=0.0 if hedge else None)
+        try:
+            result = await asyncio.wait_for(attempt(provider), self.timeout_seconds)
+        except BaseException:
+            provider.limiter.release()
+            raise
+        if not hold:
+            provider.limiter.release()
+        return result
+
+    async def _race(
+        self,
+        kind: str,
+        attempt: Callable[[LLMProvider], Awaitable[Any]],
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+        tokens: int = 0,
+    ) -> Tuple[Any, LLMProvider]:
+        """
+        Ejecuta `attempt` sobre los proveedores en orden hasta obtener un resultado.
+
+        Un intento que falla o excede `timeout_seconds` pasa al siguiente
+        proveedor; con hedging, si el único intento en curso supera su retraso de
+        hedge se lanza otro en paralelo. El primero que termina bien gana y el
+        resto se cancela (`discard` libera resultados que ya no se usarán; si se
+        pasa, el cupo del limitador del ganador lo libera quien consume el resultado).
+        """
+        queue = self.ordered(kind)
+        running: Dict[asyncio.Task, Tuple[LLMProvider, float, bool]] = {}
+        errors: List[str] = []
+        rejections: List[float] = []
+
+        def launch(hedge: bool = False) -> LLMProvider:
+            provider = queue.pop(0)
+            with self._lock:
+                provider.requests += 1
+                provider.hedges += int(hedge)
+            task = asyncio.ensure_future(self._admitted(provider, attempt, tokens, hedge, hold=discard is not None))
+            running[task] = (provider, perf_counter(), hedge)
+            return provider
+
+        launch()
+        try:
+            while running or queue:
+                if not running:
+                    launch()
+                wait_timeout = None
+                if self.hedge_enabled and queue and len(running) == 1:
+                    current, started, _ = next(iter(running.values()))
+                    wait_timeout = max(self._hedge_delay(current, kind) - (perf_counter() - started), 0.0)
+
+                done, _ = await asyncio.wait(list(running), timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    current, started, _ = next(iter(running.values()))
+                    hedge = launch(hedge=True)
+                    logger.info(
+                        "🔀 LLM hedge | %s sin respuesta tras %.0f ms; se lanza %s",
+                        current.name,
+                        (perf_counter() - started) * 1000,
+                        hedge.name,
+                    )
+                    continue
+
+                winner: Optional[Tuple[Any, LLMProvider]] = None
+                for task in done:
+                    provider, started, hedged = running.pop(task)
+                    error = task.exception()
+                    if isinstance(error, LLMRateLimited):
+                        rejections.append(error.retry_after)
+                        errors.append(str(error))
+                        continue
+                    if error is not None:
+                        self._record_failure(provider, error)
+                        errors.append(f"{provider.name}: {provider.last_error}")
+                        continue
+                    if winner is not None:
+                        if discard is not None:
+                            await discard(task.result())
+                        continue
+                    self._record_success(provider, kind, (perf_counter() - started) * 1000)
+                    if hedged:
+                        with self._lock:
+                            provider.hedge_wins += 1
+                    winner = (task.result(), provider)
+                if winner is not None:
+                    return winner
+            if rejections:
+                raise LLMRateLimited("; ".join(errors), min(rejections))
+            raise AllProvidersFailed("; ".join(errors) or "sin proveedores LLM")
+        finally:
+            for task in running:
+                task.cancel()
+            if running and discard is not None:
+                # Un perdedor pudo terminar justo antes de cancelarse: liberar su resultado
+                for outcome in await asyncio.gather(*running, return_exceptions=True):
+                    if not isinstance(outcome, BaseException):
+                        await discard(outcome)
+
+    async def ainvoke(self, prompt_value, tokens: int = 0) -> Tuple[str, LLMProvider]:
+        """Respuesta completa del primer proveedor que responda (`tokens`: tokens estimados del prompt)."""
+
+        async def attempt(provider: LLMProvider) -> str:
+            return await provider.chain.ainvoke(prompt_value)
+
+        return await self._race("invoke", attempt, tokens=tokens)
+
+    def astream(self, prompt_value, tokens: int = 0) -> "AsyncProviderStream":
+        """Stream de tokens; el proveedor se elige por quién entrega primero su primer token."""
+        return AsyncProviderStream(self, prompt_value, tokens)
+
+    def invoke(self, prompt_value, tokens: int = 0) -> Tuple[str, LLMProvider]:
+        """Versión síncrona de `ainvoke` (solo failover, sin hedging)."""
+        errors: List[str] = []
+        rejections: List[float] = []
+        for provider in self.ordered("invoke"):
+            with self._lock:
+                provider.requests += 1
+            try:
+                provider.limiter.acquire(tokens)
+            except LLMRateLimited as exc:
+                rejections.append(exc.retry_after)
+                errors.append(str(exc))
+                continue
+            start = perf_counter()
+            try:
+                response = provider.chain.invoke(prompt_value)
+            except Exception as exc:
+                self._record_failure(provider, exc)
+                errors.append(f"{provider.name}: {provider.last_error}")
+                continue
+            finally:
+                provider.limiter.release()
+            self._record_success(provider, "invoke", (perf_counter() - start) * 1000)
+            return response, provider
+        if rejections:
+            raise LLMRateLimited("; ".join(errors), min(rejections))
+        raise AllProvidersFailed("; ".join(errors))
+
+    def stream(self, prompt_value, tokens: int = 0) -> "ProviderStream":
+        """Versión síncrona de `astream` (solo failover antes del primer token)."""
+        return ProviderStream(self, prompt_value, tokens)
+
+    def admission_retry_after(self) -> Optional[float]:
+        """
+        Chequeo previo sin reservar cupo: None si algún proveedor acepta llamadas,
+        si no los segundos estimados hasta que alguno las acepte.
+        """
+        estimates = []
+        for provider in self.providers:
+            accepts, estimate = provider.limiter.admission_estimate()
+            if accepts:
+                return None
+            estimates.append(estimate)
+        return min(estimates)
+
+    def status(self) -> dict:
+        return {
+            "routing": self.routing,
+            "hedging": self.hedge_enabled,
+            "timeout_seconds": self.timeout_seconds,
+            "providers": [provider.stats() for provider in self.providers],
+        }
+
+
+class AsyncProviderStream:
+    """
+    Iterable async de tokens servido por el pool.
+
+    Tras el primer token, `provider` indica qué proveedor respondió. Un fallo a
+    mitad de la respuesta se propaga: no se cambia de proveedor con texto ya emitido.
+    """
+
+    def __init__(self, pool: ProviderPool, prompt_value, tokens: int = 0):
+        self.pool = pool
+        self.prompt_value = prompt_value
+        self.tokens = tokens
+        self.provider: Optional[LLMProvider] = None
+
+    async def _first_token(self, provider: LLMProvider) -> Tuple[AsyncIterator[str], str, LLMProvider]:
+        iterator = provider.chain.astream(self.prompt_value).__aiter__()
+        try:
+            async for token in iterator:
+                if token:
+                    return iterator, token, provider
+            return iterator, "", provider
+        except BaseException:
+            await iterator.aclose()
+            raise
+
+    @staticmethod
+    async def _discard(result: Tuple[AsyncIterator[str], str, LLMProvider]) -> None:
+        iterator, _, provider = result
+        try:
+            await iterator.aclose()
+        finally:
+            provider.limiter.release()
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._run()
+
+    async def _run(self) -> AsyncIterator[str]:
+        # El cupo del limitador se mantiene hasta que termina (o se abandona) el stream
+        result, self.provider = await self.pool._race("stream", self._first_token, self._discard, self.tokens)
+        iterator, first_token, _ = result
+        try:
+            if first_token:
+                yield first_token
+            async for token in iterator:
+                yield token
+        finally:
+            await self._discard(result)
+
+
+class ProviderStream:
+    """Iterable síncrono de tokens con failover antes del primer token (ver `AsyncProviderStream`)."""
+
+    def __init__(self, pool: ProviderPool, prompt_value, tokens: int = 0):
+        self.pool = pool
+        self.prompt_value = prompt_value
+        self.tokens = tokens
+        self.provider: Optional[LLMProvider] = None
+
+    def __iter__(self) -> Iterator[str]:
+        errors: List[str] = []
+        rejections: List[float] = []
+        for provider in self.pool.ordered("stream"):
+            with self.pool._lock:
+                provider.requests += 1
+            try:
+                provider.limiter.acquire(self.tokens)
+            except LLMRateLimited as exc:
+                rejections.append(exc.retry_after)
+                errors.append(str(exc))
+                continue
+            try:
+                start = perf_counter()
+                iterator = iter(provider.chain.stream(self.prompt_value))
+                try:
+                    first_token = next((token for token in iterator if token), "")
+                except Exception as exc:
+                    self.pool._record_failure(provider, exc)
+                    errors.append(f"{provider.name}: {provider.last_error}")
+                    continue
+                self.pool._record_success(provider, "stream", (perf_counter() - start) * 1000)
+                self.provider = provider
+                if first_token:
+                    yield first_token
+                yield from iterator
+                return
+            finally:
+                provider.limiter.release()
+        if rejections:
+            raise LLMRateLimited("; ".join(errors), min(rejections))
+        raise AllProvidersFailed("; ".join(errors))
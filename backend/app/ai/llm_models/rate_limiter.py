@@ -0,0 +1,305 @@
+"""
+Límite de concurrencia y cola de admisión por proveedor LLM.
+
+Cada proveedor del pool tiene un `ProviderLimiter` que combina:
+- token bucket de solicitudes por minuto (`RPM`)
+- token bucket de tokens por minuto (`TPM`, prompt estimado + completion)
+- máximo de llamadas simultáneas (`MAX_IN_FLIGHT`)
+
+Una llamada que no puede salir de inmediato espera en una cola FIFO acotada.
+Si la cola está llena, o la espera estimada supera el plazo máximo, se rechaza
+al instante con `LLMRateLimited` y un `retry_after` estimado (el endpoint lo
+convierte en HTTP 429 con `Retry-After`): ante ráfagas se degrada solicitud por
+solicitud en lugar de que el proveedor devuelva 429 a toda la ráfaga.
+
+Variables de entorno (globales `LLM_<NOMBRE>` o por proveedor `LLM_GROQ_<NOMBRE>`):
+- `RATE_RPM=0`, `RATE_TPM=0`: 0 desactiva el bucket (ej. Groq free: 30 / 6000)
+- `MAX_IN_FLIGHT=8`
+- `QUEUE_MAX=32`, `QUEUE_MAX_WAIT_SECONDS=10`
+- `RATE_COMPLETION_TOKENS=512`: tokens de respuesta estimados por llamada
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Intervalo de sondeo mientras se espera un cupo de concurrencia
+_POLL_SECONDS = 0.05
+# Espera por defecto tras un 429 del proveedor sin cabecera Retry-After
+_DEFAULT_PROVIDER_RETRY_AFTER = 5.0
+
+
+class LLMRateLimited(RuntimeError):
+    """La llamada no fue admitida a tiempo; `retry_after` estima cuándo reintentar (segundos)."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(retry_after, 0.0)
+
+
+@dataclass(frozen=True)
+class RateLimitConfig:
+    """Límites de un proveedor (0 en RPM/TPM = sin límite)."""
+
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    max_in_flight: int = 8
+    max_queue: int = 32
+    max_wait_seconds: float = 10.0
+    completion_tokens: int = 512
+
+    @classmethod
+    def from_env(cls, provider: str) -> "RateLimitConfig":
+        def _value(name: str, default: str) -> str:
+            return os.getenv(f"LLM_{provider.upper()}_{name}", os.getenv(f"LLM_{name}", default))
+
+        return cls(
+            requests_per_minute=max(int(_value("RATE_RPM", "0")), 0),
+            tokens_per_minute=max(int(_value("RATE_TPM", "0")), 0),
+            max_in_flight=max(int(_value("MAX_IN_FLIGHT", "8")), 1),
+            max_queue=max(int(_value("QUEUE_MAX", "32")), 0),
+            max_wait_seconds=max(float(_value("QUEUE_MAX_WAIT_SECONDS", "10")), 0.0),
+            completion_tokens=max(int(_value("RATE_COMPLETION_TOKENS", "512")), 0),
+        )
+
+
+class TokenBucket:
+    """Bucket que se rellena de forma continua hasta `per_minute` unidades (no es thread-safe)."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos hasta que haya `amount` unidades (un pedido mayor que la capacidad espera el bucket lleno)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+def retry_after_from_error(error: BaseException) -> Optional[float]:
+    """Segundos de `Retry-After` si el error es un 429 del proveedor (None si no lo es)."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None) or getattr(error, "code", None)
+    try:
+        if int(status) != 429:
+            return None
+    except (TypeError, ValueError):
+        return None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return max(float(headers.get("retry-after")), 0.0)
+    except (TypeError, ValueError):
+        return _DEFAULT_PROVIDER_RETRY_AFTER
+
+
+class ProviderLimiter:
+    """Buckets RPM/TPM, cupo de llamadas simultáneas y cola FIFO de un proveedor."""
+
+    def __init__(self, name: str, config: Optional[RateLimitConfig] = None):
+        self.name = name
+        self.config = config or RateLimitConfig()
+        self._requests = TokenBucket(self.config.requests_per_minute) if self.config.requests_per_minute else None
+        self._tokens = TokenBucket(self.config.tokens_per_minute) if self.config.tokens_per_minute else None
+        self._lock = Lock()
+        self._queue: Deque[int] = deque()
+        self._tickets = itertools.count()
+        self._paused_until = 0.0
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.provider_429 = 0
+        self.max_queue_depth = 0
+        self._waited_ms = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _charge(self, tokens: int) -> int:
+        return tokens + self.config.completion_tokens
+
+    def _wait_locked(self, tokens: int, now: float) -> float:
+        """Espera necesaria para admitir ya una llamada de `tokens` (0 = puede salir)."""
+        wait = max(self._paused_until - now, 0.0)
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(self._charge(tokens), now))
+        if self.in_flight >= self.config.max_in_flight:
+            wait = max(wait, _POLL_SECONDS)
+        return wait
+
+    def _admit_locked(self, tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.take(1)
+        if self._tokens is not None:
+            self._tokens.take(self._charge(tokens))
+        self.in_flight += 1
+        self.admitted += 1
+
+    def _estimate_locked(self, tokens: int, now: float, ahead: int) -> float:
+        """Espera estimada para una llamada con `ahead` llamadas delante en la cola."""
+        per_call = 0.0
+        if self._requests is not None:
+            per_call = max(per_call, 1 / self._requests.rate)
+        if self._tokens is not None:
+            per_call = max(per_call, self._charge(tokens) / self._tokens.rate)
+        return self._wait_locked(tokens, now) + ahead * per_call
+
+    def _reject_locked(self, reason: str, retry_after: float) -> LLMRateLimited:
+        self.rejected += 1
+        logger.warning(
+            "⚠️ LLM %s rechazado: %s (cola=%s en_vuelo=%s, reintentar en %.1fs)",
+            self.name,
+            reason,
+            len(self._queue),
+            self.in_flight,
+            retry_after,
+        )
+        return LLMRateLimited(f"{self.name}: {reason}", retry_after)
+
+    def _enter(self, tokens: int, max_wait: float) -> Optional[int]:
+        """Admite de inmediato (None) o encola y devuelve el ticket; rechaza si no alcanzaría a salir."""
+        now = monotonic()
+        with self._lock:
+            if not self._queue and self._wait_locked(tokens, now) == 0:
+                self._admit_locked(tokens)
+                return None
+            estimate = self._estimate_locked(tokens, now, len(self._queue))
+            if len(self._queue) >= self.config.max_queue:
+                raise self._reject_locked("cola llena", estimate)
+            if estimate > max_wait:
+                raise self._reject_locked(f"espera estimada {estimate:.1f}s > {max_wait:.1f}s", estimate)
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            return ticket
+
+    def _poll(self, ticket: int, tokens: int, deadline: float) -> float:
+        """Intenta admitir el ticket: 0 si salió, si no los segundos a dormir. Rechaza al vencer el plazo."""
+        now = monotonic()
+        with self._lock:
+            if self._queue[0] == ticket:
+                wait = self._wait_locked(tokens, now)
+                if wait == 0:
+                    self._queue.popleft()
+                    self._admit_locked(tokens)
+                    return 0.0
+            else:
+                # Solo la cabeza de la cola consume cupo: se respeta el orden de llegada
+                wait = _POLL_SECONDS
+            if now + min(wait, _POLL_SECONDS) > deadline:
+                self._queue.remove(ticket)
+                raise self._reject_locked("plazo de espera en cola vencido", self._estimate_locked(tokens, now, 0))
+            return min(wait, max(deadline - now, 0.0))
+
+    def _abandon(self, ticket: int) -> None:
+        with self._lock:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+
+    def _log_wait(self, start: float) -> None:
+        waited_ms = (perf_counter() - start) * 1000
+        with self._lock:
+            self._waited_ms += waited_ms
+        logger.info(
+            "⏱️ LLM queue timing | provider=%s wait_ms=%.1f queue_depth=%s in_flight=%s",
+            self.name,
+            waited_ms,
+            len(self._queue),
+            self.in_flight,
+        )
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> None:
+        """Bloquea hasta obtener cupo (o lanza `LLMRateLimited`). Liberar con `release`."""
+        max_wait = self.config.max_wait_seconds if max_wait is None else max_wait
+        ticket = self._enter(tokens, max_wait)
+        if ticket is None:
+            return
+        start = perf_counter()
+        deadline = monotonic() + max_wait
+        try:
+            while True:
+                wait = self._poll(ticket, tokens, deadline)
+                if wait == 0:
+                    break
+                time.sleep(wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._log_wait(start)
+
+    async def aacquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> None:
+        """Versión async de `acquire`: espera sin bloquear el event loop."""
+        max_wait = self.config.max_wait_seconds if max_wait is None else max_wait
+        ticket = self._enter(tokens, max_wait)
+        if ticket is None:
+            return
+        start = perf_counter()
+        deadline = monotonic() + max_wait
+        try:
+            while True:
+                wait = self._poll(ticket, tokens, deadline)
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            # Incluye la cancelación de un intento perdedor del hedging
+            self._abandon(ticket)
+            raise
+        self._log_wait(start)
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+
+    def pause(self, seconds: float) -> None:
+        """Detiene las admisiones tras un 429 del proveedor (respeta su Retry-After)."""
+        with self._lock:
+            self.provider_429 += 1
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
+        logger.warning(f"⚠️ Proveedor LLM {self.name} respondió 429; admisiones pausadas {seconds:.1f}s")
+
+    def admission_estimate(self) -> Tuple[bool, float]:
+        """(acepta nuevas llamadas, espera estimada en segundos) sin reservar cupo."""
+        now = monotonic()
+        with self._lock:
+            estimate = self._estimate_locked(0, now, len(self._queue))
+            accepts = len(self._queue) < self.config.max_queue and estimate <= self.config.max_wait_seconds
+            return accepts, estimate
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "provider_429": self.provider_429,
+                "avg_queue_wait_ms": round(self._waited_ms / self.queued, 1) if self.queued else 0.0,
+                "paused": self._paused_until > monotonic(),
+                "limits": asdict(self.config),
+            }
@@ -0,0 +1,252 @@
+"""
+Cache de respuestas del LLM por coincidencia exacta del prompt.
+
+La clave es un hash SHA-256 del prompt completamente renderizado (instrucciones,
+contexto del módulo, contexto RAG, historial y pregunta) más el modelo y la
+temperatura. Un acierto evita un round trip pagado al proveedor.
+
+Backends disponibles (`LLM_RESPONSE_CACHE_BACKEND`):
+- memory: LRU en memoria del proceso (por defecto)
+- postgres: tabla `llm_response_cache`, compartida entre workers de uvicorn
+- off: sin cache
+"""
+
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, Integer, String, Text, delete, select
+
+from app.core.database import Base, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def build_cache_key(rendered_prompt: str, model_name: str, temperature: Optional[float]) -> str:
+    """Genera la huella del prompt renderizado + modelo + temperatura."""
+    digest = hashlib.sha256()
+    digest.update((model_name or "").encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(repr(temperature).encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update((rendered_prompt or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LLMResponseCacheEntry(Base):
+    """Fila del backend postgres del cache de respuestas."""
+
+    __tablename__ = "llm_response_cache"
+
+    cache_key = Column(String(64), primary_key=True)
+    model_name = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    last_accessed_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class BaseResponseCache:
+    """Interfaz común de los backends y contadores de hit/miss del proceso."""
+
+    backend_name = "base"
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = Lock()
+
+    def _record(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, model_name: str = "") -> None:
+        raise NotImplementedError
+
+    def clear(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+class NullResponseCache(BaseResponseCache):
+    """Cache deshabilitado: nunca hay aciertos."""
+
+    backend_name = "off"
+
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def set(self, key: str, value: str, model_name: str = "") -> None:
+        return None
+
+    def clear(self) -> int:
+        return 0
+
+
+class InMemoryResponseCache(BaseResponseCache):
+    """LRU en memoria con TTL, seguro entre threads."""
+
+    backend_name = "memory"
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        super().__init__(max_entries, ttl_seconds)
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self._record(entry is not None)
+        return entry[1] if entry is not None else None
+
+    def set(self, key: str, value: str, model_name: str = "") -> None:
+        expires_at = monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+        return removed
+
+    def stats(self) -> dict:
+        data = super().stats()
+        data["entries"] = len(self._entries)
+        return data
+
+
+class PostgresResponseCache(BaseResponseCache):
+    """
+    Cache compartido en la tabla `llm_response_cache`.
+
+    El LRU se aproxima con `last_accessed_at`: cada cierto número de escrituras
+    se eliminan las filas expiradas y las menos usadas por encima de `max_entries`.
+    """
+
+    backend_name = "postgres"
+
+    def __init__(self, max_entries: int, ttl_seconds: int, evict_every: int = 50):
+        super().__init__(max_entries, ttl_seconds)
+        self.evict_every = max(evict_every, 1)
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            entry = db.get(LLMResponseCacheEntry, key)
+            expires_at = entry.expires_at if entry is not None else None
+            if expires_at is not None and expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at is None or expires_at <= now:
+                self._record(False)
+                return None
+            entry.last_accessed_at = now
+            entry.hit_count = (entry.hit_count or 0) + 1
+            response = entry.response
+            db.commit()
+            self._record(True)
+            return response
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"⚠️ Error leyendo cache de respuestas: {str(e)}")
+            self._record(False)
+            return None
+        finally:
+            db.close()
+
+    def set(self, key: str, value: str, model_name: str = "") -> None:
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            db.merge(
+                LLMResponseCacheEntry(
+                    cache_key=key,
+                    model_name=model_name or "",
+                    response=value,
+                    hit_count=0,
+                    created_at=now,
+                    last_accessed_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl_seconds),
+                )
+            )
+            db.commit()
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(db, now)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"⚠️ Error escribiendo cache de respuestas: {str(e)}")
+        finally:
+            db.close()
+
+    def _evict(self, db, now: datetime) -> None:
+        """Elimina filas expiradas y recorta a `max_entries` por último acceso."""
+        db.execute(delete(LLMResponseCacheEntry).where(LLMResponseCacheEntry.expires_at <= now))
+        keep_keys = (
+            select(LLMResponseCacheEntry.cache_key)
+            .order_by(LLMResponseCacheEntry.last_accessed_at.desc())
+            .limit(self.max_entries)
+        )
+        db.execute(
+            delete(LLMResponseCacheEntry).where(LLMResponseCacheEntry.cache_key.not_in(keep_keys))
+        )
+        db.commit()
+
+    def clear(self) -> int:
+        db = SessionLocal()
+        try:
+            removed = db.execute(delete(LLMResponseCacheEntry)).rowcount or 0
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+
+def create_response_cache() -> BaseResponseCache:
+    """Crea el backend de cache según las variables de entorno."""
+    backend = os.getenv("LLM_RESPONSE_CACHE_BACKEND", "memory").strip().lower()
+    ttl_seconds = max(int(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", "3600")), 1)
+    max_entries = max(int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", "1000")), 1)
+
+    if backend in {"off", "none", "false", "0", ""}:
+        return NullResponseCache(max_entries, ttl_seconds)
+    if backend == "postgres":
+        return PostgresResponseCache(max_entries, ttl_seconds)
+    if backend != "memory":
+        logger.warning(f"⚠️ Backend de cache desconocido '{backend}', usando memory")
+    return InMemoryResponseCache(max_entries, ttl_seconds)
@@ -0,0 +1,236 @@
+"""
+Cache semántico de respuestas para preguntas genéricas de metodología MGA.
+
+Muchas preguntas ("¿cómo redacto el problema central?") no dependen de los
+datos del proyecto. Este cache guarda, por tab, los vectores de preguntas ya
+respondidas (con el mismo modelo de embeddings del índice RAG) y sirve la
+respuesta previa cuando una nueva pregunta supera un umbral de similitud coseno
+y el contexto del módulo no trae información del proyecto.
+
+Solo aplica a primeros turnos: con historial o resumen de conversación la
+respuesta depende de esa conversación y no se guarda ni se sirve. Cada entrada
+lleva además la huella (`variant`) de todo lo que arma el prompt salvo la
+pregunta (plantilla del tab, contexto del módulo, modelo), y solo se comparan
+preguntas con la misma huella.
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+def has_project_signal(context: str) -> bool:
+    """
+    Indica si el contexto del módulo contiene datos del proyecto.
+
+    `format_module_data_for_prompt` devuelve mensajes entre paréntesis
+    ("(No hay información registrada ...)", "(No hay datos disponibles ...)")
+    cuando no hay registros; esos contextos no cuentan como señal del proyecto.
+    """
+    text = (context or "").strip()
+    if not text:
+        return False
+    return not (text.startswith("(") and text.endswith(")"))
+
+
+@dataclass
+class _TabIndex:
+    """Preguntas, respuestas y vectores de un tab."""
+
+    questions: List[str] = field(default_factory=list)
+    answers: List[str] = field(default_factory=list)
+    variants: List[str] = field(default_factory=list)
+    vectors: List[sparse.csr_matrix] = field(default_factory=list)
+    expires_at: List[float] = field(default_factory=list)
+    matrix: Optional[sparse.csr_matrix] = None
+    hits: int = 0
+    misses: int = 0
+
+    def rebuild_matrix(self) -> None:
+        self.matrix = sparse.vstack(self.vectors).tocsr() if self.vectors else None
+
+    def remove(self, indices: List[int]) -> None:
+        for index in sorted(indices, reverse=True):
+            del self.questions[index]
+            del self.answers[index]
+            del self.variants[index]
+            del self.vectors[index]
+            del self.expires_at[index]
+        self.rebuild_matrix()
+
+
+class SemanticAnswerCache:
+    """Índice por tab de preguntas respondidas, consultado por similitud coseno."""
+
+    def __init__(
+        self,
+        encoder: Callable[[List[str]], Optional[sparse.csr_matrix]],
+        version_provider: Callable[[], int],
+        enabled: bool = True,
+        threshold: float = 0.85,
+        max_entries_per_tab: int = 200,
+        ttl_seconds: int = 86400,
+    ):
+        self.encoder = encoder
+        self.version_provider = version_provider
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries_per_tab = max_entries_per_tab
+        self.ttl_seconds = ttl_seconds
+        self._tabs: Dict[str, _TabIndex] = {}
+        self._encoder_version: Optional[int] = None
+        self._lock = Lock()
+
+    @classmethod
+    def from_env(cls, encoder, version_provider) -> "SemanticAnswerCache":
+        return cls(
+            encoder=encoder,
+            version_provider=version_provider,
+            enabled=os.getenv("LLM_SEMANTIC_CACHE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"},
+            threshold=float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.85")),
+            max_entries_per_tab=max(int(os.getenv("LLM_SEMANTIC_CACHE_MAX_ENTRIES", "200")), 1),
+            ttl_seconds=max(int(os.getenv("LLM_SEMANTIC_CACHE_TTL_SECONDS", "86400")), 1),
+        )
+
+    @staticmethod
+    def _normalize(question: str) -> str:
+        return " ".join((question or "").lower().split())
+
+    def _encode(self, question: str) -> Optional[sparse.csr_matrix]:
+        try:
+            vector = self.encoder([self._normalize(question)])
+        except Exception as e:
+            # El cache nunca debe tumbar la respuesta: sin vector simplemente no aplica.
+            logger.warning(f"⚠️ No fue posible vectorizar la pregunta para el cache semántico: {str(e)}")
+            return None
+        if vector is None or vector.nnz == 0:
+            return None
+        return vector
+
+    def _check_encoder_version(self) -> None:
+        """Si el índice RAG cambió, los vectores guardados ya no son comparables."""
+        version = self.version_provider()
+        if self._encoder_version != version:
+            if self._tabs:
+                logger.info("🧹 Cache semántico invalidado por cambio de índice RAG")
+            self._tabs.clear()
+            self._encoder_version = version
+
+    def _applies(self, context: str, has_history: bool) -> bool:
+        return self.enabled and not has_history and not has_project_signal(context)
+
+    def lookup(self, tab: str, question: str, context: str, variant: str = "", has_history: bool = False) -> Optional[dict]:
+        """
+        Busca una respuesta previa equivalente.
+
+        Args:
+            tab: Componente MGA
+            question: Pregunta del usuario
+            context: Contexto del módulo (con datos del proyecto no aplica)
+            variant: Huella del prompt sin la pregunta; solo se comparan entradas con la misma
+            has_history: Si el turno trae historial o resumen (entonces no aplica)
+
+        Returns:
+            Dict con answer, score y matched_question, o None si no aplica o no hay acierto
+        """
+        if not self._applies(context, has_history):
+            return None
+
+        vector = self._encode(question)
+        if vector is None:
+            return None
+
+        now = monotonic()
+        with self._lock:
+            self._check_encoder_version()
+            index = self._tabs.setdefault(tab, _TabIndex())
+
+            expired = [i for i, expires_at in enumerate(index.expires_at) if expires_at <= now]
+            if expired:
+                index.remove(expired)
+
+            if index.matrix is None:
+                index.misses += 1
+                return None
+
+            scores = (index.matrix @ vector.T).toarray().ravel()
+            scores[np.asarray(index.variants) != variant] = -1.0
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.threshold:
+                index.misses += 1
+                return None
+
+            index.hits += 1
+            return {
+                "answer": index.answers[best],
+                "score": score,
+                "matched_question": index.questions[best],
+            }
+
+    def add(
+        self, tab: str, question: str, answer: str, context: str, variant: str = "", has_history: bool = False
+    ) -> None:
+        """Guarda la respuesta si la pregunta no dependía de datos del proyecto ni de la conversación."""
+        if not answer or not self._applies(context, has_history):
+            return
+
+        vector = self._encode(question)
+        if vector is None:
+            return
+
+        with self._lock:
+            self._check_encoder_version()
+            index = self._tabs.setdefault(tab, _TabIndex())
+            index.questions.append(question)
+            index.answers.append(answer)
+            index.variants.append(variant)
+            index.vectors.append(vector)
+            index.expires_at.append(monotonic() + self.ttl_seconds)
+            overflow = len(index.questions) - self.max_entries_per_tab
+            if overflow > 0:
+                index.remove(list(range(overflow)))
+            else:
+                index.rebuild_matrix()
+
+    def purge(self, tab: Optional[str] = None) -> int:
+        """Elimina las entradas de un tab (o de todos). Retorna cuántas se borraron."""
+        with self._lock:
+            if tab is None:
+                removed = sum(len(index.questions) for index in self._tabs.values())
+                self._tabs.clear()
+                return removed
+            index = self._tabs.pop(tab, None)
+            return len(index.questions) if index else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            tabs = {}
+            total_hits = total_misses = 0
+            for tab, index in self._tabs.items():
+                lookups = index.hits + index.misses
+                tabs[tab] = {
+                    "entries": len(index.questions),
+                    "hits": index.hits,
+                    "misses": index.misses,
+                    "hit_rate": round(index.hits / lookups, 4) if lookups else 0.0,
+                }
+                total_hits += index.hits
+                total_misses += index.misses
+        total = total_hits + total_misses
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "hits": total_hits,
+            "misses": total_misses,
+            "hit_rate": round(total_hits / total, 4) if total else 0.0,
+            "tabs": tabs,
+        }
@@ -0,0 +1,253 @@
+"""
+Benchmark de calidad y latencia del RAG (offline, sin LLM).
+
+Construye un índice por variante de configuración, lo recarga y responde el
+set de preguntas etiquetadas (`benchmark_questions.json`: pregunta -> páginas
+esperadas del manual). Reporta recall@k, MRR, tiempo de construcción y de
+carga, tamaño del índice y latencia p50/p95 de `RAGManager.retrieve`.
+
+Uso:
+    python -m app.ai.rag.benchmark
+    python -m app.ai.rag.benchmark --variant base --variant "chunk900:chunk_size=900,chunk_overlap=150"
+    python -m app.ai.rag.benchmark --variant "rerank:reranker=lexical" --output reporte.json
+
+Cada `--variant` es `nombre[:campo=valor,...]` con campos de `RAGConfig`
+sobre la configuración del entorno. El reporte JSON se puede comparar entre versiones.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import logging
+import shutil
+import statistics
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .config import RAGConfig
+from .rag_manager import RAGManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUESTIONS = Path(__file__).resolve().parent / "benchmark_questions.json"
+DEFAULT_KS = (1, 3, 5)
+
+
+def parse_variant(spec: str, base: RAGConfig) -> Tuple[str, Dict[str, object]]:
+    """`nombre:campo=valor,...` -> (nombre, overrides convertidos al tipo del campo en `base`)."""
+    name, _, assignments = spec.partition(":")
+    overrides: Dict[str, object] = {}
+    fields = {field.name for field in dataclasses.fields(RAGConfig)}
+    for assignment in filter(None, (item.strip() for item in assignments.split(","))):
+        key, _, raw = assignment.partition("=")
+        key = key.strip()
+        if key not in fields:
+            raise ValueError(f"Campo de RAGConfig desconocido en la variante '{name}': {key}")
+        current = getattr(base, key)
+        if isinstance(current, bool):
+            value: object = raw.strip().lower() in {"1", "true", "yes", "on"}
+        elif isinstance(current, Path):
+            value = Path(raw.strip()).expanduser()
+        else:
+            value = type(current)(raw.strip())
+        overrides[key] = value
+    return name.strip() or "base", overrides
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percentile / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _directory_size(path: Path) -> int:
+    return sum(item.stat().st_size for item in path.rglob("*") if item.is_file())
+
+
+def _first_relevant_rank(hits: List[dict], expected_pages: List[int], source: Optional[str]) -> Optional[int]:
+    """Posición (1-based) del primer hit cuya página (o rango `page`-`end_page`) es una de las esperadas."""
+    expected = set(expected_pages)
+    for rank, hit in enumerate(hits, start=1):
+        metadata = hit.get("metadata", {})
+        if source and metadata.get("source") != source:
+            continue
+        first_page = metadata.get("page")
+        if first_page is None:
+            continue
+        if expected.intersection(range(first_page, metadata.get("end_page", first_page) + 1)):
+            return rank
+    return None
+
+
+def run_variant(
+    name: str,
+    config: RAGConfig,
+    questions: List[dict],
+    source: Optional[str],
+    ks: Tuple[int, ...],
+    repeat: int,
+) -> dict:
+    """Construye, carga y consulta el índice de una variante."""
+    report: dict = {
+        "name": name,
+        "config": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in dataclasses.asdict(config).items()
+            if key not in {"source_document_path", "source_dir", "index_dir", "embedding_model_dir", "reranker_model_dir"}
+        },
+    }
+
+    build_start = perf_counter()
+    builder = RAGManager(config)
+    builder.rebuild_index()
+    build_ms = (perf_counter() - build_start) * 1000
+    if not builder.is_ready:
+        raise RuntimeError(builder.status().get("error") or "no se pudo construir el índice")
+
+    # Carga en frío con un manager nuevo: mide memory-mapping + warm-up como al iniciar el servidor
+    load_start = perf_counter()
+    manager = RAGManager(config)
+    manager.warm_up()
+    load_ms = (perf_counter() - load_start) * 1000
+    if not manager.is_ready:
+        raise RuntimeError(manager.status().get("error") or "no se pudo cargar el índice")
+
+    report["index"] = {
+        "chunks": manager.vector_store.chunk_count,
+        "size_bytes": _directory_size(config.index_dir),
+        "build_ms": round(build_ms, 1),
+        "load_ms": round(load_ms, 1),
+    }
+
+    latencies: List[float] = []
+    ranks: List[Optional[int]] = []
+    hits_returned: List[int] = []
+    context_chars: List[int] = []
+    misses: List[str] = []
+    for item in questions:
+        hits: List[dict] = []
+        for _ in range(repeat):
+            start = perf_counter()
+            hits = manager.retrieve(item["question"], item.get("tab"))
+            latencies.append((perf_counter() - start) * 1000)
+        rank = _first_relevant_rank(hits, item["pages"], item.get("source", source))
+        ranks.append(rank)
+        hits_returned.append(len(hits))
+        context_chars.append(sum(len(hit["text"]) for hit in hits))
+        if rank is None:
+            misses.append(item["id"])
+
+    total = len(questions) or 1
+    report["retrieval"] = {
+        **{f"recall@{k}": round(sum(1 for rank in ranks if rank is not None and rank <= k) / total, 4) for k in ks},
+        "mrr": round(sum(1.0 / rank for rank in ranks if rank is not None) / total, 4),
+        "hits_avg": round(statistics.mean(hits_returned), 2) if hits_returned else 0.0,
+        "context_chars_avg": round(statistics.mean(context_chars), 1) if context_chars else 0.0,
+        "misses": misses,
+    }
+    report["latency_ms"] = {
+        "p50": round(_percentile(latencies, 50), 3),
+        "p95": round(_percentile(latencies, 95), 3),
+        "mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "samples": len(latencies),
+    }
+    return report
+
+
+def _print_summary(variants: List[dict], ks: Tuple[int, ...]) -> None:
+    columns = [f"recall@{k}" for k in ks] + ["mrr", "ctx_chars", "chunks", "size_kb", "build_ms", "load_ms", "p50_ms", "p95_ms"]
+    print(f"{'variante':<20}" + "".join(f"{column:>11}" for column in columns))
+    for variant in variants:
+        if "error" in variant:
+            print(f"{variant['name']:<20} ERROR: {variant['error']}")
+            continue
+        retrieval, index, latency = variant["retrieval"], variant["index"], variant["latency_ms"]
+        values = [retrieval[f"recall@{k}"] for k in ks] + [
+            retrieval["mrr"],
+            retrieval["context_chars_avg"],
+            index["chunks"],
+            round(index["size_bytes"] / 1024, 1),
+            index["build_ms"],
+            index["load_ms"],
+            latency["p50"],
+            latency["p95"],
+        ]
+        print(f"{variant['name']:<20}" + "".join(f"{value:>11}" for value in values))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de recuperación y latencia del RAG.")
+    parser.add_argument("--questions", type=Path, default=DEFAULT_QUESTIONS, help="Set de preguntas etiquetadas (JSON)")
+    parser.add_argument(
+        "--variant",
+        action="append",
+        default=None,
+        help="Variante 'nombre:campo=valor,...' sobre la configuración del entorno (repetible)",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones de cada pregunta para medir latencia")
+    parser.add_argument("--k", type=str, default=",".join(str(k) for k in DEFAULT_KS), help="Cortes de recall@k")
+    parser.add_argument("--work-dir", type=Path, default=None, help="Carpeta para los índices (por defecto temporal)")
+    parser.add_argument("--output", type=Path, default=None, help="Archivo del reporte JSON")
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs INFO del RAG")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if not args.verbose:
+        # Los logs de timing por búsqueda ocultarían el avance del benchmark
+        logging.getLogger(__package__).setLevel(logging.WARNING)
+        logger.setLevel(logging.INFO)
+
+    data = json.loads(args.questions.read_text(encoding="utf-8"))
+    questions = data["questions"]
+    ks = tuple(sorted({max(int(k), 1) for k in args.k.split(",") if k.strip()}))
+    base = RAGConfig.from_env()
+    variants = [parse_variant(spec, base) for spec in (args.variant or ["base"])]
+
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="rag-benchmark-"))
+    reports: List[dict] = []
+    try:
+        for name, overrides in variants:
+            # Sin cache de consultas: cada repetición mide la búsqueda real
+            config = dataclasses.replace(
+                base, **{**overrides, "enabled": True, "query_cache_size": 0, "index_dir": work_dir / name}
+            )
+            logger.info("Benchmark RAG | variante=%s overrides=%s", name, overrides)
+            try:
+                report = run_variant(name, config, questions, data.get("source"), ks, max(args.repeat, 1))
+            except Exception as exc:
+                logger.error("Variante %s falló: %s", name, exc, exc_info=args.verbose)
+                report = {"name": name, "error": str(exc)}
+            report["overrides"] = {key: str(value) for key, value in overrides.items()}
+            reports.append(report)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "questions_file": str(args.questions),
+        "questions": len(questions),
+        "repeat": args.repeat,
+        "variants": reports,
+    }
+    _print_summary(reports, ks)
+    if args.output:
+        args.output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Reporte escrito en {args.output}")
+    return 0 if all("error" not in report for report in reports) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+"""Índice invertido BM25 para recuperación por términos exactos."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from .index_storage import csr_files, load_csr, save_csr, write_text
+
+# Parámetros estándar de Okapi BM25
+_K1 = 1.5
+_B = 0.75
+
+
+def _build_vectorizer(vocabulary: dict | None = None) -> CountVectorizer:
+    # Misma tokenización que el modelo TF-IDF (minúsculas, sin tildes)
+    return CountVectorizer(
+        lowercase=True,
+        strip_accents="unicode",
+        token_pattern=r"(?u)\b\w\w+\b",
+        vocabulary=vocabulary,
+    )
+
+
+class BM25Index:
+    """
+    BM25 precalculado como matriz dispersa términos × chunks.
+
+    En `build()` se calcula el peso BM25 de cada par (término, chunk) y se guarda
+    en formato CSR por término (listas de postings). Puntuar una consulta es sumar
+    las filas de sus términos: no hay bucles en Python por chunk.
+    """
+
+    def __init__(self):
+        self._vectorizer = _build_vectorizer()
+        self._postings: sparse.csr_matrix | None = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._postings is not None
+
+    def build(self, texts: List[str]) -> None:
+        self._vectorizer = _build_vectorizer()
+        counts = self._vectorizer.fit_transform(texts).tocsr().astype(np.float32)
+
+        doc_lengths = np.asarray(counts.sum(axis=1)).ravel()
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log1p((counts.shape[0] - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+        # Saturación de frecuencia por documento, aplicada sobre los valores no nulos
+        norm = _K1 * (1 - _B + _B * doc_lengths / max(avg_length, 1e-9))
+        row_norm = np.repeat(norm, np.diff(counts.indptr)).astype(np.float32)
+        tf = counts.data
+        counts.data = idf[counts.indices] * tf * (_K1 + 1) / (tf + row_norm)
+
+        self._postings = counts.T.tocsr()
+
+    def scores(self, query: str) -> np.ndarray:
+        """Puntaje BM25 de cada chunk para la consulta (0 si no comparte términos)."""
+        if self._postings is None:
+            return np.zeros(0, dtype=np.float32)
+        term_ids = self._vectorizer.transform([query]).indices
+        if term_ids.size == 0:
+            return np.zeros(self._postings.shape[1], dtype=np.float32)
+        return np.asarray(self._postings[term_ids].sum(axis=0)).ravel()
+
+    def normalized_scores(self, query: str) -> np.ndarray:
+        """
+        Puntajes BM25 en [0, 1]: cada puntaje dividido por el máximo alcanzable
+        con los términos de la consulta (suma del mayor peso de cada término).
+
+        A diferencia de dividir por el mejor hit, no infla un chunk que solo
+        comparte un término marginal con la consulta.
+        """
+        if self._postings is None:
+            return np.zeros(0, dtype=np.float32)
+        term_ids = self._vectorizer.transform([query]).indices
+        if term_ids.size == 0:
+            return np.zeros(self._postings.shape[1], dtype=np.float32)
+        rows = self._postings[term_ids]
+        ceiling = float(rows.max(axis=1).toarray().sum())
+        scores = np.asarray(rows.sum(axis=0)).ravel()
+        return scores / ceiling if ceiling > 0 else scores
+
+    @staticmethod
+    def files(index_dir: Path) -> List[Path]:
+        return csr_files(index_dir, "bm25") + [index_dir / "bm25_vocabulary.json"]
+
+    def save(self, index_dir: Path) -> None:
+        save_csr(index_dir, "bm25", self._postings)
+        vocabulary = {term: int(index) for term, index in self._vectorizer.vocabulary_.items()}
+        write_text(index_dir / "bm25_vocabulary.json", json.dumps(vocabulary, ensure_ascii=False))
+
+    def load(self, index_dir: Path) -> None:
+        vocabulary = json.loads((index_dir / "bm25_vocabulary.json").read_text(encoding="utf-8"))
+        self._vectorizer = _build_vectorizer(vocabulary)
+        self._postings = load_csr(index_dir, "bm25")
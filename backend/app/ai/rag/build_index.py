@@ -0,0 +1,50 @@
+"""
+Construcción del índice RAG fuera del servidor.
+
+Uso:
+    python -m app.ai.rag.build_index             # reindexa solo documentos nuevos o modificados
+    python -m app.ai.rag.build_index --full      # reconstruye todo el índice
+    python -m app.ai.rag.build_index --workers 8 # procesos para extraer páginas de PDFs
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from .config import RAGConfig
+from .rag_manager import RAGManager
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Construye o actualiza el índice RAG.")
+    parser.add_argument("--full", action="store_true", help="Reconstruye el índice completo")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para extraer páginas (RAG_EXTRACTION_WORKERS)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    config = RAGConfig.from_env()
+    if not config.enabled:
+        logger.error("RAG deshabilitado (RAG_ENABLED=false); no se construye el índice")
+        return 1
+    if args.workers is not None:
+        config.extraction_workers = max(args.workers, 1)
+
+    manager = RAGManager(config)
+    if args.full:
+        manager.rebuild_index()
+    else:
+        manager.sync_index()
+    logger.info("Índice RAG listo en %s", config.index_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -13,30 +13,71 @@ class RAGConfig:
 
     enabled: bool
     source_document_path: Path
+    source_dir: Path
     index_dir: Path
     chunk_size: int
     chunk_overlap: int
     top_k: int
     min_similarity: float
     embedding_provider: str
+    embedding_model_dir: Path
+    embedding_quantization: str
+    embedding_batch_size: int
+    retrieval_mode: str
+    rrf_k: int
+    bm25_min_score: float
+    section_mode: str
+    section_boost: float
+    reranker: str
+    reranker_model_dir: Path
+    rerank_candidates: int
+    rerank_top_n: int
+    rerank_min_score: float
+    rerank_budget_ms: float
+    rerank_breaker_failures: int
+    rerank_breaker_cooldown_seconds: float
+    extraction_workers: int
     auto_reindex: bool
     max_context_chars: int
+    query_cache_size: int
 
     @classmethod
     def from_env(cls) -> "RAGConfig":
         base_app_dir = Path(__file__).resolve().parents[2]
         default_document = base_app_dir / "data" / "manual_conceptual_2015.pdf"
+        default_source_dir = base_app_dir / "data" / "rag_corpus"
         default_index_dir = Path(__file__).resolve().parent / "index"
+        default_model_dir = Path(__file__).resolve().parent / "models" / "multilingual-minilm"
+        default_reranker_dir = Path(__file__).resolve().parent / "models" / "cross-encoder"
 
         return cls(
             enabled=os.getenv("RAG_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"},
             source_document_path=Path(os.getenv("RAG_SOURCE_DOCUMENT", str(default_document))).expanduser(),
+            source_dir=Path(os.getenv("RAG_SOURCE_DIR", str(default_source_dir))).expanduser(),
             index_dir=Path(os.getenv("RAG_INDEX_DIR", str(default_index_dir))).expanduser(),
             chunk_size=max(int(os.getenv("RAG_CHUNK_SIZE", "1400")), 300),
             chunk_overlap=max(int(os.getenv("RAG_CHUNK_OVERLAP", "250")), 0),
             top_k=max(int(os.getenv("RAG_TOP_K", "4")), 1),
             min_similarity=float(os.getenv("RAG_MIN_SIMILARITY", "0.10")),
             embedding_provider=os.getenv("RAG_EMBEDDING_PROVIDER", "tfidf").strip().lower(),
+            embedding_model_dir=Path(os.getenv("RAG_EMBEDDING_MODEL_DIR", str(default_model_dir))).expanduser(),
+            embedding_quantization=os.getenv("RAG_EMBEDDING_QUANTIZATION", "float32").strip().lower(),
+            embedding_batch_size=max(int(os.getenv("RAG_EMBEDDING_BATCH_SIZE", "32")), 1),
+            retrieval_mode=os.getenv("RAG_RETRIEVAL_MODE", "hybrid").strip().lower(),
+            rrf_k=max(int(os.getenv("RAG_RRF_K", "60")), 1),
+            bm25_min_score=min(max(float(os.getenv("RAG_BM25_MIN_SCORE", "0.25")), 0.0), 1.0),
+            section_mode=os.getenv("RAG_SECTION_MODE", "boost").strip().lower(),
+            section_boost=max(float(os.getenv("RAG_SECTION_BOOST", "0.25")), 0.0),
+            reranker=os.getenv("RAG_RERANKER", "off").strip().lower(),
+            reranker_model_dir=Path(os.getenv("RAG_RERANKER_MODEL_DIR", str(default_reranker_dir))).expanduser(),
+            rerank_candidates=max(int(os.getenv("RAG_RERANK_CANDIDATES", "12")), 1),
+            rerank_top_n=max(int(os.getenv("RAG_RERANK_TOP_N", "2")), 1),
+            rerank_min_score=float(os.getenv("RAG_RERANK_MIN_SCORE", "0.0")),
+            rerank_budget_ms=max(float(os.getenv("RAG_RERANK_BUDGET_MS", "50")), 1.0),
+            rerank_breaker_failures=max(int(os.getenv("RAG_RERANK_BREAKER_FAILURES", "3")), 1),
+            rerank_breaker_cooldown_seconds=max(float(os.getenv("RAG_RERANK_BREAKER_COOLDOWN_SECONDS", "60")), 0.0),
+            extraction_workers=max(int(os.getenv("RAG_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1)))), 1),
             auto_reindex=os.getenv("RAG_AUTO_REINDEX", "false").strip().lower() in {"1", "true", "yes", "on"},
             max_context_chars=max(int(os.getenv("RAG_MAX_CONTEXT_CHARS", "7000")), 500),
+            query_cache_size=max(int(os.getenv("RAG_QUERY_CACHE_SIZE", "512")), 0),
         )
@@ -0,0 +1,140 @@
+"""Corpus de documentos del RAG y manifest para indexación incremental."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from .config import RAGConfig
+from .document_processor import DocumentProcessor
+from .index_storage import write_text
+
+logger = logging.getLogger(__name__)
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def discover_documents(config: RAGConfig) -> Dict[str, Path]:
+    """
+    Documentos del corpus por nombre de fuente.
+
+    Incluye los archivos soportados de `RAG_SOURCE_DIR` (recursivo, nombre
+    relativo a la carpeta) y el documento individual `RAG_SOURCE_DOCUMENT`.
+    """
+    documents: Dict[str, Path] = {}
+    if config.source_document_path.is_file():
+        documents[config.source_document_path.name] = config.source_document_path
+    if config.source_dir.is_dir():
+        for path in sorted(config.source_dir.rglob("*")):
+            if path.is_file() and path.suffix.lower() in DocumentProcessor.SUPPORTED_EXTENSIONS:
+                documents[path.relative_to(config.source_dir).as_posix()] = path
+    return documents
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class CorpusChanges:
+    """Diferencias entre los documentos actuales y el manifest del índice."""
+
+    unchanged: List[str] = field(default_factory=list)
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.modified or self.removed)
+
+    @property
+    def to_index(self) -> List[str]:
+        return self.added + self.modified
+
+    def summary(self) -> str:
+        return (
+            f"sin_cambios={len(self.unchanged)} nuevos={len(self.added)} "
+            f"modificados={len(self.modified)} eliminados={len(self.removed)}"
+        )
+
+
+class CorpusManifest:
+    """
+    Registro (`manifest.json`) de cada documento indexado: hash del contenido,
+    tamaño, mtime y los ids de sus chunks.
+
+    El tamaño y el mtime evitan recalcular el hash de archivos que no se tocaron.
+    Si cambian los parámetros de chunking, todos los documentos cuentan como modificados.
+    """
+
+    def __init__(self, path: Path, chunking: Dict[str, int]):
+        self.path = path
+        self.chunking = chunking
+        self.documents: Dict[str, dict] = {}
+        self._hashes: Dict[str, str] = {}
+
+    def load(self) -> "CorpusManifest":
+        if not self.path.exists():
+            return self
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        if data.get("chunking") == self.chunking:
+            self.documents = data.get("documents", {})
+        else:
+            logger.info("Parámetros de chunking cambiaron; se reindexan todos los documentos RAG")
+        return self
+
+    def _current_hash(self, name: str, path: Path) -> str:
+        stat = path.stat()
+        entry = self.documents.get(name)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return entry["sha256"]
+        return file_sha256(path)
+
+    def diff(self, documents: Dict[str, Path]) -> CorpusChanges:
+        changes = CorpusChanges()
+        self._hashes = {}
+        for name, path in documents.items():
+            digest = self._current_hash(name, path)
+            self._hashes[name] = digest
+            entry = self.documents.get(name)
+            if entry is None:
+                changes.added.append(name)
+            elif entry["sha256"] != digest:
+                changes.modified.append(name)
+            else:
+                changes.unchanged.append(name)
+        changes.removed = [name for name in self.documents if name not in documents]
+        return changes
+
+    def chunk_ids(self, names: List[str]) -> List[str]:
+        return [chunk_id for name in names for chunk_id in self.documents[name]["chunk_ids"]]
+
+    def record(self, name: str, path: Path, chunk_ids: List[str]) -> None:
+        stat = path.stat()
+        self.documents[name] = {
+            "sha256": self._hashes.get(name) or file_sha256(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "chunk_ids": chunk_ids,
+        }
+
+    def forget(self, name: str) -> None:
+        self.documents.pop(name, None)
+
+    def clear(self) -> None:
+        self.documents = {}
+
+    def save(self) -> None:
+        write_text(
+            self.path,
+            json.dumps({"chunking": self.chunking, "documents": self.documents}, ensure_ascii=False, indent=2),
+        )
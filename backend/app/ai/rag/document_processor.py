@@ -2,13 +2,36 @@
 
 from __future__ import annotations
 
+import math
+import multiprocessing
 import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Set, Tuple
 
 from pypdf import PdfReader
 
+from .sections import SectionTracker, is_heading
+
+# Páginas por tarea del pool: rangos chicos reparten mejor, grandes abren menos veces el PDF
+_PAGES_PER_TASK = 16
+
+# Encabezados/pies repetidos: se buscan en las primeras/últimas líneas de cada página
+_HEADER_LINES = 8
+_FOOTER_LINES = 4
+# Una línea es boilerplate si aparece en al menos esta fracción de páginas (y en 3 o más)
+_BOILERPLATE_RATIO = 0.5
+_BOILERPLATE_MIN_PAGES = 3
+
+# Fragmentos iniciales de página más cortos que esta fracción de `chunk_size` se
+# unen al último chunk de la página anterior (párrafo partido por el salto de página)
+_CONTINUATION_RATIO = 0.25
+
+_LIST_ITEM_PATTERN = re.compile(r"^(?:[-•▪●◦*·]|\d{1,2}[.)]|[a-zA-Z][)])\s+")
+_SENTENCE_END_PATTERN = re.compile(r"(?<=[.;:!?])\s+")
+
 
 @dataclass
 class DocumentChunk:
@@ -19,9 +42,18 @@ class DocumentChunk:
     metadata: dict
 
 
+def _extract_pdf_page_range(task: Tuple[str, int, int]) -> List[Tuple[int, str]]:
+    """Extrae las páginas [start, end) de un PDF; se ejecuta en un proceso del pool."""
+    path, start, end = task
+    reader = PdfReader(path)
+    return [(index + 1, (reader.pages[index].extract_text() or "").strip()) for index in range(start, end)]
+
+
 class DocumentProcessor:
     """Lee documentos y los divide en chunks con overlap."""
 
+    SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
     @staticmethod
     def extract_text_from_pdf(file_path: Path) -> str:
         reader = PdfReader(str(file_path))
@@ -32,56 +64,294 @@ class DocumentProcessor:
                 page_texts.append(f"[PAGINA {index}]\n{extracted}")
         return "\n\n".join(page_texts)
 
+    @staticmethod
+    def extract_pages(file_path: Path) -> List[Tuple[int, str]]:
+        """Páginas (número, texto) del documento; los archivos de texto son una sola página."""
+        if file_path.suffix.lower() == ".pdf":
+            reader = PdfReader(str(file_path))
+            return [
+                (index, (page.extract_text() or "").strip())
+                for index, page in enumerate(reader.pages, start=1)
+            ]
+        return [(1, file_path.read_text(encoding="utf-8", errors="replace").strip())]
+
+    # Se incrementa cuando cambia el resultado del chunking: fuerza reindexar el corpus
+    CHUNKER_VERSION = 2
+
     @staticmethod
     def _normalize_text(text: str) -> str:
+        """
+        Normaliza el texto a bloques separados por una línea en blanco.
+
+        Las líneas cortadas por el PDF se unen en un solo párrafo; los títulos
+        numerados y los ítems de lista conservan su propia línea.
+        """
         text = text.replace("\r\n", "\n").replace("\r", "\n")
-        text = re.sub(r"\n{3,}", "\n\n", text)
-        text = re.sub(r"[\t ]{2,}", " ", text)
-        return text.strip()
+        blocks: List[str] = []
+        current: List[str] = []
+        for raw_line in text.split("\n"):
+            line = re.sub(r"[\t ]{2,}", " ", raw_line).strip()
+            if not line:
+                if current:
+                    blocks.append(" ".join(current))
+                    current = []
+                continue
+            if is_heading(line):
+                if current:
+                    blocks.append(" ".join(current))
+                blocks.append(line)
+                current = []
+                continue
+            if current and _LIST_ITEM_PATTERN.match(line):
+                blocks.append(" ".join(current))
+                current = []
+            current.append(line)
+        if current:
+            blocks.append(" ".join(current))
+        return "\n\n".join(blocks)
+
+    @staticmethod
+    def _units(text: str, chunk_size: int) -> List[Tuple[int, int, bool]]:
+        """
+        Segmentos (inicio, fin, es_título) en que se puede cortar un chunk.
+
+        Son los bloques del texto normalizado; los que no caben en un chunk se
+        parten por oraciones y, si aun así no caben, en ventanas de `chunk_size`.
+        """
+        units: List[Tuple[int, int, bool]] = []
+        position = 0
+        for block in text.split("\n\n"):
+            start, end = position, position + len(block)
+            position = end + 2
+            if len(block) <= chunk_size:
+                units.append((start, end, is_heading(block)))
+                continue
+            sentence_start = start
+            for match in list(_SENTENCE_END_PATTERN.finditer(block)) + [None]:
+                sentence_end = start + match.start() if match else end
+                for window_start in range(sentence_start, sentence_end, chunk_size):
+                    units.append((window_start, min(window_start + chunk_size, sentence_end), False))
+                if match:
+                    sentence_start = start + match.end()
+        return units
 
     def split_text(self, text: str, chunk_size: int, chunk_overlap: int) -> List[DocumentChunk]:
+        """
+        Agrupa párrafos, ítems de lista y títulos completos en chunks de hasta `chunk_size`.
+
+        Un título numerado abre un chunk nuevo (sin overlap con la sección
+        anterior); en los demás cortes se repiten los últimos segmentos del chunk
+        previo hasta `chunk_overlap` caracteres.
+        """
         normalized = self._normalize_text(text)
         if not normalized:
             return []
 
-        chunks: List[DocumentChunk] = []
-        start = 0
-        text_len = len(normalized)
-        chunk_index = 0
-
-        while start < text_len:
-            max_end = min(start + chunk_size, text_len)
-            end = max_end
-
-            if max_end < text_len:
-                soft_break = normalized.rfind("\n", start + int(chunk_size * 0.6), max_end)
-                sentence_break = normalized.rfind(".", start + int(chunk_size * 0.6), max_end)
-                end = max(soft_break, sentence_break)
-                if end <= start:
-                    end = max_end
-
-            chunk_text = normalized[start:end].strip()
-            if chunk_text:
-                chunks.append(
-                    DocumentChunk(
-                        chunk_id=f"chunk_{chunk_index:05d}",
-                        text=chunk_text,
-                        metadata={
-                            "chunk_index": chunk_index,
-                            "start_char": start,
-                            "end_char": end,
-                        },
-                    )
-                )
-                chunk_index += 1
+        spans: List[Tuple[int, int]] = []
+        current: List[Tuple[int, int, bool]] = []
+        fresh = False
+        for unit in self._units(normalized, chunk_size):
+            unit_start, unit_end, heading = unit
+            if current and fresh:
+                too_long = unit_end - current[0][0] > chunk_size
+                # Títulos consecutivos quedan juntos en el chunk de su contenido
+                if (heading and not all(item[2] for item in current)) or too_long:
+                    # Un título al final del chunk pasa al siguiente junto con su contenido
+                    carried = [current.pop()] if current[-1][2] and len(current) > 1 else []
+                    if not all(item[2] for item in current):
+                        spans.append((current[0][0], current[-1][1]))
+                    if heading:
+                        current = carried
+                    else:
+                        overlap: List[Tuple[int, int, bool]] = []
+                        for item in reversed(current):
+                            if current[-1][1] - item[0] > chunk_overlap or item[2]:
+                                break
+                            overlap.insert(0, item)
+                        current = overlap + carried
+                        if current and unit_end - current[0][0] > chunk_size:
+                            current = carried
+                    fresh = bool(carried)
+            current.append(unit)
+            fresh = True
+        # Un título suelto al final de la página no aporta contenido: su sección
+        # ya queda en los metadatos de los chunks siguientes
+        if current and fresh and not all(item[2] for item in current):
+            spans.append((current[0][0], current[-1][1]))
 
-            if end >= text_len:
-                break
+        return [
+            DocumentChunk(
+                chunk_id=f"chunk_{chunk_index:05d}",
+                text=normalized[start:end],
+                metadata={"chunk_index": chunk_index, "start_char": start, "end_char": end},
+            )
+            for chunk_index, (start, end) in enumerate(spans)
+        ]
 
-            start = max(end - chunk_overlap, 0)
+    @staticmethod
+    def _line_key(line: str) -> str:
+        # Los números (página, fecha) varían entre páginas: se enmascaran
+        return re.sub(r"\d+", "#", " ".join(line.split())).lower()
 
-        return chunks
+    @classmethod
+    def _edge_lines(cls, text: str) -> List[str]:
+        lines = [line for line in text.split("\n") if line.strip()]
+        return lines[:_HEADER_LINES] + lines[-_FOOTER_LINES:]
+
+    @classmethod
+    def find_boilerplate(cls, pages: List[str]) -> Set[str]:
+        """Encabezados y pies de página repetidos en la mayoría de las páginas del documento."""
+        counts: Counter = Counter()
+        for text in pages:
+            counts.update({cls._line_key(line) for line in cls._edge_lines(text)})
+        min_pages = max(_BOILERPLATE_MIN_PAGES, math.ceil(len(pages) * _BOILERPLATE_RATIO))
+        return {key for key, count in counts.items() if key and count >= min_pages}
+
+    @classmethod
+    def strip_boilerplate(cls, text: str, boilerplate: Set[str]) -> str:
+        """Quita de las primeras/últimas líneas de la página las que son boilerplate."""
+        if not boilerplate:
+            return text
+        lines = text.split("\n")
+        content = [index for index, line in enumerate(lines) if line.strip()]
+        edges = set(content[:_HEADER_LINES] + content[-_FOOTER_LINES:])
+        return "\n".join(
+            line
+            for index, line in enumerate(lines)
+            if index not in edges or cls._line_key(line) not in boilerplate
+        )
 
     def load_and_chunk_pdf(self, file_path: Path, chunk_size: int, chunk_overlap: int) -> List[DocumentChunk]:
         text = self.extract_text_from_pdf(file_path)
         return self.split_text(text=text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    def iter_pages(self, documents: Dict[str, Path], workers: int = 1) -> Iterator[Tuple[str, int, int, str]]:
+        """
+        Recorre las páginas de varios documentos en orden: (fuente, página, total, texto).
+
+        Con `workers > 1` los PDFs se reparten por rangos de páginas en un pool de
+        procesos (`spawn`, seguro dentro del servidor). Las páginas se entregan a
+        medida que termina cada rango, de modo que un documento se puede dividir en
+        chunks mientras el resto se sigue extrayendo.
+        """
+        if workers <= 1:
+            for name, path in documents.items():
+                pages = self.extract_pages(path)
+                for page_number, text in pages:
+                    yield name, page_number, len(pages), text
+            return
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = []
+            for name, path in documents.items():
+                if path.suffix.lower() != ".pdf":
+                    pending.append((name, path, 1, None))
+                    continue
+                total = len(PdfReader(str(path)).pages)
+                futures = [
+                    pool.submit(_extract_pdf_page_range, (str(path), start, min(start + _PAGES_PER_TASK, total)))
+                    for start in range(0, total, _PAGES_PER_TASK)
+                ]
+                pending.append((name, path, total, futures))
+
+            for name, path, total, futures in pending:
+                if futures is None:
+                    for page_number, text in self.extract_pages(path):
+                        yield name, page_number, total, text
+                    continue
+                for future in futures:
+                    for page_number, text in future.result():
+                        yield name, page_number, total, text
+
+    def chunk_page(
+        self,
+        source_name: str,
+        page_number: int,
+        page_text: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        first_index: int = 0,
+        sections: SectionTracker | None = None,
+        boilerplate: Set[str] | None = None,
+    ) -> List[DocumentChunk]:
+        """
+        Divide una página en chunks.
+
+        Cada chunk lleva en sus metadatos el archivo de origen y la página, y su
+        id es estable mientras el documento no cambie (`<fuente>#p<página>-<n>`).
+        `first_index` continúa la numeración `chunk_index` del documento.
+        Con `sections` (un tracker por documento, alimentado en orden de página)
+        se agregan `section` y `topic` según los títulos detectados.
+        Las líneas de `boilerplate` (ver `find_boilerplate`) se descartan antes de dividir.
+        """
+        normalized = self._normalize_text(self.strip_boilerplate(page_text, boilerplate or set()))
+        if sections is not None:
+            sections.feed_page(normalized)
+        chunks: List[DocumentChunk] = []
+        for page_chunk in self.split_text(normalized, chunk_size=chunk_size, chunk_overlap=chunk_overlap):
+            metadata = dict(page_chunk.metadata)
+            metadata.update({"source": source_name, "page": page_number, "chunk_index": first_index + len(chunks)})
+            if sections is not None:
+                metadata.update(sections.section_at(metadata["start_char"]))
+            chunks.append(
+                DocumentChunk(
+                    chunk_id=f"{source_name}#p{page_number:04d}-{page_chunk.metadata['chunk_index']:03d}",
+                    text=page_chunk.text,
+                    metadata=metadata,
+                )
+            )
+        return chunks
+
+    def chunk_document(
+        self,
+        source_name: str,
+        pages: List[Tuple[int, str]],
+        chunk_size: int,
+        chunk_overlap: int,
+    ) -> List[DocumentChunk]:
+        """
+        Divide todas las páginas de un documento (ver `chunk_page`).
+
+        Los encabezados y pies repetidos se detectan sobre el documento completo
+        y la jerarquía de secciones se sigue de una página a la siguiente. Un
+        fragmento corto al inicio de una página (el final de un párrafo de la
+        anterior) se une al último chunk previo, que registra `end_page`.
+        """
+        boilerplate = self.find_boilerplate([text for _, text in pages])
+        sections = SectionTracker()
+        chunks: List[DocumentChunk] = []
+        for page_number, page_text in pages:
+            page_chunks = self.chunk_page(
+                source_name,
+                page_number,
+                page_text,
+                chunk_size,
+                chunk_overlap,
+                sections=sections,
+                boilerplate=boilerplate,
+            )
+            if chunks and page_chunks:
+                previous, first = chunks[-1], page_chunks[0]
+                if (
+                    first.metadata["start_char"] == 0
+                    and len(first.text) < chunk_size * _CONTINUATION_RATIO
+                    and len(previous.text) + len(first.text) + 2 <= chunk_size
+                    and previous.metadata.get("section") == first.metadata.get("section")
+                ):
+                    previous.text = f"{previous.text}\n\n{first.text}"
+                    previous.metadata["end_page"] = page_number
+                    page_chunks = page_chunks[1:]
+            for chunk in page_chunks:
+                chunk.metadata["chunk_index"] = len(chunks)
+                chunks.append(chunk)
+        return chunks
+
+    def load_and_chunk_document(
+        self,
+        file_path: Path,
+        source_name: str,
+        chunk_size: int,
+        chunk_overlap: int,
+    ) -> List[DocumentChunk]:
+        """Divide un documento página por página (ver `chunk_document`)."""
+        return self.chunk_document(source_name, self.extract_pages(file_path), chunk_size, chunk_overlap)
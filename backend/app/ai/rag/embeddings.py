@@ -2,35 +2,205 @@
 
 from __future__ import annotations
 
+import json
+import logging
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
-import joblib
+import numpy as np
 from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+from .index_storage import load_array, save_array, write_text
 
-class TfidfEmbeddingModel:
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingModel:
+    """
+    Interfaz de los modelos de embeddings del vector store.
+
+    `transform` retorna una matriz dispersa (TF-IDF) o un `np.ndarray` float32
+    con filas normalizadas (L2), de modo que el producto punto sea la similitud coseno.
+    """
+
+    provider = "base"
+    # Archivos que el modelo guarda en el directorio del índice
+    artifact_names: Tuple[str, ...] = ()
+    # True si los vectores de un texto no dependen del resto del corpus (se pueden reutilizar)
+    supports_incremental = False
+
+    def fit_transform(self, texts: List[str]):
+        raise NotImplementedError
+
+    def transform(self, texts: List[str]):
+        raise NotImplementedError
+
+    def save(self, index_dir: Path) -> None:
+        raise NotImplementedError
+
+    def load(self, index_dir: Path) -> None:
+        raise NotImplementedError
+
+
+class TfidfEmbeddingModel(EmbeddingModel):
     """Modelo de embeddings TF-IDF persistible."""
 
+    provider = "tfidf"
+    artifact_names = ("tfidf_vocabulary.json", "tfidf_idf.npy")
+
     def __init__(self, max_features: int = 20000):
-        self.vectorizer = TfidfVectorizer(
+        self.max_features = max_features
+        self.vectorizer = self._build_vectorizer()
+
+    def _build_vectorizer(self, vocabulary: dict | None = None) -> TfidfVectorizer:
+        return TfidfVectorizer(
             lowercase=True,
             ngram_range=(1, 2),
-            max_features=max_features,
+            max_features=self.max_features,
             strip_accents="unicode",
-            token_pattern=r"(?u)\\b\\w\\w+\\b",
+            token_pattern=r"(?u)\b\w\w+\b",
+            vocabulary=vocabulary,
         )
 
     def fit_transform(self, texts: List[str]) -> sparse.csr_matrix:
+        # Vectorizador nuevo: el cargado desde disco tiene el vocabulario fijo
+        self.vectorizer = self._build_vectorizer()
         return self.vectorizer.fit_transform(texts)
 
     def transform(self, texts: List[str]) -> sparse.csr_matrix:
         return self.vectorizer.transform(texts)
 
-    def save(self, file_path: Path) -> None:
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        joblib.dump(self.vectorizer, file_path)
+    def save(self, index_dir: Path) -> None:
+        # Vocabulario + idf en lugar de un pickle: se cargan sin deserializar objetos
+        index_dir.mkdir(parents=True, exist_ok=True)
+        vocabulary = {term: int(index) for term, index in self.vectorizer.vocabulary_.items()}
+        write_text(index_dir / "tfidf_vocabulary.json", json.dumps(vocabulary, ensure_ascii=False))
+        save_array(index_dir / "tfidf_idf.npy", self.vectorizer.idf_.astype(np.float64, copy=False))
+
+    def load(self, index_dir: Path) -> None:
+        vocabulary = json.loads((index_dir / "tfidf_vocabulary.json").read_text(encoding="utf-8"))
+        self.vectorizer = self._build_vectorizer(vocabulary)
+        self.vectorizer.idf_ = load_array(index_dir / "tfidf_idf.npy")
+
+
+class OnnxEmbeddingModel(EmbeddingModel):
+    """
+    Embeddings densos con un modelo sentence-transformer exportado a ONNX (solo CPU).
+
+    `model_dir` debe contener `model.onnx` y `tokenizer.json` (formato de
+    HuggingFace `tokenizers`), por ejemplo un export de
+    `paraphrase-multilingual-MiniLM-L12-v2`. Requiere `onnxruntime` y
+    `tokenizers`, que se importan solo al usar este proveedor.
+    """
+
+    provider = "onnx"
+    artifact_names = ("embedding_model.json",)
+    supports_incremental = True
 
-    def load(self, file_path: Path) -> None:
-        self.vectorizer = joblib.load(file_path)
+    def __init__(self, model_dir: Path, batch_size: int = 32, max_length: int = 256):
+        self.model_dir = model_dir
+        self.batch_size = max(batch_size, 1)
+        self.max_length = max_length
+        self._session = None
+        self._tokenizer = None
+        self._input_names: Tuple[str, ...] = ()
+        self.dimensions: int | None = None
+
+    def _ensure_session(self) -> None:
+        if self._session is not None:
+            return
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as exc:
+            raise RuntimeError(
+                "RAG_EMBEDDING_PROVIDER=onnx requiere los paquetes 'onnxruntime' y 'tokenizers'"
+            ) from exc
+
+        model_path = self.model_dir / "model.onnx"
+        tokenizer_path = self.model_dir / "tokenizer.json"
+        if not model_path.exists() or not tokenizer_path.exists():
+            raise FileNotFoundError(f"No se encontró model.onnx/tokenizer.json en {self.model_dir}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = tuple(item.name for item in self._session.get_inputs())
+
+        tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        tokenizer.enable_truncation(max_length=self.max_length)
+        tokenizer.enable_padding()
+        self._tokenizer = tokenizer
+        logger.info("Modelo de embeddings ONNX cargado desde %s", self.model_dir)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.asarray([item.ids for item in encodings], dtype=np.int64)
+        attention_mask = np.asarray([item.attention_mask for item in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        feeds = {name: value for name, value in feeds.items() if name in self._input_names}
+
+        outputs = self._session.run(None, feeds)
+        hidden = outputs[0]
+        if hidden.ndim == 3:
+            # Mean pooling sobre los tokens reales (sin padding)
+            mask = attention_mask[..., None].astype(np.float32)
+            hidden = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        vectors = hidden.astype(np.float32, copy=False)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+    def _encode(self, texts: List[str], log_progress: bool = False) -> np.ndarray:
+        self._ensure_session()
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            batches.append(self._encode_batch(texts[start:start + self.batch_size]))
+            if log_progress:
+                logger.info("Embeddings ONNX: %s/%s chunks", min(start + self.batch_size, len(texts)), len(texts))
+        if not batches:
+            return np.zeros((0, self.dimensions or 0), dtype=np.float32)
+        vectors = np.vstack(batches)
+        self.dimensions = vectors.shape[1]
+        return vectors
+
+    def transform(self, texts: List[str]) -> np.ndarray:
+        return self._encode(texts)
+
+    def fit_transform(self, texts: List[str]) -> np.ndarray:
+        # Modelo preentrenado: no hay ajuste, solo codificación por lotes.
+        return self._encode(texts, log_progress=True)
+
+    def save(self, index_dir: Path) -> None:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        write_text(
+            index_dir / "embedding_model.json",
+            json.dumps({"model_dir": str(self.model_dir), "dimensions": self.dimensions}),
+        )
+
+    def load(self, index_dir: Path) -> None:
+        data = json.loads((index_dir / "embedding_model.json").read_text(encoding="utf-8"))
+        if Path(data.get("model_dir", "")) != self.model_dir:
+            logger.warning(
+                "El índice RAG se construyó con %s y la configuración apunta a %s",
+                data.get("model_dir"),
+                self.model_dir,
+            )
+        self.dimensions = data.get("dimensions")
+
+
+def create_embedding_model(config) -> EmbeddingModel:
+    """Crea el modelo de embeddings según `RAG_EMBEDDING_PROVIDER`."""
+    if config.embedding_provider == "onnx":
+        return OnnxEmbeddingModel(
+            model_dir=config.embedding_model_dir,
+            batch_size=config.embedding_batch_size,
+        )
+    if config.embedding_provider != "tfidf":
+        logger.warning("Proveedor de embeddings desconocido '%s', usando tfidf", config.embedding_provider)
+    return TfidfEmbeddingModel()
@@ -0,0 +1,136 @@
+"""
+Formato en disco del índice RAG pensado para memory-mapping.
+
+Las matrices se guardan como `.npy` crudos y se abren con `np.load(mmap_mode="r")`:
+los workers de uvicorn comparten las páginas vía el cache del sistema operativo
+y la carga no descomprime ni copia datos. El texto de los chunks vive en un único
+blob UTF-8 indexado por offsets; solo se decodifica el chunk que se lee.
+
+Las escrituras van a un archivo temporal y se publican con `os.replace`, de modo
+que un worker con el índice anterior mapeado sigue leyendo el archivo viejo.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from scipy import sparse
+
+from .document_processor import DocumentChunk
+
+# Se incrementa cuando cambia el formato en disco: índices con otra versión se reconstruyen
+INDEX_FORMAT_VERSION = 3
+
+
+def _replace_atomically(path: Path, write) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as handle:
+        write(handle)
+    os.replace(tmp_path, path)
+
+
+def save_array(path: Path, array: np.ndarray) -> None:
+    _replace_atomically(path, lambda handle: np.save(handle, np.ascontiguousarray(array)))
+
+
+def load_array(path: Path) -> np.ndarray:
+    return np.load(path, mmap_mode="r")
+
+
+def write_text(path: Path, text: str) -> None:
+    _replace_atomically(path, lambda handle: handle.write(text.encode("utf-8")))
+
+
+def csr_files(index_dir: Path, name: str) -> List[Path]:
+    return [index_dir / f"{name}_{part}.npy" for part in ("data", "indices", "indptr", "shape")]
+
+
+def save_csr(index_dir: Path, name: str, matrix: sparse.csr_matrix) -> None:
+    matrix = matrix.tocsr()
+    data_file, indices_file, indptr_file, shape_file = csr_files(index_dir, name)
+    save_array(data_file, matrix.data.astype(np.float32, copy=False))
+    # scipy exige el mismo dtype en indices e indptr; si difieren, copia al cargar
+    save_array(indices_file, matrix.indices)
+    save_array(indptr_file, matrix.indptr)
+    save_array(shape_file, np.asarray(matrix.shape, dtype=np.int64))
+
+
+def load_csr(index_dir: Path, name: str) -> sparse.csr_matrix:
+    """Arma una CSR sobre los arrays mapeados, sin copiarlos."""
+    data_file, indices_file, indptr_file, shape_file = csr_files(index_dir, name)
+    shape = tuple(int(value) for value in np.load(shape_file))
+    return sparse.csr_matrix(
+        (load_array(data_file), load_array(indices_file), load_array(indptr_file)),
+        shape=shape,
+        copy=False,
+    )
+
+
+class MappedChunks(Sequence):
+    """Chunks respaldados por un blob de texto mapeado en memoria."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, chunk_ids: List[str], metadata: List[dict]):
+        self._blob = blob
+        self._offsets = offsets
+        self._chunk_ids = chunk_ids
+        self._metadata = metadata
+
+    @classmethod
+    def files(cls, index_dir: Path) -> List[Path]:
+        return [index_dir / "chunks.bin", index_dir / "chunk_offsets.npy", index_dir / "chunk_meta.json"]
+
+    @classmethod
+    def save(cls, index_dir: Path, chunks: List[DocumentChunk]) -> None:
+        blob_file, offsets_file, meta_file = cls.files(index_dir)
+        encoded = [chunk.text.encode("utf-8") for chunk in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+
+        _replace_atomically(blob_file, lambda handle: handle.writelines(encoded))
+        save_array(offsets_file, offsets)
+        write_text(
+            meta_file,
+            json.dumps(
+                {
+                    "chunk_ids": [chunk.chunk_id for chunk in chunks],
+                    "metadata": [chunk.metadata for chunk in chunks],
+                },
+                ensure_ascii=False,
+            ),
+        )
+
+    @classmethod
+    def load(cls, index_dir: Path) -> "MappedChunks":
+        blob_file, offsets_file, meta_file = cls.files(index_dir)
+        meta: Dict[str, list] = json.loads(meta_file.read_text(encoding="utf-8"))
+        # np.memmap no admite archivos vacíos
+        blob = np.memmap(blob_file, dtype=np.uint8, mode="r") if blob_file.stat().st_size else np.zeros(0, np.uint8)
+        return cls(blob, load_array(offsets_file), meta["chunk_ids"], meta["metadata"])
+
+    def __len__(self) -> int:
+        return len(self._chunk_ids)
+
+    @property
+    def metadata(self) -> List[dict]:
+        return self._metadata
+
+    def text(self, index: int) -> str:
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        return DocumentChunk(
+            chunk_id=self._chunk_ids[index],
+            text=self.text(index),
+            metadata=self._metadata[index],
+        )
@@ -0,0 +1,91 @@
+"""
+Cache LRU de resultados de recuperación RAG.
+
+La clave es la consulta normalizada (minúsculas, sin tildes ni signos, espacios
+colapsados), el tema del tab y la versión del índice: preguntas repetidas o casi idénticas
+("¿Qué es la cadena de valor?" / "que es la cadena de valor") no vuelven a
+vectorizar ni a puntuar la matriz. Al reconstruir o recargar el índice cambia
+su versión, por lo que las entradas anteriores dejan de coincidir.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import List, Optional, Tuple
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_query(query: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", query.lower())
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_WORD_PATTERN.findall(without_accents))
+
+
+@dataclass
+class CachedRetrieval:
+    """Hits rankeados y, si ya se pidió, el bloque de contexto formateado."""
+
+    hits: List[dict]
+    context: Optional[str] = None
+
+
+class RAGQueryCache:
+    """LRU en memoria, seguro entre threads (`max_entries=0` lo deshabilita)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, int], CachedRetrieval]" = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(query: str, index_version: int, topic: Optional[str] = None) -> Tuple[str, str, int]:
+        return normalize_query(query), topic or "", index_version
+
+    def get(self, key: Tuple[str, str, int]) -> Optional[CachedRetrieval]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def set(self, key: Tuple[str, str, int], entry: CachedRetrieval) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+        return removed
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+        }
@@ -4,16 +4,26 @@ from __future__ import annotations
 
 import logging
 from pathlib import Path
-from threading import Lock
-from time import perf_counter
-from typing import List
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+from typing import Dict, List, Tuple
 
 from .config import RAGConfig
-from .document_processor import DocumentProcessor
+from .corpus import CorpusManifest, discover_documents
+from .document_processor import DocumentChunk, DocumentProcessor
+from .embeddings import create_embedding_model
+from .query_cache import CachedRetrieval, RAGQueryCache
+from .reranker import create_rerank_stage
+from .sections import topic_for_tab
 from .vector_store import LocalVectorStore
 
 logger = logging.getLogger(__name__)
 
+# Cada cuántas páginas se registra el avance de la extracción
+_PROGRESS_EVERY_PAGES = 50
+# Espera mínima antes de reintentar un warm-up fallido desde un request
+_WARM_UP_RETRY_SECONDS = 60.0
+
 
 class RAGManager:
     """Gestiona ciclo de vida del índice y retrieval para prompts."""
@@ -21,9 +31,135 @@ class RAGManager:
     def __init__(self, config: RAGConfig | None = None):
         self.config = config or RAGConfig.from_env()
         self.processor = DocumentProcessor()
-        self.vector_store = LocalVectorStore(index_dir=self.config.index_dir)
+        self.vector_store = self._create_vector_store()
+        self.query_cache = RAGQueryCache(max_entries=self.config.query_cache_size)
+        self.rerank_stage = create_rerank_stage(self.config)
         self._ready = False
         self._lock = Lock()
+        # pending -> warming -> ready | failed (disabled si RAG_ENABLED=false)
+        self._state = "pending" if self.config.enabled else "disabled"
+        self._error: str | None = None
+        self._warm_up_thread: Thread | None = None
+        self._warm_up_started_at = 0.0
+        self._state_lock = Lock()
+
+    def _create_vector_store(self) -> LocalVectorStore:
+        return LocalVectorStore(
+            index_dir=self.config.index_dir,
+            embedding_model=create_embedding_model(self.config),
+            quantization=self.config.embedding_quantization,
+            retrieval_mode=self.config.retrieval_mode,
+            rrf_k=self.config.rrf_k,
+            bm25_min_score=self.config.bm25_min_score,
+            section_mode=self.config.section_mode,
+            section_boost=self.config.section_boost,
+        )
+
+    def _manifest(self) -> CorpusManifest:
+        return CorpusManifest(
+            self.config.index_dir / "manifest.json",
+            chunking={
+                "chunk_size": self.config.chunk_size,
+                "chunk_overlap": self.config.chunk_overlap,
+                "chunker": DocumentProcessor.CHUNKER_VERSION,
+            },
+        ).load()
+
+    def _chunk_documents(
+        self, names: List[str], documents: Dict[str, Path], manifest: CorpusManifest
+    ) -> Tuple[List[DocumentChunk], int]:
+        """
+        Extrae (en paralelo) y divide en chunks los documentos indicados.
+
+        Returns:
+            Chunks en orden de documento y número de páginas procesadas
+        """
+        chunks_by_document: Dict[str, List[DocumentChunk]] = {name: [] for name in names}
+        # Las páginas de cada documento se acumulan hasta completarlo: los encabezados
+        # repetidos se detectan sobre el documento entero
+        pages_by_document: Dict[str, List[Tuple[int, str]]] = {name: [] for name in names}
+        pages_done = 0
+        for name, page_number, total_pages, text in self.processor.iter_pages(
+            {name: documents[name] for name in names},
+            workers=self.config.extraction_workers,
+        ):
+            pages_by_document[name].append((page_number, text))
+            pages_done += 1
+            if page_number == total_pages:
+                chunks_by_document[name] = self.processor.chunk_document(
+                    name,
+                    pages_by_document.pop(name),
+                    chunk_size=self.config.chunk_size,
+                    chunk_overlap=self.config.chunk_overlap,
+                )
+                logger.info(
+                    "Documento RAG procesado: %s (%s páginas, %s chunks)", name, total_pages, len(chunks_by_document[name])
+                )
+            elif pages_done % _PROGRESS_EVERY_PAGES == 0:
+                logger.info("Extracción RAG: %s página %s/%s", name, page_number, total_pages)
+
+        for name in names:
+            manifest.record(name, documents[name], [chunk.chunk_id for chunk in chunks_by_document[name]])
+        return [chunk for name in names for chunk in chunks_by_document[name]], pages_done
+
+    def _sync_index(self, store: LocalVectorStore, force_rebuild: bool = False) -> None:
+        """
+        Sincroniza `store` con el corpus.
+
+        Solo se leen y codifican los documentos nuevos o cuyo hash cambió; los
+        chunks de documentos eliminados se quitan del índice.
+        """
+        documents = discover_documents(self.config)
+        if not documents:
+            logger.warning(
+                "No hay documentos para RAG en %s ni en %s",
+                self.config.source_dir,
+                self.config.source_document_path,
+            )
+            return
+
+        manifest = self._manifest()
+        if force_rebuild or not store.exists():
+            manifest.clear()
+        changes = manifest.diff(documents)
+
+        full_build = not manifest.documents
+        if full_build:
+            logger.info("Construyendo índice RAG con %s documentos", len(documents))
+        else:
+            logger.info("Cargando índice RAG existente desde %s", self.config.index_dir)
+            store.load()
+            if not changes.has_changes:
+                return
+            logger.info("Actualizando índice RAG | %s", changes.summary())
+
+        keep_ids = set(manifest.chunk_ids(changes.unchanged))
+        for name in changes.removed:
+            manifest.forget(name)
+
+        extract_start = perf_counter()
+        new_chunks, pages = self._chunk_documents(changes.to_index, documents, manifest)
+        extract_ms = (perf_counter() - extract_start) * 1000
+
+        embed_start = perf_counter()
+        if full_build:
+            store.build(new_chunks)
+            encoded = len(new_chunks)
+        else:
+            encoded = store.update(keep_ids, new_chunks)
+        embed_ms = (perf_counter() - embed_start) * 1000
+        manifest.save()
+
+        logger.info(
+            "⏱️ RAG index timing | documents=%s pages=%s chunks=%s encoded=%s workers=%s extract_ms=%.1f embed_ms=%.1f",
+            len(changes.to_index),
+            pages,
+            len(keep_ids) + len(new_chunks),
+            encoded,
+            self.config.extraction_workers,
+            extract_ms,
+            embed_ms,
+        )
 
     def _index_if_needed(self) -> None:
         if not self.config.enabled:
@@ -34,101 +170,231 @@ class RAGManager:
         with self._lock:
             if self._ready:
                 return
+            # Aún no hay búsquedas sobre este store (`_ready` es False): se indexa en el lugar
+            self._sync_index(self.vector_store, force_rebuild=self.config.auto_reindex)
+            self._ready = True
 
-            if not self.config.source_document_path.exists():
-                logger.warning(
-                    "Documento fuente de RAG no encontrado en %s",
-                    self.config.source_document_path,
-                )
-                self._ready = True
-                return
+    def warm_up(self) -> None:
+        """
+        Prepara el índice (bloqueante): indexa o carga el corpus y ejecuta una
+        búsqueda de prueba para traer a memoria las páginas mapeadas.
+        """
+        if not self.config.enabled:
+            return
+        start = perf_counter()
+        self._state = "warming"
+        try:
+            self._index_if_needed()
+            self.vector_store.similarity_search("proyecto", top_k=1, min_similarity=0.0)
+            self._state, self._error = "ready", None
+            logger.info("⏱️ RAG warm-up timing | total_ms=%.1f", (perf_counter() - start) * 1000)
+        except Exception as exc:
+            self._state, self._error = "failed", str(exc)
+            logger.warning("No fue posible precalentar el índice RAG: %s", exc, exc_info=True)
 
-            should_rebuild = self.config.auto_reindex or (not self.vector_store.exists())
+    def start_warm_up(self) -> bool:
+        """
+        Lanza `warm_up` en un hilo de fondo (una sola vez a la vez).
 
-            if should_rebuild:
-                logger.info("Construyendo índice RAG desde %s", self.config.source_document_path)
-                chunks = self.processor.load_and_chunk_pdf(
-                    file_path=self.config.source_document_path,
-                    chunk_size=self.config.chunk_size,
-                    chunk_overlap=self.config.chunk_overlap,
-                )
-                self.vector_store.build(chunks)
-                logger.info("Índice RAG generado con %s chunks", len(chunks))
-            else:
-                logger.info("Cargando índice RAG existente desde %s", self.config.index_dir)
-                self.vector_store.load()
+        Returns:
+            True si se inició un nuevo warm-up
+        """
+        if not self.config.enabled:
+            return False
+        with self._state_lock:
+            if self._ready or (self._warm_up_thread is not None and self._warm_up_thread.is_alive()):
+                return False
+            if self._state == "failed" and monotonic() - self._warm_up_started_at < _WARM_UP_RETRY_SECONDS:
+                return False
+            self._warm_up_started_at = monotonic()
+            self._state = "warming"
+            self._warm_up_thread = Thread(target=self.warm_up, name="rag-warm-up", daemon=True)
+            self._warm_up_thread.start()
+            return True
 
-            self._ready = True
+    @property
+    def is_ready(self) -> bool:
+        """True si el índice está cargado y se puede consultar sin bloquear."""
+        return self.config.enabled and self._ready
 
-    def get_relevant_context(self, query: str) -> str:
-        if not query:
-            return ""
+    def _ready_nowait(self) -> bool:
+        """Como `is_ready`, pero si el índice no está listo inicia el warm-up en segundo plano."""
+        if self.is_ready:
+            return True
+        self.start_warm_up()
+        return False
+
+    def status(self) -> dict:
+        """Estado del índice para `/health`."""
+        return {
+            "enabled": self.config.enabled,
+            "ready": self.is_ready,
+            "state": self._state,
+            "chunks": self.vector_store.chunk_count if self.is_ready else 0,
+            "index_version": self.vector_store.version,
+            "error": self._error,
+            "query_cache": self.query_cache.stats(),
+            "reranker": self.rerank_stage.stats() if self.rerank_stage is not None else None,
+        }
+
+    CONTEXT_HEADER = "Contexto recuperado (RAG) de los documentos de referencia:"
+
+    def _retrieve_entry(self, query: str, tab: str | None = None) -> CachedRetrieval | None:
+        """Hits de la consulta desde el cache LRU o desde el vector store (None si RAG no está disponible)."""
+        if not query or not self.config.enabled:
+            return None
+        if not self._ready_nowait():
+            # No se bloquea el request esperando el índice: se responde sin contexto RAG
+            logger.info("⏱️ RAG timing | ready=false state=%s hits=0", self._state)
+            return None
 
         total_start = perf_counter()
+        # Una sola referencia por consulta: `_resync` puede publicar otro store mientras tanto
+        store = self.vector_store
         try:
-            index_start = perf_counter()
-            self._index_if_needed()
-            index_ms = (perf_counter() - index_start) * 1000
-            if not self.config.enabled:
-                return ""
-
-            search_start = perf_counter()
-            results = self.vector_store.similarity_search(
-                query=query,
-                top_k=self.config.top_k,
-                min_similarity=self.config.min_similarity,
-            )
-            search_ms = (perf_counter() - search_start) * 1000
-
-            if not results:
-                total_ms = (perf_counter() - total_start) * 1000
-                logger.info(
-                    "⏱️ RAG timing | enabled=%s index_ms=%.1f search_ms=%.1f total_ms=%.1f hits=0",
-                    self.config.enabled,
-                    index_ms,
-                    search_ms,
-                    total_ms,
-                )
-                return ""
-
-            blocks: List[str] = ["Contexto recuperado (RAG) del documento conceptual:"]
-            for item in results:
-                start_char = item.get("metadata", {}).get("start_char", "?")
-                score = item.get("score", 0.0)
-                blocks.append(
-                    f"- Fuente: manual_conceptual_2015.pdf | chunk={item['chunk_id']} | start_char={start_char} | similitud={score:.3f}\n"
-                    f"  {item['text']}"
+            topic = topic_for_tab(tab)
+            cache_key = self.query_cache.key(query, store.version, topic)
+            entry = self.query_cache.get(cache_key)
+            cache_status = "hit" if entry is not None else ("miss" if self.query_cache.enabled else "off")
+            search_ms = 0.0
+            if entry is None:
+                search_start = perf_counter()
+                hits = store.similarity_search(
+                    query=query,
+                    top_k=max(self.config.rerank_candidates, self.config.top_k)
+                    if self.rerank_stage is not None
+                    else self.config.top_k,
+                    min_similarity=self.config.min_similarity,
+                    topic=topic,
                 )
-
-            merged = "\n".join(blocks)
-            final_context = merged[: self.config.max_context_chars]
+                rerank_status = "off"
+                if self.rerank_stage is not None:
+                    hits, rerank_status = self.rerank_stage.apply(query, hits, fallback_k=self.config.top_k)
+                entry = CachedRetrieval(hits=hits)
+                search_ms = (perf_counter() - search_start) * 1000
+                # Sin reranking (breaker abierto o fallo) no se cachea: la próxima vez se reintenta
+                if rerank_status in {"off", "ok", "over_budget"}:
+                    self.query_cache.set(cache_key, entry)
             total_ms = (perf_counter() - total_start) * 1000
             logger.info(
-                "⏱️ RAG timing | enabled=%s index_ms=%.1f search_ms=%.1f total_ms=%.1f hits=%s context_chars=%s",
-                self.config.enabled,
-                index_ms,
+                "⏱️ RAG timing | ready=true topic=%s search_ms=%.1f total_ms=%.1f hits=%s cache=%s cache_hits=%s cache_misses=%s",
+                topic or "-",
                 search_ms,
                 total_ms,
-                len(results),
-                len(final_context),
+                len(entry.hits),
+                cache_status,
+                self.query_cache.hits,
+                self.query_cache.misses,
             )
-            return final_context
+            return entry
         except Exception as exc:
             total_ms = (perf_counter() - total_start) * 1000
             logger.warning("⏱️ RAG timing fallo | total_ms=%.1f", total_ms)
             logger.warning("No fue posible recuperar contexto RAG: %s", exc, exc_info=True)
+            return None
+
+    def retrieve(self, query: str, tab: str | None = None) -> List[dict]:
+        """
+        Recupera los chunks más similares a la consulta.
+
+        Si el tab tiene sección propia en el manual (`sections.topic_for_tab`),
+        sus chunks se priorizan o se buscan solo ahí según `RAG_SECTION_MODE`.
+
+        Nunca espera al índice: mientras no esté listo (`is_ready`) retorna una
+        lista vacía y dispara el warm-up en segundo plano si hacía falta.
+        Las consultas repetidas se resuelven desde el cache LRU.
+
+        Returns:
+            Lista de hits (chunk_id, text, score, metadata) ordenada por relevancia
+        """
+        entry = self._retrieve_entry(query, tab)
+        return list(entry.hits) if entry is not None else []
+
+    @staticmethod
+    def format_hit(item: dict) -> str:
+        """Formatea un hit como bloque de contexto con su fuente."""
+        metadata = item.get("metadata", {})
+        source = metadata.get("source", "desconocida")
+        page = metadata.get("page", "?")
+        if metadata.get("end_page"):
+            page = f"{page}-{metadata['end_page']}"
+        score = item.get("rerank_score", item.get("score", 0.0))
+        section = f" | sección={metadata['section']}" if metadata.get("section") else ""
+        return (
+            f"- Fuente: {source} | página={page}{section} | chunk={item['chunk_id']} | relevancia={score:.3f}\n"
+            f"  {item['text']}"
+        )
+
+    def get_relevant_context(self, query: str, tab: str | None = None) -> str:
+        """
+        Contexto RAG como texto, limitado a `max_context_chars`.
+
+        Retorna "" sin bloquear si el índice aún no está listo (ver `is_ready`).
+
+        Se descartan chunks completos (los de menor relevancia primero) en lugar
+        de cortar el texto a la mitad. El texto formateado queda en el cache
+        junto con los hits.
+        """
+        entry = self._retrieve_entry(query, tab)
+        if entry is None or not entry.hits:
             return ""
+        if entry.context is not None:
+            return entry.context
 
-    def rebuild_index(self) -> None:
-        """Reconstruye índice forzando nueva lectura/chunking/embeddings."""
+        blocks: List[str] = [self.CONTEXT_HEADER]
+        used = len(self.CONTEXT_HEADER)
+        for item in entry.hits:
+            block = self.format_hit(item)
+            if used + len(block) + 1 > self.config.max_context_chars:
+                break
+            blocks.append(block)
+            used += len(block) + 1
+        entry.context = "\n".join(blocks) if len(blocks) > 1 else ""
+        return entry.context
+
+    @property
+    def index_version(self) -> int:
+        """Versión del índice cargado (cambia en cada build/load)."""
+        return self.vector_store.version
+
+    def encode_queries(self, texts: List[str]):
+        """Vectoriza textos con el modelo de embeddings del índice (None si RAG no está disponible)."""
+        if not self.config.enabled or not texts or not self._ready_nowait():
+            return None
+        return self.vector_store.transform(texts)
+
+    def _resync(self, force_rebuild: bool) -> None:
+        """
+        Reindexa sobre un vector store nuevo y lo publica al terminar.
+
+        Las búsquedas en curso (otros threads) siguen usando el store anterior,
+        que nunca se modifica; sus archivos mapeados siguen válidos porque el
+        índice se escribe con reemplazos atómicos.
+        """
         with self._lock:
-            self._ready = False
-            if self.config.source_document_path.exists():
-                chunks = self.processor.load_and_chunk_pdf(
-                    file_path=self.config.source_document_path,
-                    chunk_size=self.config.chunk_size,
-                    chunk_overlap=self.config.chunk_overlap,
-                )
-                self.vector_store.build(chunks)
-                self._ready = True
-                logger.info("Índice RAG reconstruido con %s chunks", len(chunks))
+            current = self.vector_store
+            store = self._create_vector_store()
+            # La versión sigue creciendo: las entradas de cache del store anterior no se confunden
+            store.version = current.version
+            try:
+                self._sync_index(store, force_rebuild=force_rebuild)
+            except Exception as exc:
+                self._state, self._error = "failed", str(exc)
+                raise
+            if store.version == current.version:
+                # Sin documentos no se cargó nada: se conserva el store vigente
+                return
+            self.vector_store = store
+            self._ready = True
+            self._state, self._error = "ready", None
+            # Las entradas viejas ya no coinciden con la versión nueva; se libera su memoria
+            self.query_cache.clear()
+
+    def rebuild_index(self) -> None:
+        """Reconstruye índice forzando nueva lectura/chunking/embeddings de todo el corpus."""
+        self._resync(force_rebuild=True)
+        logger.info("Índice RAG reconstruido")
+
+    def sync_index(self) -> None:
+        """Reindexa solo los documentos agregados, modificados o eliminados del corpus."""
+        self._resync(force_rebuild=False)
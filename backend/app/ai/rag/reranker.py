@@ -0,0 +1,304 @@
+"""
+Segunda etapa de ranking para los hits del RAG.
+
+`similarity_search` sobre-recupera candidatos; el reranker los puntúa de nuevo
+frente a la consulta y se conservan solo los `top_n` más relevantes, de modo que
+el prompt lleve pocos chunks muy pertinentes en lugar de varios mediocres.
+
+- `lexical`: cobertura de los términos de la consulta (ponderados por su rareza
+  dentro de los candidatos) y de sus bigramas; sub-milisegundo
+- `onnx`: cross-encoder exportado a ONNX (solo CPU), más preciso y más costoso
+
+Cada llamada tiene un presupuesto de latencia. Las llamadas que lo exceden o
+fallan abren un circuit breaker: mientras está abierto se omite el reranking
+y se usan los primeros `top_k` hits de la primera etapa.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from pathlib import Path
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import List, Tuple
+
+import numpy as np
+
+from .query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+_STOPWORDS = frozenset(
+    "que como cual cuales cuando donde para por con sin sobre entre desde hasta los las del una uno unos unas "
+    "este esta estos estas ese esa esos esas son ser fue han hay mas muy tambien pero porque segun cada debe "
+    "deben puede pueden sus les nos the and".split()
+)
+
+
+class RerankTimeout(RuntimeError):
+    """El reranker agotó su presupuesto de latencia antes de puntuar todos los candidatos."""
+
+
+def _terms(text: str) -> List[str]:
+    return [term for term in normalize_query(text).split() if len(term) > 2 and term not in _STOPWORDS]
+
+
+class Reranker:
+    """Interfaz de los rerankers: un puntaje por hit (mayor es más relevante)."""
+
+    name = "base"
+
+    def scores(self, query: str, hits: List[dict], deadline: float) -> np.ndarray:
+        raise NotImplementedError
+
+
+class LexicalReranker(Reranker):
+    """Reranker léxico: cobertura ponderada de términos y bigramas de la consulta."""
+
+    name = "lexical"
+
+    def scores(self, query: str, hits: List[dict], deadline: float) -> np.ndarray:
+        query_terms = list(dict.fromkeys(_terms(query)))
+        if not query_terms or not hits:
+            return np.zeros(len(hits), dtype=np.float32)
+        query_bigrams = set(zip(query_terms, query_terms[1:]))
+
+        documents = []
+        for hit in hits:
+            terms = _terms(hit["text"])
+            documents.append((set(terms), set(zip(terms, terms[1:]))))
+
+        # Rareza local: un término presente en todos los candidatos no los distingue
+        weights = {
+            term: math.log(1.0 + len(hits) / (1.0 + sum(term in document for document, _ in documents)))
+            for term in query_terms
+        }
+        total_weight = sum(weights.values()) or 1.0
+
+        scores = np.zeros(len(hits), dtype=np.float32)
+        for position, (document_terms, document_bigrams) in enumerate(documents):
+            coverage = sum(weight for term, weight in weights.items() if term in document_terms) / total_weight
+            bigrams = len(query_bigrams & document_bigrams) / len(query_bigrams) if query_bigrams else 0.0
+            # El orden de la primera etapa desempata entre chunks con la misma cobertura
+            prior = 1.0 - position / len(hits)
+            scores[position] = 0.6 * coverage + 0.3 * bigrams + 0.1 * prior
+        return scores
+
+
+class OnnxCrossEncoderReranker(Reranker):
+    """
+    Cross-encoder exportado a ONNX (por ejemplo `mmarco-mMiniLMv2-L12-H384-v1`).
+
+    `model_dir` debe contener `model.onnx` y `tokenizer.json`. Requiere
+    `onnxruntime` y `tokenizers`, que se importan solo al usar este reranker.
+    Puntúa por lotes y lanza `RerankTimeout` si se agota el plazo entre lotes.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir: Path, batch_size: int = 8, max_length: int = 384):
+        self.model_dir = model_dir
+        self.batch_size = max(batch_size, 1)
+        self.max_length = max_length
+        self._session = None
+        self._tokenizer = None
+        self._input_names: Tuple[str, ...] = ()
+        self._lock = Lock()
+
+    def _ensure_session(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                return
+            try:
+                import onnxruntime as ort
+                from tokenizers import Tokenizer
+            except ImportError as exc:
+                raise RuntimeError("RAG_RERANKER=onnx requiere los paquetes 'onnxruntime' y 'tokenizers'") from exc
+
+            model_path = self.model_dir / "model.onnx"
+            tokenizer_path = self.model_dir / "tokenizer.json"
+            if not model_path.exists() or not tokenizer_path.exists():
+                raise FileNotFoundError(f"No se encontró model.onnx/tokenizer.json en {self.model_dir}")
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+            self._input_names = tuple(item.name for item in session.get_inputs())
+
+            tokenizer = Tokenizer.from_file(str(tokenizer_path))
+            tokenizer.enable_truncation(max_length=self.max_length)
+            tokenizer.enable_padding()
+            self._tokenizer = tokenizer
+            self._session = session
+            logger.info("Reranker cross-encoder ONNX cargado desde %s", self.model_dir)
+
+    def _score_batch(self, query: str, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch([(query, text) for text in texts])
+        feeds = {
+            "input_ids": np.asarray([item.ids for item in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([item.attention_mask for item in encodings], dtype=np.int64),
+            "token_type_ids": np.asarray([item.type_ids for item in encodings], dtype=np.int64),
+        }
+        feeds = {name: value for name, value in feeds.items() if name in self._input_names}
+        logits = np.asarray(self._session.run(None, feeds)[0], dtype=np.float32)
+        if logits.ndim == 2 and logits.shape[1] > 1:
+            # Clasificador binario: probabilidad de la clase "relevante"
+            exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+            return exp[:, 1] / exp.sum(axis=1)
+        return 1.0 / (1.0 + np.exp(-logits.reshape(-1)))
+
+    def scores(self, query: str, hits: List[dict], deadline: float) -> np.ndarray:
+        self._ensure_session()
+        texts = [hit["text"] for hit in hits]
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            if batches and perf_counter() > deadline:
+                raise RerankTimeout(f"reranking interrumpido tras {start}/{len(texts)} candidatos")
+            batches.append(self._score_batch(query, texts[start:start + self.batch_size]))
+        return np.concatenate(batches) if batches else np.zeros(0, dtype=np.float32)
+
+
+class CircuitBreaker:
+    """
+    Breaker de fallos consecutivos.
+
+    Tras `failure_threshold` fallos seguidos se abre durante `cooldown_seconds`;
+    luego deja pasar una llamada de prueba (half-open) que lo cierra si tiene éxito.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.cooldown_seconds = cooldown_seconds
+        self.failures = 0
+        self.trips = 0
+        self._opened_at: float | None = None
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if monotonic() - self._opened_at >= self.cooldown_seconds else "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._opened_at is not None or self.failures >= self.failure_threshold:
+                # Un fallo en half-open vuelve a abrirlo por otro periodo completo
+                if self._opened_at is None:
+                    self.trips += 1
+                self._opened_at = monotonic()
+
+
+class RerankStage:
+    """Aplica un `Reranker` a los candidatos con presupuesto de latencia y circuit breaker."""
+
+    def __init__(
+        self,
+        reranker: Reranker,
+        top_n: int,
+        min_score: float,
+        budget_ms: float,
+        breaker: CircuitBreaker,
+    ):
+        self.reranker = reranker
+        self.top_n = max(top_n, 1)
+        self.min_score = min_score
+        self.budget_ms = budget_ms
+        self.breaker = breaker
+        self.counts = {"ok": 0, "over_budget": 0, "timeout": 0, "error": 0, "skipped": 0}
+
+    def apply(self, query: str, hits: List[dict], fallback_k: int) -> Tuple[List[dict], str]:
+        """
+        Reordena `hits` y conserva los `top_n` mejores con puntaje >= `min_score`.
+
+        Returns:
+            Tupla (hits, estado). Si el breaker está abierto o el reranker falla
+            o se interrumpe, se retornan los primeros `fallback_k` hits sin reordenar.
+        """
+        if len(hits) <= 1:
+            return hits[:fallback_k], "ok"
+        if not self.breaker.allow():
+            self.counts["skipped"] += 1
+            return hits[:fallback_k], "skipped"
+
+        start = perf_counter()
+        try:
+            scores = self.reranker.scores(query, hits, deadline=start + self.budget_ms / 1000)
+        except RerankTimeout as exc:
+            status = "timeout"
+            logger.warning("Reranking RAG excedió el presupuesto de %.0f ms: %s", self.budget_ms, exc)
+        except Exception as exc:
+            status = "error"
+            logger.warning("Reranking RAG falló: %s", exc, exc_info=True)
+        else:
+            # El resultado ya está calculado: se usa, pero un exceso cuenta para el breaker
+            status = "ok" if (perf_counter() - start) * 1000 <= self.budget_ms else "over_budget"
+        rerank_ms = (perf_counter() - start) * 1000
+
+        self.counts[status] += 1
+        if status == "ok":
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+        if status in {"ok", "over_budget"}:
+            order = np.argsort(-scores, kind="stable")
+            ranked = [
+                {**hits[position], "rerank_score": float(scores[position])}
+                for position in order
+                if scores[position] >= self.min_score
+            ]
+            result = ranked[: self.top_n]
+        else:
+            result = hits[:fallback_k]
+
+        logger.info(
+            "⏱️ RAG rerank timing | model=%s candidates=%s kept=%s rerank_ms=%.1f budget_ms=%.0f status=%s breaker=%s",
+            self.reranker.name,
+            len(hits),
+            len(result),
+            rerank_ms,
+            self.budget_ms,
+            status,
+            self.breaker.state,
+        )
+        return result, status
+
+    def stats(self) -> dict:
+        return {
+            "model": self.reranker.name,
+            "top_n": self.top_n,
+            "budget_ms": self.budget_ms,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            **self.counts,
+        }
+
+
+def create_rerank_stage(config) -> RerankStage | None:
+    """Crea la etapa de reranking según `RAG_RERANKER` (None si está deshabilitada)."""
+    if config.reranker == "off":
+        return None
+    if config.reranker == "onnx":
+        reranker: Reranker = OnnxCrossEncoderReranker(model_dir=config.reranker_model_dir)
+    else:
+        if config.reranker != "lexical":
+            logger.warning("Reranker desconocido '%s', usando lexical", config.reranker)
+        reranker = LexicalReranker()
+    return RerankStage(
+        reranker,
+        top_n=config.rerank_top_n,
+        min_score=config.rerank_min_score,
+        budget_ms=config.rerank_budget_ms,
+        breaker=CircuitBreaker(config.rerank_breaker_failures, config.rerank_breaker_cooldown_seconds),
+    )
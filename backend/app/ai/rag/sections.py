@@ -0,0 +1,114 @@
+"""
+Secciones de los manuales MGA y su relación con los tabs del frontend.
+
+Los manuales numeran sus capítulos por etapa ("3.3 PARTICIPANTES.",
+"4.4 CADENA DE VALOR (COSTOS):"). Durante el chunking se detectan esos títulos
+y cada chunk recibe el tema (`topic`) de la sección más específica que lo
+contiene; en la búsqueda, el tab de la pregunta se traduce al mismo tema para
+restringir o priorizar candidatos.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+# Título numerado en mayúsculas en su propia línea; las entradas del índice
+# (con puntos de relleno "....") no cuentan como títulos.
+_HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?P<number>\d+(?:\.\d+){0,3})\.?[ \t]+(?P<title>[A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑÜ0-9 ,.:;()\-]{3,})[ \t]*$",
+    re.MULTILINE,
+)
+
+# Tema -> (palabras clave del título, tabs que lo consultan)
+SECTION_TOPICS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "development_plans": (("plan de desarrollo",), ("development_plans", "pnds", "pnd_details")),
+    "problems": (
+        ("problem",),
+        ("problems", "direct_effects", "indirect_effects", "direct_causes", "indirect_causes"),
+    ),
+    "participants": (("participantes",), ("participants", "participants_general")),
+    "population": (
+        ("poblacion",),
+        ("population", "affected_population", "intervention_population", "characteristics_population"),
+    ),
+    "objectives": (("objetivos",), ("objectives", "objectives_causes", "objectives_indicator")),
+    "alternatives": (("alternativas",), ("alternatives", "alternatives_general")),
+    "requirements": (("necesidades", "estudio de mercado"), ("requirements", "requirements_general")),
+    "technical_analysis": (("analisis tecnico",), ("technical_analysis",)),
+    "localization": (("localizacion",), ("localization", "localization_general", "project_localizations")),
+    "value_chain": (
+        ("cadena de valor",),
+        ("value_chain", "value_chains", "value_chain_objectives", "products", "activities", "product_catalogs"),
+    ),
+}
+
+_TAB_TOPICS: Dict[str, str] = {tab: topic for topic, (_, tabs) in SECTION_TOPICS.items() for tab in tabs}
+
+
+def _normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def topic_for_tab(tab: Optional[str]) -> Optional[str]:
+    """Tema del manual asociado a un tab (None si el tab no tiene sección propia)."""
+    return _TAB_TOPICS.get(tab or "")
+
+
+def topic_for_title(title: str) -> Optional[str]:
+    normalized = _normalize(title)
+    for topic, (keywords, _) in SECTION_TOPICS.items():
+        if any(keyword in normalized for keyword in keywords):
+            return topic
+    return None
+
+
+def is_heading(line: str) -> bool:
+    """True si la línea es un título numerado (ver `_HEADING_PATTERN`)."""
+    match = _HEADING_PATTERN.fullmatch(line)
+    return match is not None and "..." not in match.group("title")
+
+
+def find_headings(text: str) -> List[Tuple[int, str, str]]:
+    """Títulos numerados de una página: (posición, número, título)."""
+    return [
+        (match.start(), match.group("number"), " ".join(match.group("title").split()))
+        for match in _HEADING_PATTERN.finditer(text)
+        if "..." not in match.group("title")
+    ]
+
+
+class SectionTracker:
+    """
+    Sigue la jerarquía de secciones mientras se recorren las páginas en orden.
+
+    El tema de una posición es el de la sección más específica cuyo título (o
+    el de alguno de sus ancestros) coincide con `SECTION_TOPICS`.
+    """
+
+    def __init__(self):
+        self._stack: List[Tuple[str, str]] = []
+        self._page_headings: List[Tuple[int, List[Tuple[str, str]]]] = []
+
+    def feed_page(self, text: str) -> None:
+        """Registra los títulos de la página (posiciones relativas al texto de la página)."""
+        self._page_headings = [(0, list(self._stack))]
+        for position, number, title in find_headings(text):
+            self._stack = [item for item in self._stack if number.startswith(item[0] + ".")]
+            self._stack.append((number, title))
+            self._page_headings.append((position, list(self._stack)))
+
+    def section_at(self, position: int) -> dict:
+        """Metadatos de sección para un chunk que empieza en `position` dentro de la página."""
+        stack: List[Tuple[str, str]] = []
+        for heading_position, heading_stack in self._page_headings:
+            if heading_position > position:
+                break
+            stack = heading_stack
+        if not stack:
+            return {}
+        topic = next((topic_for_title(title) for _, title in reversed(stack) if topic_for_title(title)), None)
+        number, title = stack[-1]
+        return {"section": f"{number} {title}", "topic": topic}
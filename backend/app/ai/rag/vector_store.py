@@ -3,100 +3,407 @@
 from __future__ import annotations
 
 import json
+import logging
 from pathlib import Path
-from typing import Dict, List
+from time import perf_counter
+from typing import Dict, List, Sequence, Set
 
 import numpy as np
 from scipy import sparse
 
+from .bm25 import BM25Index
 from .document_processor import DocumentChunk
-from .embeddings import TfidfEmbeddingModel
+from .embeddings import EmbeddingModel, TfidfEmbeddingModel
+from .index_storage import (
+    INDEX_FORMAT_VERSION,
+    MappedChunks,
+    csr_files,
+    load_array,
+    load_csr,
+    save_array,
+    save_csr,
+    write_text,
+)
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("vector", "bm25", "hybrid")
+SECTION_MODES = ("off", "boost", "restrict")
+
+# Archivos del formato anterior (JSON/npz/joblib), eliminados al reconstruir
+_LEGACY_FILES = ("chunks.json", "embeddings.npz", "vectorizer.joblib", "bm25_postings.npz")
 
 
 class LocalVectorStore:
-    """Persistencia local de chunks y matriz TF-IDF."""
+    """
+    Persistencia local de chunks y de su matriz de embeddings.
+
+    Todo se guarda en el formato mapeable de `index_storage`:
+    - Chunks: blob de texto `chunks.bin` + `chunk_offsets.npy` + `chunk_meta.json`
+    - TF-IDF: matriz CSR en `embeddings_{data,indices,indptr,shape}.npy`
+    - Densos: `embeddings.npy` en float32, o int8 con una escala por fila
+      (`embedding_scales.npy`) cuando `quantization="int8"`
+    - BM25: postings CSR en `bm25_*.npy` + `bm25_vocabulary.json`
 
-    def __init__(self, index_dir: Path):
+    `retrieval_mode` elige el puntaje: `vector`, `bm25` o `hybrid` (ambos
+    rankings fusionados con reciprocal-rank fusion). `section_mode` decide cómo
+    se usa el tema del tab: `off`, `boost` (prioriza su sección) o `restrict`
+    (solo puntúa su sección).
+    """
+
+    def __init__(
+        self,
+        index_dir: Path,
+        embedding_model: EmbeddingModel | None = None,
+        quantization: str = "float32",
+        retrieval_mode: str = "hybrid",
+        rrf_k: int = 60,
+        section_mode: str = "boost",
+        section_boost: float = 0.25,
+        bm25_min_score: float = 0.25,
+    ):
         self.index_dir = index_dir
         self.index_dir.mkdir(parents=True, exist_ok=True)
 
-        self.chunks_file = self.index_dir / "chunks.json"
-        self.matrix_file = self.index_dir / "embeddings.npz"
-        self.vectorizer_file = self.index_dir / "vectorizer.joblib"
+        self.dense_matrix_file = self.index_dir / "embeddings.npy"
+        self.scales_file = self.index_dir / "embedding_scales.npy"
+        self.meta_file = self.index_dir / "index_meta.json"
+
+        self._embedding_model = embedding_model or TfidfEmbeddingModel()
+        self.quantization = quantization if quantization in {"float32", "int8"} else "float32"
+        if retrieval_mode not in RETRIEVAL_MODES:
+            logger.warning("Modo de recuperación desconocido '%s', usando hybrid", retrieval_mode)
+            retrieval_mode = "hybrid"
+        self.retrieval_mode = retrieval_mode
+        self.rrf_k = rrf_k
+        self.bm25_min_score = bm25_min_score
+        if section_mode not in SECTION_MODES:
+            logger.warning("Modo de sección desconocido '%s', usando boost", section_mode)
+            section_mode = "boost"
+        self.section_mode = section_mode
+        self.section_boost = section_boost
+        # Particiones por tema (sección del manual), calculadas al primer uso
+        self._sections: Dict[str, np.ndarray] | None = None
+        self._section_cache: Dict[str, tuple] = {}
+        self._bm25 = BM25Index()
+        self._chunks: Sequence[DocumentChunk] = []
+        self._matrix: sparse.csr_matrix | np.ndarray | None = None
+        self._scales: np.ndarray | None = None
+        # Se incrementa en cada build/load: permite invalidar vectores derivados.
+        self.version = 0
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self._chunks)
 
-        self._embedding_model = TfidfEmbeddingModel()
-        self._chunks: List[DocumentChunk] = []
-        self._matrix: sparse.csr_matrix | None = None
+    @property
+    def _is_sparse(self) -> bool:
+        return self._embedding_model.provider == "tfidf"
+
+    def _required_files(self) -> List[Path]:
+        files = MappedChunks.files(self.index_dir) + BM25Index.files(self.index_dir)
+        files += [self.index_dir / name for name in self._embedding_model.artifact_names]
+        if self._is_sparse:
+            files += csr_files(self.index_dir, "embeddings")
+        else:
+            files.append(self.dense_matrix_file)
+            if self.quantization == "int8":
+                files.append(self.scales_file)
+        return files
 
     def exists(self) -> bool:
-        return self.chunks_file.exists() and self.matrix_file.exists() and self.vectorizer_file.exists()
+        """Indica si hay un índice persistido compatible con la configuración actual."""
+        if not self.meta_file.exists():
+            return False
+        meta = json.loads(self.meta_file.read_text(encoding="utf-8"))
+        expected = {
+            "format": INDEX_FORMAT_VERSION,
+            "provider": self._embedding_model.provider,
+            "quantization": self.quantization,
+        }
+        if any(meta.get(key) != value for key, value in expected.items()):
+            logger.info("Índice RAG incompatible (%s); se reconstruirá con %s", meta, expected)
+            return False
+        return all(path.exists() for path in self._required_files())
 
     def build(self, chunks: List[DocumentChunk]) -> None:
         if not chunks:
             raise ValueError("No hay chunks para indexar")
 
+        matrix = self._embedding_model.fit_transform([chunk.text for chunk in chunks])
+        if sparse.issparse(matrix):
+            self._persist(chunks, matrix.tocsr(), None)
+        else:
+            self._persist(chunks, *self._quantize(np.asarray(matrix, dtype=np.float32)))
+
+    def update(self, keep_ids: Set[str], new_chunks: List[DocumentChunk]) -> int:
+        """
+        Reescribe el índice cargado conservando los chunks `keep_ids` y agregando `new_chunks`.
+
+        Con modelos incrementales (densos) solo se codifican los chunks nuevos y las
+        filas conservadas se copian tal cual; TF-IDF reajusta el vocabulario sobre
+        todos los textos, lo que no requiere volver a leer los documentos.
+
+        Returns:
+            Número de chunks codificados
+        """
+        kept = [(position, chunk) for position, chunk in enumerate(self._chunks) if chunk.chunk_id in keep_ids]
+        chunks = [chunk for _, chunk in kept] + list(new_chunks)
+        if not chunks:
+            raise ValueError("No hay chunks para indexar")
+
+        if not self._embedding_model.supports_incremental or sparse.issparse(self._matrix):
+            self.build(chunks)
+            return len(chunks)
+
+        positions = [position for position, _ in kept]
+        matrix = np.asarray(self._matrix[positions])
+        scales = np.asarray(self._scales[positions]) if self._scales is not None else None
+        if new_chunks:
+            new_matrix, new_scales = self._quantize(
+                np.asarray(self._embedding_model.fit_transform([chunk.text for chunk in new_chunks]), dtype=np.float32)
+            )
+            matrix = np.vstack([matrix, new_matrix]) if len(matrix) else new_matrix
+            if scales is not None:
+                scales = np.concatenate([scales, new_scales])
+        self._persist(chunks, matrix, scales)
+        return len(new_chunks)
+
+    def _persist(self, chunks: List[DocumentChunk], matrix, scales: np.ndarray | None) -> None:
+        # La meta se publica al final: un build interrumpido deja el índice como inexistente
+        for path in [self.meta_file] + [self.index_dir / name for name in _LEGACY_FILES]:
+            if path.exists():
+                path.unlink()
+
         self._chunks = chunks
+        self._matrix = matrix
+        self._scales = scales
+        self._sections = None
+        self._embedding_model.save(self.index_dir)
+        if sparse.issparse(matrix):
+            save_csr(self.index_dir, "embeddings", matrix)
+        else:
+            save_array(self.dense_matrix_file, matrix)
+            if scales is not None:
+                save_array(self.scales_file, scales)
+
         texts = [chunk.text for chunk in chunks]
-        self._matrix = self._embedding_model.fit_transform(texts).tocsr()
+        self._bm25.build(texts)
+        self._bm25.save(self.index_dir)
 
-        self._embedding_model.save(self.vectorizer_file)
-        sparse.save_npz(self.matrix_file, self._matrix)
+        MappedChunks.save(self.index_dir, chunks)
+        write_text(
+            self.meta_file,
+            json.dumps(
+                {
+                    "format": INDEX_FORMAT_VERSION,
+                    "provider": self._embedding_model.provider,
+                    "quantization": self.quantization,
+                }
+            ),
+        )
+        self.version += 1
 
-        serialized_chunks = [
-            {
-                "chunk_id": chunk.chunk_id,
-                "text": chunk.text,
-                "metadata": chunk.metadata,
-            }
-            for chunk in chunks
-        ]
-        self.chunks_file.write_text(json.dumps(serialized_chunks, ensure_ascii=False), encoding="utf-8")
+    def _quantize(self, matrix: np.ndarray) -> tuple:
+        """Cuantiza por fila a int8 simétrico (escala = max|x| / 127) si está configurado."""
+        if self.quantization != "int8":
+            return matrix, None
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
 
     def load(self) -> None:
-        raw_chunks = json.loads(self.chunks_file.read_text(encoding="utf-8"))
-        self._chunks = [
-            DocumentChunk(
-                chunk_id=item["chunk_id"],
-                text=item["text"],
-                metadata=item.get("metadata", {}),
+        """Abre el índice con memory-mapping: no copia matrices ni texto a memoria del proceso."""
+        self._chunks = MappedChunks.load(self.index_dir)
+        self._embedding_model.load(self.index_dir)
+        if self._is_sparse:
+            self._matrix = load_csr(self.index_dir, "embeddings")
+            self._scales = None
+        else:
+            self._matrix = load_array(self.dense_matrix_file)
+            self._scales = load_array(self.scales_file) if self.quantization == "int8" else None
+        self._bm25.load(self.index_dir)
+        self._sections = None
+        self.version += 1
+
+    def transform(self, texts: List[str]) -> sparse.csr_matrix | None:
+        """Vectoriza textos con el modelo del índice; None si el índice no está cargado."""
+        if self._matrix is None:
+            return None
+        vectors = self._embedding_model.transform(texts)
+        # Los consumidores (cache semántico) operan con matrices dispersas
+        return vectors.tocsr() if sparse.issparse(vectors) else sparse.csr_matrix(vectors)
+
+    def _chunk_metadata(self) -> List[dict]:
+        if isinstance(self._chunks, MappedChunks):
+            return self._chunks.metadata
+        return [chunk.metadata for chunk in self._chunks]
+
+    def _section(self, topic: str) -> tuple | None:
+        """
+        Partición precalculada de un tema: (filas, submatriz, escalas, prior).
+
+        La submatriz permite puntuar solo los chunks de la sección (modo
+        `restrict`); el prior multiplica los puntajes de esas filas (modo `boost`).
+        """
+        if self._sections is None:
+            rows_by_topic: Dict[str, List[int]] = {}
+            for position, metadata in enumerate(self._chunk_metadata()):
+                if metadata.get("topic"):
+                    rows_by_topic.setdefault(metadata["topic"], []).append(position)
+            self._sections = {name: np.asarray(rows, dtype=np.int64) for name, rows in rows_by_topic.items()}
+            self._section_cache = {}
+        if topic not in self._sections:
+            return None
+        if topic not in self._section_cache:
+            rows = self._sections[topic]
+            prior = np.ones(len(self._chunks), dtype=np.float32)
+            prior[rows] += self.section_boost
+            self._section_cache[topic] = (
+                rows,
+                self._matrix[rows],
+                self._scales[rows] if self._scales is not None else None,
+                prior,
             )
-            for item in raw_chunks
-        ]
-        self._embedding_model.load(self.vectorizer_file)
-        self._matrix = sparse.load_npz(self.matrix_file).tocsr()
+        return self._section_cache[topic]
+
+    def _scores(self, query: str, section: tuple | None = None) -> np.ndarray:
+        """Similitud coseno de cada chunk; con `section` solo se puntúan sus filas (el resto queda en -inf)."""
+        matrix, scales = self._matrix, self._scales
+        if section is not None:
+            _, matrix, scales, _ = section
+        query_vector = self._embedding_model.transform([query])
+        if sparse.issparse(matrix):
+            scores = (matrix @ query_vector.tocsr().T).toarray().ravel()
+        else:
+            scores = matrix @ np.asarray(query_vector, dtype=np.float32).ravel()
+            if scales is not None:
+                scores = scores * scales
+        if section is None:
+            return scores
+        full_scores = np.full(len(self._chunks), -np.inf, dtype=np.float32)
+        full_scores[section[0]] = scores
+        return full_scores
+
+    @staticmethod
+    def _top_indices(scores: np.ndarray, size: int) -> np.ndarray:
+        """Índices de los `size` mayores puntajes, en orden descendente."""
+        size = min(len(scores), size)
+        if size <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if size < len(scores):
+            top = np.argpartition(-scores, size - 1)[:size]
+            return top[np.argsort(-scores[top])]
+        return np.argsort(-scores)
+
+    def _fuse(self, rankings: List[np.ndarray]) -> tuple:
+        """Reciprocal-rank fusion: suma 1 / (k + rango) de cada ranking."""
+        fused = np.zeros(len(self._chunks), dtype=np.float64)
+        for ranking in rankings:
+            fused[ranking] += 1.0 / (self.rrf_k + np.arange(1, len(ranking) + 1))
+        candidates = np.unique(np.concatenate(rankings)) if rankings else np.zeros(0, dtype=np.int64)
+        return candidates[np.argsort(-fused[candidates], kind="stable")], fused
+
+    def similarity_search(
+        self,
+        query: str,
+        top_k: int,
+        min_similarity: float,
+        topic: str | None = None,
+    ) -> List[Dict]:
+        """
+        Recupera los `top_k` chunks más relevantes según `retrieval_mode`.
+
+        Umbral de relevancia:
+        - `vector` e `hybrid`: todo hit debe tener coseno >= `min_similarity`. En
+          `hybrid` BM25 aporta candidatos y orden, pero un chunk que solo comparte
+          un término con la consulta (p. ej. "gracias") no entra.
+        - `bm25`: BM25 normalizado (ver `BM25Index.normalized_scores`) >= `bm25_min_score`.
 
-    def similarity_search(self, query: str, top_k: int, min_similarity: float) -> List[Dict]:
+        `score` es el coseno (o el BM25 normalizado en modo `bm25`); en `hybrid`
+        el puntaje de fusión va aparte como `rrf_score`.
+
+        Con `topic` (tema del tab, ver `sections.py`) y `section_mode`:
+        - `restrict`: solo se puntúan los chunks de esa sección; si no hay hits
+          se repite la búsqueda sobre todo el índice
+        - `boost`: los puntajes de la sección se multiplican por `1 + section_boost`
+          antes de rankear (los umbrales usan el puntaje original)
+        """
         if not query or self._matrix is None or not self._chunks:
             return []
 
-        query_vector = self._embedding_model.transform([query]).tocsr()
-        scores = (self._matrix @ query_vector.T).toarray().ravel()
+        section = self._section(topic) if topic and self.section_mode != "off" else None
+        restrict = section if self.section_mode == "restrict" else None
+        prior = section[3] if section is not None and self.section_mode == "boost" else None
 
-        candidate_size = min(len(scores), max(top_k * 3, top_k))
-        if candidate_size <= 0:
-            return []
+        candidate_size = max(top_k * 3, top_k)
+        use_vector = self.retrieval_mode in {"vector", "hybrid"}
+        use_bm25 = self.retrieval_mode in {"bm25", "hybrid"} and self._bm25.is_loaded
+
+        effective_mode = "hybrid" if use_vector and use_bm25 else ("vector" if use_vector else "bm25")
+        vector_ms = bm25_ms = fusion_ms = 0.0
+        rankings: List[np.ndarray] = []
+        vector_scores = bm25_scores = None
 
-        if candidate_size < len(scores):
-            top_indices = np.argpartition(-scores, candidate_size - 1)[:candidate_size]
-            ranked_indices = top_indices[np.argsort(-scores[top_indices])]
+        if use_vector:
+            start = perf_counter()
+            vector_scores = self._scores(query, restrict)
+            ranked = self._top_indices(vector_scores * prior if prior is not None else vector_scores, candidate_size)
+            rankings.append(ranked[vector_scores[ranked] >= min_similarity])
+            vector_ms = (perf_counter() - start) * 1000
+
+        if use_bm25:
+            start = perf_counter()
+            bm25_scores = self._bm25.normalized_scores(query)
+            if restrict is not None:
+                outside = np.ones(len(bm25_scores), dtype=bool)
+                outside[restrict[0]] = False
+                bm25_scores[outside] = 0.0
+            ranked = self._top_indices(bm25_scores * prior if prior is not None else bm25_scores, candidate_size)
+            # Solo en modo `bm25` el umbral propio; en `hybrid` filtra el coseno tras la fusión
+            keep = bm25_scores[ranked] > 0
+            if not use_vector:
+                keep &= bm25_scores[ranked] >= self.bm25_min_score
+            rankings.append(ranked[keep])
+            bm25_ms = (perf_counter() - start) * 1000
+
+        start = perf_counter()
+        if len(rankings) > 1:
+            ordered, fused = self._fuse(rankings)
+            # El umbral coseno aplica también a los candidatos que solo trajo BM25
+            ordered = ordered[vector_scores[ordered] >= min_similarity]
         else:
-            ranked_indices = np.argsort(-scores)
+            ordered = rankings[0] if rankings else np.zeros(0, dtype=np.int64)
+        final_scores = vector_scores if use_vector else bm25_scores
 
         results: List[Dict] = []
-        for chunk_index in ranked_indices:
-            score = float(scores[chunk_index])
-            if score < min_similarity:
-                continue
+        for chunk_index in ordered[:top_k]:
             chunk = self._chunks[chunk_index]
-            results.append(
-                {
-                    "chunk_id": chunk.chunk_id,
-                    "text": chunk.text,
-                    "metadata": chunk.metadata,
-                    "score": float(score),
-                }
-            )
-            if len(results) >= top_k:
-                break
+            hit = {
+                "chunk_id": chunk.chunk_id,
+                "text": chunk.text,
+                "metadata": chunk.metadata,
+                "score": float(final_scores[chunk_index]),
+            }
+            if len(rankings) > 1:
+                hit["rrf_score"] = float(fused[chunk_index])
+                hit["vector_score"] = float(vector_scores[chunk_index])
+                hit["bm25_score"] = float(bm25_scores[chunk_index])
+            results.append(hit)
+        fusion_ms = (perf_counter() - start) * 1000
 
+        logger.info(
+            "⏱️ RAG search timing | mode=%s section=%s:%s candidates=%s vector_ms=%.3f bm25_ms=%.3f fusion_ms=%.3f hits=%s",
+            effective_mode,
+            self.section_mode if section is not None else "off",
+            topic or "-",
+            len(restrict[0]) if restrict is not None else len(self._chunks),
+            vector_ms,
+            bm25_ms,
+            fusion_ms,
+            len(results),
+        )
+        if not results and restrict is not None:
+            return self.similarity_search(query, top_k, min_similarity)
         return results
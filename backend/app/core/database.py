@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -16,10 +17,37 @@ if DATABASE_URL.startswith("postgres://"):
 
 IS_PRODUCTION = os.getenv("ENVIRONMENT", "development").lower() == "production"
 
+
+def _to_async_url(url: str) -> str:
+    """Convierte la URL síncrona al driver async equivalente (psycopg 3 / aiosqlite)."""
+    if url.startswith("postgresql+psycopg2://"):
+        return url.replace("postgresql+psycopg2://", "postgresql+psycopg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+psycopg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _to_async_url(DATABASE_URL))
+
 engine = create_engine(
     DATABASE_URL,
     echo=not IS_PRODUCTION,
     pool_pre_ping=True,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Engine async para rutas que no deben ocupar un worker del threadpool
+# mientras esperan BD o LLM (p. ej. el chat).
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=not IS_PRODUCTION,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
 Base = declarative_base()
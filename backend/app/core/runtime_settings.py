@@ -0,0 +1,178 @@
+"""
+Configuración recargable en caliente.
+
+Los ajustes que deben poder cambiarse sin reiniciar el proceso (p. ej.
+`SKIP_LLM_INVOKE` durante debug) viven en un snapshot inmutable. Las rutas de
+request solo leen `runtime_settings.current`, un atributo en memoria; releer el
+`.env` ocurre fuera del camino crítico:
+
+- un watcher en segundo plano que revisa la fecha de modificación del `.env`
+  cada `RUNTIME_SETTINGS_WATCH_SECONDS` segundos (por defecto 2; 0 lo desactiva)
+- el endpoint `POST /admin/settings/reload` (cabecera `X-Admin-Token`, activo solo
+  si `ADMIN_TOKEN` está configurado)
+
+Otros archivos que se cargan una vez y deben refrescarse al editarse (p. ej.
+`prompt_templates.json`) se registran con `watch_file`: el mismo watcher
+invoca su callback cuando cambian, y el endpoint los recarga siempre.
+
+La recarga lee el archivo sin modificar `os.environ` y reemplaza el snapshot de
+una sola vez, así un request nunca ve una mezcla de valores viejos y nuevos.
+Como antes, un valor del `.env` tiene prioridad sobre la variable de entorno.
+"""
+
+import logging
+import os
+from dataclasses import dataclass, fields
+from pathlib import Path
+from threading import Event, Lock, Thread
+from time import time
+from typing import Callable, Dict, Mapping, Optional, Tuple
+
+from dotenv import dotenv_values
+
+logger = logging.getLogger(__name__)
+
+_ENV_PATH = Path(__file__).resolve().parents[2] / ".env"
+_TRUE_VALUES = {"1", "true", "yes", "on"}
+
+
+def _flag(value: Optional[str]) -> bool:
+    return str(value or "").strip().lower() in _TRUE_VALUES
+
+
+@dataclass(frozen=True)
+class RuntimeSettings:
+    """Snapshot inmutable de los ajustes recargables."""
+
+    skip_llm_invoke: bool = False
+    loaded_at: float = 0.0
+
+    @classmethod
+    def from_values(cls, values: Mapping[str, Optional[str]]) -> "RuntimeSettings":
+        # SKIP_LLM_INVOKE tiene prioridad solo si viene con valor no vacío.
+        raw_skip = values.get("SKIP_LLM_INVOKE")
+        raw_value = raw_skip if raw_skip is not None and raw_skip.strip() else values.get("DEBUG_SKIP_LLM_INVOKE")
+        return cls(skip_llm_invoke=_flag(raw_value), loaded_at=time())
+
+    def diff(self, other: "RuntimeSettings") -> Dict[str, tuple]:
+        """Campos que cambian de `self` a `other` (sin contar `loaded_at`)."""
+        return {
+            item.name: (getattr(self, item.name), getattr(other, item.name))
+            for item in fields(self)
+            if item.name != "loaded_at" and getattr(self, item.name) != getattr(other, item.name)
+        }
+
+
+class RuntimeSettingsStore:
+    """Mantiene el snapshot vigente y lo reemplaza atómicamente al recargar."""
+
+    def __init__(self, env_path: Path = _ENV_PATH):
+        self.env_path = env_path
+        self.reloads = 0
+        self._lock = Lock()
+        self._mtime = self._env_mtime()
+        self._current = RuntimeSettings.from_values(self._read_values())
+        self._watched: Dict[Path, Tuple[Optional[float], Callable[[], object]]] = {}
+        self._stop = Event()
+        self._watcher: Optional[Thread] = None
+
+    @property
+    def current(self) -> RuntimeSettings:
+        return self._current
+
+    @staticmethod
+    def _file_mtime(path: Path) -> Optional[float]:
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _env_mtime(self) -> Optional[float]:
+        return self._file_mtime(self.env_path)
+
+    def watch_file(self, path: Path, callback: Callable[[], object]) -> None:
+        """Registra `callback` para ejecutarse cuando cambie la fecha de modificación de `path`."""
+        with self._lock:
+            self._watched[Path(path)] = (self._file_mtime(Path(path)), callback)
+
+    def reload_files(self, force: bool = False) -> list:
+        """Ejecuta los callbacks de los archivos vigilados que cambiaron (todos con `force`)."""
+        reloaded = []
+        for path, (mtime, callback) in list(self._watched.items()):
+            current = self._file_mtime(path)
+            if not force and current == mtime:
+                continue
+            with self._lock:
+                self._watched[path] = (current, callback)
+            try:
+                # Un callback que retorna False indica que conservó el estado anterior
+                if callback() is not False:
+                    reloaded.append(path.name)
+            except Exception as e:
+                logger.warning(f"⚠️ Error recargando {path}: {e}")
+        return reloaded
+
+    def _read_values(self) -> Dict[str, Optional[str]]:
+        values: Dict[str, Optional[str]] = dict(os.environ)
+        if self.env_path.exists():
+            values.update(dotenv_values(self.env_path))
+        return values
+
+    def reload(self) -> Dict[str, tuple]:
+        """Relee el `.env` y publica un snapshot nuevo. Retorna los campos que cambiaron."""
+        with self._lock:
+            self._mtime = self._env_mtime()
+            snapshot = RuntimeSettings.from_values(self._read_values())
+            changes = self._current.diff(snapshot)
+            self._current = snapshot
+            self.reloads += 1
+        if changes:
+            logger.info(
+                "🔄 Configuración recargada: %s",
+                ", ".join(f"{name}={old}→{new}" for name, (old, new) in changes.items()),
+            )
+        return changes
+
+    def reload_if_changed(self) -> Optional[Dict[str, tuple]]:
+        """Recarga solo si el `.env` cambió desde la última lectura (None si no cambió)."""
+        if self._env_mtime() == self._mtime:
+            return None
+        return self.reload()
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.reload_if_changed()
+                self.reload_files()
+            except Exception as e:
+                logger.warning(f"⚠️ Error recargando configuración desde {self.env_path}: {e}")
+
+    def start_watcher(self, interval: Optional[float] = None) -> bool:
+        """Inicia el watcher del `.env` (`RUNTIME_SETTINGS_WATCH_SECONDS`). Retorna False si está desactivado."""
+        if interval is None:
+            interval = float(os.getenv("RUNTIME_SETTINGS_WATCH_SECONDS", "2"))
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return False
+        self._stop.clear()
+        self._watcher = Thread(target=self._watch, args=(interval,), name="runtime-settings-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"👀 Vigilando {self.env_path.name} cada {interval:g}s para recargar configuración")
+        return True
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def status(self) -> dict:
+        return {
+            **{item.name: getattr(self._current, item.name) for item in fields(self._current)},
+            "reloads": self.reloads,
+            "watched_files": [path.name for path in self._watched],
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+        }
+
+
+# Instancia global: los módulos leen `runtime_settings.current`
+runtime_settings = RuntimeSettingsStore()
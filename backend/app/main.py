@@ -5,12 +5,14 @@ Servidor FastAPI para gestión de proyectos de inversión pública
 usando la Metodología General Ajustada (MGA) con integración de LLM.
 """
 
+import hmac
 import logging
 import os
 from contextlib import asynccontextmanager
+from typing import Optional
 from dotenv import load_dotenv
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
@@ -59,7 +61,8 @@ from app.models.product_catalog import router as product_catalog_router
 from app.models.pnd_details import router as pnd_details_router
 from app.models.project_localization import router as project_localization_router
 
-from app.core.database import Base, engine
+from app.core.database import Base, async_engine, engine
+from app.core.runtime_settings import runtime_settings
 from app.ai.llm_models.init_llm_database import init_langchain_tables
 
 
@@ -75,6 +78,11 @@ async def lifespan(app: FastAPI):
         # Crear tablas
         Base.metadata.create_all(bind=engine)
         logger.info("✅ Tablas de BD creadas/verificadas")
+
+        # Precalcular planes de filtrado por proyecto y tabs válidos (sin reflect por request)
+        from app.models.chat_history import build_project_filter_plans, build_valid_tabs
+        build_project_filter_plans()
+        build_valid_tabs()
         
         # Inicializar tablas de LangChain
         init_langchain_tables()
@@ -93,7 +101,15 @@ async def lifespan(app: FastAPI):
         # Validar LLM
         llm_provider = os.getenv("LLM_PROVIDER", "groq").lower()
         logger.info(f"✅ LLM Provider configurado: {llm_provider}")
-        
+
+        # Indexar/cargar el corpus RAG en segundo plano (los requests no lo esperan)
+        from app.models.chat_history import llm_manager
+        llm_manager.rag_manager.start_warm_up()
+        logger.info("🔄 Índice RAG preparándose en segundo plano")
+
+        # Recarga en caliente de ajustes como SKIP_LLM_INVOKE (sin releer .env por request)
+        runtime_settings.start_watcher()
+
     except Exception as e:
         logger.error(f"❌ Error en startup: {str(e)}", exc_info=True)
         raise
@@ -102,6 +118,8 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("👋 Apagando MGA Backend...")
+    runtime_settings.stop_watcher()
+    await async_engine.dispose()
 
 
 # ==============================
@@ -201,12 +219,50 @@ async def read_root():
 @app.get("/health")
 async def health_check():
     """Endpoint de salud detallado."""
+    from app.models.chat_history import llm_manager
+
     return {
         "status": "healthy",
         "service": "MGA Project Assistant API",
         "version": "1.0.0",
         "environment": os.getenv("ENVIRONMENT", "development"),
-        "llm_provider": os.getenv("LLM_PROVIDER", "groq")
+        "llm_provider": os.getenv("LLM_PROVIDER", "groq"),
+        "rag": llm_manager.rag_manager.status(),
+        "llm": llm_manager.provider_pool.status(),
+        "runtime_settings": runtime_settings.status(),
+    }
+
+
+def _require_admin_token(token: Optional[str]) -> None:
+    """
+    Valida la cabecera `X-Admin-Token` contra `ADMIN_TOKEN`.
+
+    Sin `ADMIN_TOKEN` configurado los endpoints de administración quedan
+    desactivados (404); la recarga en caliente sigue disponible por el watcher.
+    """
+    expected = os.getenv("ADMIN_TOKEN", "")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8")):
+        logger.warning("⚠️ Intento de acceso a endpoint de administración con token inválido")
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+
+@app.post("/admin/settings/reload")
+async def reload_runtime_settings(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Relee el .env y los archivos vigilados (templates de prompts) y publica la nueva configuración.
+
+    Requiere la cabecera `X-Admin-Token` (ver `_require_admin_token`).
+    """
+    _require_admin_token(x_admin_token)
+    changes = runtime_settings.reload()
+    reloaded_files = runtime_settings.reload_files(force=True)
+    return {
+        "message": "Configuración recargada",
+        "changed": {name: {"old": old, "new": new} for name, (old, new) in changes.items()},
+        "reloaded_files": reloaded_files,
+        "settings": runtime_settings.status(),
     }
 
 
@@ -5,52 +5,122 @@ Chat History - Gestión de historial de conversaciones con LLM.
 Almacena y recupera conversaciones entre usuarios y el asistente MGA.
 """
 
+import asyncio
+import math
 import uuid
 import logging
 import os
+import weakref
+from dataclasses import dataclass
 from datetime import datetime
 from time import perf_counter
-from typing import List, Optional
+from typing import List, Optional, Sequence, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Body
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.sql import func
 from pydantic import BaseModel
 
-from app.core.database import Base, SessionLocal, engine
-from app.ai.llm_models.llm_manager import LLMManager
+from app.core.database import AsyncSessionLocal, Base, SessionLocal, engine
+from app.ai.llm_models.llm_manager import LLMManager, LLMStreamInterrupted
+from app.ai.llm_models.rate_limiter import LLMRateLimited
 from app.utils.model_labels import get_column_label, get_table_label
+from app.utils.module_context_cache import ModuleContextCache, data_version
+from app.utils.query_counter import QueryCounter, count_orm_queries
+from app.utils.row_serializers import serialize_context_row
 import json
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
 
-_VALID_TABS_CACHE: dict = {"expires_at": 0.0, "valid_tabs": []}
-_VALID_TABS_CACHE_TTL_SECONDS = max(int(os.getenv("CHAT_VALID_TABS_CACHE_TTL_SECONDS", "300")), 10)
 _DEFAULT_CONTEXT_MESSAGES = max(int(os.getenv("CHAT_HISTORY_CONTEXT_MESSAGES", "12")), 2)
 _DEFAULT_CONTEXT_ITEMS = max(int(os.getenv("CHAT_MODULE_CONTEXT_MAX_ITEMS", "20")), 1)
-_DEFAULT_CONTEXT_CHARS = max(int(os.getenv("CHAT_MODULE_CONTEXT_MAX_CHARS", "9000")), 1000)
+_SUMMARY_MAX_FOLD_MESSAGES = max(int(os.getenv("LLM_SUMMARY_MAX_FOLD_MESSAGES", "20")), 2)
 
+module_context_cache = ModuleContextCache.from_env()
 
-def _get_valid_tabs(db: Session) -> List[str]:
-    """Obtiene tabs válidos con cache para evitar reflect del schema en cada request."""
-    now = datetime.utcnow().timestamp()
-    cached_tabs = _VALID_TABS_CACHE.get("valid_tabs") or []
-    if cached_tabs and now < float(_VALID_TABS_CACHE.get("expires_at", 0.0)):
-        return cached_tabs
 
-    from sqlalchemy import inspect as sa_inspect
+_EXCLUDED_TABS = frozenset({'projects', 'chat_history', 'chat_summaries', 'survey', 'alembic_version', 'llm_response_cache'})
+_VALID_TABS: Tuple[str, ...] = ()
+
+
+def _tabs_from_metadata() -> Tuple[str, ...]:
+    return tuple(t for t in Base.metadata.tables if t not in _EXCLUDED_TABS)
+
+
+def build_valid_tabs() -> Tuple[str, ...]:
+    """
+    Fija los tabs válidos según el metadata ORM (sin reflect del schema).
+
+    Se llama desde el lifespan, con todos los modelos ya importados: calcularlo
+    en el primer request podría congelar una lista parcial.
+    """
+    global _VALID_TABS
+    _VALID_TABS = _tabs_from_metadata()
+    logger.info(f"✅ Tabs de chat válidos: {len(_VALID_TABS)}")
+    return _VALID_TABS
+
+
+def _get_valid_tabs() -> Tuple[str, ...]:
+    """Tabs fijados en el arranque; sin lifespan (scripts) se calculan en cada llamada."""
+    return _VALID_TABS or _tabs_from_metadata()
 
-    inspector = sa_inspect(db.bind)
-    available_tables = inspector.get_table_names()
-    excluded_tables = ['projects', 'chat_history', 'survey', 'alembic_version']
-    valid_tabs = [t for t in available_tables if t not in excluded_tables]
 
-    _VALID_TABS_CACHE["valid_tabs"] = valid_tabs
-    _VALID_TABS_CACHE["expires_at"] = now + _VALID_TABS_CACHE_TTL_SECONDS
-    return valid_tabs
+# Plan de filtrado por proyecto de cada tabla: SELECT con parámetro :project_id,
+# o None si la tabla no tiene relación con un proyecto.
+_PROJECT_FILTER_PLANS: dict = {}
+_PROJECT_FILTER_MAX_HOPS = 4
+
+
+def _build_project_filter(table):
+    """
+    Construye el SELECT de una tabla filtrado por proyecto.
+
+    1. Columna `project_id` directa (o cualquier columna que contenga 'project_id')
+    2. JOIN por llaves foráneas hasta la primera tabla padre con `project_id`
+    3. None: la tabla no se puede asociar a un proyecto
+    """
+    project_param = bindparam("project_id")
+    if 'project_id' in table.c:
+        return select(table).where(table.c.project_id == project_param)
+    for column in table.c:
+        if 'project_id' in column.name:
+            return select(table).where(column == project_param)
+
+    # Búsqueda en anchura sobre las FKs (ruta más corta hacia una tabla con project_id)
+    queue = [(table, [])]
+    visited = {table.name}
+    while queue:
+        current, path = queue.pop(0)
+        if len(path) >= _PROJECT_FILTER_MAX_HOPS:
+            continue
+        for fk in current.foreign_keys:
+            parent = fk.column.table
+            if parent.name in visited:
+                continue
+            visited.add(parent.name)
+            hop_path = path + [(fk.parent, fk.column)]
+            if 'project_id' in parent.c:
+                joined = table
+                for child_column, parent_column in hop_path:
+                    joined = joined.join(parent_column.table, child_column == parent_column)
+                return select(table).select_from(joined).where(parent.c.project_id == project_param)
+            queue.append((parent, hop_path))
+    return None
+
+
+def build_project_filter_plans() -> dict:
+    """Precalcula (una sola vez) el plan de filtrado por proyecto de todas las tablas ORM."""
+    if not _PROJECT_FILTER_PLANS:
+        for name, table in Base.metadata.tables.items():
+            _PROJECT_FILTER_PLANS[name] = _build_project_filter(table)
+        supported = sum(1 for plan in _PROJECT_FILTER_PLANS.values() if plan is not None)
+        logger.info(f"✅ Planes de filtrado por proyecto: {supported}/{len(_PROJECT_FILTER_PLANS)} tablas")
+    return _PROJECT_FILTER_PLANS
 
 
 # ==============================
@@ -70,6 +140,25 @@ class ChatHistory(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class ChatSummary(Base):
+    """
+    Resumen acumulado de una sesión de chat.
+
+    Condensa los mensajes que ya salieron de la ventana de historial que se
+    envía literal al LLM; `last_message_id` marca el último mensaje incluido.
+    """
+
+    __tablename__ = "chat_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    tab = Column(String, nullable=False)
+    session_id = Column(String, nullable=False, unique=True, index=True)
+    summary = Column(Text, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 # ==============================
 # 🔹 ESQUEMAS Pydantic
 # ==============================
@@ -108,6 +197,12 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependencia para obtener sesión async de BD (rutas de chat)."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # ==============================
 # 🔹 FUNCIONES AUXILIARES
 # ==============================
@@ -177,6 +272,211 @@ def get_existing_session_id(db: Session, project_id: int, tab: str) -> Optional[
         return None
 
 
+async def asave_chat_message(
+    db: AsyncSession,
+    project_id: int,
+    tab: str,
+    session_id: str,
+    sender: str,
+    message: str
+) -> ChatHistory:
+    """Versión async de `save_chat_message`."""
+    try:
+        new_msg = ChatHistory(
+            project_id=project_id,
+            tab=tab,
+            session_id=session_id,
+            sender=sender,
+            message=message,
+        )
+        db.add(new_msg)
+        await db.commit()
+        await db.refresh(new_msg)
+        logger.info(f"✅ Mensaje guardado (id={new_msg.id}, sender={sender})")
+        return new_msg
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"❌ Error guardando mensaje: {str(e)}")
+        raise
+
+
+async def aget_existing_session_id(db: AsyncSession, project_id: int, tab: str) -> Optional[str]:
+    """Versión async de `get_existing_session_id`."""
+    try:
+        result = await db.execute(
+            select(ChatHistory.session_id)
+            .where(ChatHistory.project_id == project_id, ChatHistory.tab == tab)
+            .order_by(ChatHistory.timestamp.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+    except Exception as e:
+        logger.error(f"❌ Error buscando sesión: {str(e)}")
+        return None
+
+
+# Configuración de relaciones jerárquicas (tabla padre -> [tabla hija, ...])
+MODULE_RELATIONSHIP_MAP = {
+    'development_plans': ['pnds'],
+    'problems': ['direct_effects', 'direct_causes'],
+    'direct_effects': ['indirect_effects'],
+    'direct_causes': ['indirect_causes'],
+    'population': ['affected_population', 'intervention_population', 'characteristics_population'],
+    'participants_general': ['participants'],
+    'objectives': ['objectives_causes', 'objectives_indicators'],
+    'alternatives_general': ['alternatives'],
+    'requirements_general': ['requirements'],
+    'localization_general': ['localizations'],
+    'value_chains': ['value_chain_objectives'],
+    'value_chain_objectives': ['products'],
+    'products': ['activities'],
+    'technical_analysis': [],  # tabla plana, sin hijas
+}
+
+# Tablas cuyo módulo Python o clase difiere del nombre de la tabla en BD
+_MODULE_NAME_OVERRIDES = {
+    'value_chains': 'value_chain',
+}
+_CLASS_NAME_OVERRIDES = {
+    'value_chains': 'ValueChain',
+}
+
+
+def _resolve_model_class(tab: str):
+    """Importa dinámicamente la clase ORM de un tab (ImportError si el módulo no existe)."""
+    module_file = _MODULE_NAME_OVERRIDES.get(tab, tab)
+    class_name = _CLASS_NAME_OVERRIDES.get(
+        tab, ''.join(word.capitalize() for word in tab.split('_'))
+    )
+    module = __import__(f'app.models.{module_file}', fromlist=[class_name])
+    return getattr(module, class_name, None)
+
+
+def _match_relationship_key(mapper, child_name: str) -> Optional[str]:
+    """Resuelve el nombre de relación tolerando singular/plural."""
+    relationship_keys = {rel.key for rel in mapper.relationships}
+    for candidate in (child_name, child_name + 's', child_name[:-1]):
+        if candidate in relationship_keys:
+            return candidate
+    return None
+
+
+_QUERY_BUDGET_MODE = os.getenv("CHAT_CONTEXT_QUERY_BUDGET_MODE", "warn").strip().lower()  # off | warn | assert
+
+
+@dataclass(frozen=True)
+class _LoaderNode:
+    """Relación a precargar y sus subrelaciones."""
+    name: str
+    key: str
+    attribute: object
+    table: str
+    children: tuple
+
+
+@dataclass(frozen=True)
+class _LoaderPlan:
+    """Plan de carga de un tab: relaciones, opciones `selectinload` y tablas que toca."""
+    nodes: tuple
+    options: tuple
+    tables: frozenset
+    query_budget: int
+
+
+_LOADER_PLANS: dict = {}
+
+
+def _build_loader_nodes(mapper, table_key: str, depth: int = 0) -> tuple:
+    """Recorre MODULE_RELATIONSHIP_MAP sobre las relaciones del mapper."""
+    if depth > 5:
+        return ()
+    nodes = []
+    for child_name in MODULE_RELATIONSHIP_MAP.get(table_key, []):
+        rel_key = _match_relationship_key(mapper, child_name)
+        if not rel_key:
+            logger.warning(f"⚠️ Relación '{child_name}' no encontrada en {mapper.class_.__name__}")
+            continue
+        relationship = mapper.relationships[rel_key]
+        nodes.append(_LoaderNode(
+            name=child_name,
+            key=rel_key,
+            attribute=getattr(mapper.class_, rel_key),
+            table=relationship.mapper.local_table.name,
+            children=_build_loader_nodes(relationship.mapper, rel_key, depth + 1),
+        ))
+    return tuple(nodes)
+
+
+def _compile_loader(node: _LoaderNode):
+    """Convierte un nodo del plan en un `selectinload` con sus subopciones."""
+    loader = selectinload(node.attribute)
+    if node.children:
+        loader = loader.options(*(_compile_loader(child) for child in node.children))
+    return loader
+
+
+def _get_loader_plan(tab: str) -> _LoaderPlan:
+    """
+    Plan de carga memoizado por tab.
+
+    Cada relación del plan se resuelve con una consulta `selectinload`, así que
+    armar el contexto cuesta 1 consulta por la tabla raíz + 1 por relación,
+    sin importar cuántos registros tenga el proyecto.
+    """
+    plan = _LOADER_PLANS.get(tab)
+    if plan is not None:
+        return plan
+
+    from sqlalchemy import inspect as sa_inspect
+
+    try:
+        model_class = _resolve_model_class(tab)
+    except ImportError:
+        model_class = None
+
+    tables = {tab}
+    nodes: tuple = ()
+    if model_class is not None:
+        mapper = sa_inspect(model_class)
+        tables.add(mapper.local_table.name)
+        nodes = _build_loader_nodes(mapper, tab)
+
+    def collect(node_list):
+        count = 0
+        for node in node_list:
+            tables.add(node.table)
+            count += 1 + collect(node.children)
+        return count
+
+    relationship_count = collect(nodes)
+    plan = _LoaderPlan(
+        nodes=nodes,
+        options=tuple(_compile_loader(node) for node in nodes),
+        tables=frozenset(tables),
+        query_budget=1 + relationship_count,
+    )
+    _LOADER_PLANS[tab] = plan
+    return plan
+
+
+def _module_tables(tab: str) -> frozenset:
+    """Tablas de BD que componen el contexto de un tab (raíz + subtablas del mapa)."""
+    return _get_loader_plan(tab).tables
+
+
+def _check_query_budget(tab: str, project_id: int, counter: QueryCounter, budget: int) -> None:
+    """Registra (o falla, en modo assert) si el armado del contexto excede su presupuesto."""
+    if _QUERY_BUDGET_MODE in {"off", "false", "0"} or counter.count <= budget:
+        return
+    message = (
+        f"Contexto de '{tab}' (project_id={project_id}) usó {counter.count} consultas; "
+        f"presupuesto={budget}"
+    )
+    if _QUERY_BUDGET_MODE == "assert":
+        raise AssertionError(f"{message}: {counter.statements}")
+    logger.warning(f"⚠️ {message}")
+
+
 def get_comprehensive_module_data(db: Session, project_id: int, tab: str) -> dict:
     """
     Recupera TODA la información de un módulo incluyendo sus tablas relacionadas (subtablas).
@@ -211,124 +511,38 @@ def get_comprehensive_module_data(db: Session, project_id: int, tab: str) -> dic
         }
     """
     try:
-        from sqlalchemy import text, MetaData, Table, inspect, ForeignKey
-        from sqlalchemy.orm import object_session
+        relationship_map = MODULE_RELATIONSHIP_MAP
         
-        # Configuración de relaciones jerárquicas (tabla padre -> [tabla hija, ...])
-        relationship_map = {
-            'development_plans': ['pnds'],
-            'problems': ['direct_effects', 'direct_causes'],
-            'direct_effects': ['indirect_effects'],
-            'direct_causes': ['indirect_causes'],
-            'population': ['affected_population', 'intervention_population', 'characteristics_population'],
-            'participants_general': ['participants'],
-            'objectives': ['objectives_causes', 'objectives_indicators'],
-            'alternatives_general': ['alternatives'],
-            'requirements_general': ['requirements'],
-            'localization_general': ['localizations'],
-            'value_chains': ['value_chain_objectives'],
-            'value_chain_objectives': ['products'],
-            'products': ['activities'],
-            'technical_analysis': [],  # tabla plana, sin hijas
-        }
-
-        # Tablas cuyo módulo Python o clase difiere del nombre de la tabla en BD
-        module_name_overrides = {
-            'value_chains': 'value_chain',
-        }
-        class_name_overrides = {
-            'value_chains': 'ValueChain',
-        }
-        
-        # Columnas a ignorar (JSON, timestamps, IDs internos)
-        ignored_columns = {
-            'id', 'created_at', 'updated_at', 'deleted_at',
-            'problem_tree_json', 'population_json', 'participants_json',
-            'alternatives_json', '_json'
-        }
-        
-        def serialize_value(value):
-            """Convierte valores a formatos JSON-compatibles."""
-            if value is None:
-                return None
-            if isinstance(value, (str, int, float, bool)):
-                return value
-            if isinstance(value, (datetime, )):
-                return value.isoformat()
-            return str(value)
-        
-        def get_record_data(table_obj, record, exclude_fk=None):
-            """Extrae datos de un registro excluyendo FKs y columnas internas."""
-            if exclude_fk is None:
-                exclude_fk = set()
-            
-            data = {}
-            mapper = inspect(table_obj.__class__)
-            
-            for column in mapper.columns:
-                col_name = column.name
-                
-                # Saltar columnas ignoradas
-                if col_name in ignored_columns:
-                    continue
-                if col_name in exclude_fk:
-                    continue
-                if col_name.endswith('_id') and col_name != 'project_id':
-                    continue
-                
-                value = getattr(record, col_name, None)
-                data[col_name] = serialize_value(value)
-            
-            return data
-        
-        def get_children_data(parent_record, parent_table, child_table_name, depth=0):
-            """Recursivamente obtiene datos de tablas hijas."""
-            if depth > 5:  # Límite de profundidad
-                return []
-            
+        def get_children_data(parent_record, node: _LoaderNode):
+            """Recursivamente obtiene datos de tablas hijas siguiendo el plan de carga."""
             try:
-                # Obtener relación del modelo padre
-                mapper = inspect(parent_record.__class__)
-                relationship_keys = [rel.key for rel in mapper.relationships]
-                
-                # Si el nombre exacto no está, intentar variaciones comunes
-                if child_table_name not in relationship_keys:
-                    # Intentar singulares/plurales
-                    if child_table_name + 's' in relationship_keys:
-                        child_table_name = child_table_name + 's'
-                    elif child_table_name[:-1] in relationship_keys:
-                        child_table_name = child_table_name[:-1]
-                    else:
-                        return []
-                
-                children = getattr(parent_record, child_table_name, None)
+                children = getattr(parent_record, node.key, None)
                 if not children:
                     return []
-                
+
                 # Asegurar que es una lista
                 children_list = children if isinstance(children, list) else [children]
-                
+
                 result = []
                 for child in children_list:
                     if not child:
                         continue
-                    
-                    child_data = get_record_data(child, child)
-                    
+
+                    child_data = serialize_context_row(child)
+
                     # Buscar relaciones dentro de este hijo
-                    grandchildren_tables = relationship_map.get(child_table_name, [])
-                    for grandchild_name in grandchildren_tables:
-                        grandchildren = get_children_data(child, child_table_name, grandchild_name, depth + 1)
+                    for grandchild_node in node.children:
+                        grandchildren = get_children_data(child, grandchild_node)
                         if grandchildren:
-                            child_data[grandchild_name] = grandchildren
-                    
+                            child_data[grandchild_node.name] = grandchildren
+
                     result.append(child_data)
-                
+
                 return result
             except Exception as e:
-                logger.warning(f"⚠️ Error obteniendo datos de {child_table_name}: {str(e)}")
+                logger.warning(f"⚠️ Error obteniendo datos de {node.name}: {str(e)}")
                 return []
-        
+
         # PASO 1: Obtener registros de la tabla principal
         if tab not in relationship_map and tab != 'development_plans' and tab != 'problems' and tab != 'population' and tab != 'participants_general' and tab != 'objectives' and tab != 'alternatives_general':
             # Es una tabla secundaria, obtener desde su relación
@@ -348,12 +562,7 @@ def get_comprehensive_module_data(db: Session, project_id: int, tab: str) -> dic
         
         # Importar modelos dinámicamente
         try:
-            module_file = module_name_overrides.get(tab, tab)
-            class_name = class_name_overrides.get(
-                tab, ''.join(word.capitalize() for word in tab.split('_'))
-            )
-            module = __import__(f'app.models.{module_file}', fromlist=[class_name])
-            model_class = getattr(module, class_name, None)
+            model_class = _resolve_model_class(tab)
 
             if not model_class:
                 return {
@@ -371,138 +580,44 @@ def get_comprehensive_module_data(db: Session, project_id: int, tab: str) -> dic
                 "message": f"Error al importar modelo: {str(e)}"
             }
         
-        # PASO 2: Consultar registros de la tabla principal
-        # Cargar con relaciones anidadas para evitar lazy loading
-        try:
-            if tab == 'problems':
-                from app.models.problems import Problems
-                from app.models.direct_effects import DirectEffect
-                from app.models.indirect_effects import IndirectEffect
-                from app.models.direct_causes import DirectCause
-                from app.models.indirect_causes import IndirectCause
-                from sqlalchemy.orm import joinedload
-                
-                main_records = db.query(Problems).filter(
-                    Problems.project_id == project_id
-                ).options(
-                    joinedload(Problems.direct_effects).joinedload(DirectEffect.indirect_effects),
-                    joinedload(Problems.direct_causes).joinedload(DirectCause.indirect_causes)
-                ).all()
-            
-            elif tab == 'population':
-                from app.models.population import Population
-                from sqlalchemy.orm import joinedload
-                
-                main_records = db.query(Population).filter(
-                    Population.project_id == project_id
-                ).options(
-                    joinedload(Population.affected_population),
-                    joinedload(Population.intervention_population),
-                    joinedload(Population.characteristics_population)
-                ).all()
-            
-            elif tab == 'participants_general':
-                from app.models.participants_general import ParticipantsGeneral
-                from sqlalchemy.orm import joinedload
-                
-                main_records = db.query(ParticipantsGeneral).filter(
-                    ParticipantsGeneral.project_id == project_id
-                ).options(
-                    joinedload(ParticipantsGeneral.participants)
-                ).all()
-            
-            elif tab == 'objectives':
-                from app.models.objectives import Objectives
-                from sqlalchemy.orm import joinedload
-                
-                main_records = db.query(Objectives).filter(
-                    Objectives.project_id == project_id
-                ).options(
-                    joinedload(Objectives.objectives_causes),
-                    joinedload(Objectives.objectives_indicators)
-                ).all()
-            
-            elif tab == 'alternatives_general':
-                from app.models.alternatives_general import AlternativesGeneral
-                from app.models.alternatives import Alternatives
-                from sqlalchemy.orm import joinedload
-
-                main_records = db.query(AlternativesGeneral).filter(
-                    AlternativesGeneral.project_id == project_id
-                ).options(
-                    joinedload(AlternativesGeneral.alternatives)
+        # PASO 2: Consultar registros de la tabla principal con su plan de carga
+        # (selectinload por relación: número fijo de consultas, sin lazy loading)
+        plan = _get_loader_plan(tab)
+        with count_orm_queries(db) as query_counter:
+            try:
+                main_records = db.query(model_class).filter(
+                    model_class.project_id == project_id
+                ).options(*plan.options).all()
+            except Exception as e:
+                logger.warning(f"⚠️ Error cargando registros con relaciones: {str(e)}, usando fallback")
+                main_records = db.query(model_class).filter(
+                    model_class.project_id == project_id
                 ).all()
 
-            elif tab == 'value_chains':
-                from app.models.value_chain import ValueChain
-                from app.models.value_chain_objectives import ValueChainObjectives
-                from sqlalchemy.orm import joinedload
+            if not main_records:
+                return {
+                    "module": tab,
+                    "table": tab,
+                    "total_records": 0,
+                    "records": []
+                }
 
-                main_records = db.query(ValueChain).filter(
-                    ValueChain.project_id == project_id
-                ).options(
-                    joinedload(ValueChain.value_chain_objectives)
-                ).all()
+            # PASO 3: Construir estructura jerárquica
+            records_data = []
 
-            else:
-                # Tabla plana sin relaciones especiales (ej: technical_analysis)
-                main_records = db.query(model_class).filter(
-                    model_class.project_id == project_id
-                ).all()
-        except Exception as e:
-            logger.warning(f"⚠️ Error cargando registros con relaciones: {str(e)}, usando fallback")
-            main_records = db.query(model_class).filter(
-                model_class.project_id == project_id
-            ).all()
-        
-        if not main_records:
-            return {
-                "module": tab,
-                "table": tab,
-                "total_records": 0,
-                "records": []
-            }
-        
-        # PASO 3: Construir estructura jerárquica
-        records_data = []
-        children_tables = relationship_map.get(tab, [])
-        
-        for record in main_records:
-            record_data = get_record_data(record, record)
-
-            if tab == 'alternatives_general':
-                # Fallback defensivo: si la relación viene vacía, consultar hijas directamente.
-                has_loaded_children = bool(getattr(record, 'alternatives', None))
-                if not has_loaded_children:
-                    try:
-                        direct_children = db.query(Alternatives).filter(
-                            Alternatives.alternative_id == record.id
-                        ).all()
-                        if direct_children:
-                            record_data['alternatives'] = [get_record_data(child, child) for child in direct_children]
-                    except Exception as fallback_error:
-                        logger.warning(f"⚠️ Fallback alternatives_general falló: {str(fallback_error)}")
-
-                logger.info(
-                    "🧪 alternatives_general context debug | project_id=%s record_id=%s keys=%s alternatives_count=%s",
-                    project_id,
-                    getattr(record, 'id', None),
-                    list(record_data.keys()),
-                    len(record_data.get('alternatives', [])) if isinstance(record_data.get('alternatives'), list) else 0,
-                )
-            
-            # Agregar datos de tablas hijas
-            for child_table in children_tables:
-                try:
-                    children = get_children_data(record, tab, child_table)
+            for record in main_records:
+                record_data = serialize_context_row(record)
+
+                # Agregar datos de tablas hijas
+                for node in plan.nodes:
+                    children = get_children_data(record, node)
                     if children:
-                        record_data[child_table] = children
-                except Exception as e:
-                    logger.warning(f"⚠️ Error procesando relación {child_table}: {str(e)}")
-                    pass
-            
-            records_data.append(record_data)
-        
+                        record_data[node.name] = children
+
+                records_data.append(record_data)
+
+        _check_query_budget(tab, project_id, query_counter, plan.query_budget)
+
         return {
             "module": tab,
             "table": tab,
@@ -510,6 +625,9 @@ def get_comprehensive_module_data(db: Session, project_id: int, tab: str) -> dic
             "records": records_data
         }
     
+    except AssertionError:
+        # Modo CHAT_CONTEXT_QUERY_BUDGET_MODE=assert: la regresión debe fallar visible
+        raise
     except Exception as e:
         logger.error(f"❌ Error recuperando datos completos de {tab}: {str(e)}")
         return {
@@ -520,28 +638,32 @@ def get_comprehensive_module_data(db: Session, project_id: int, tab: str) -> dic
         }
 
 
-def format_module_data_for_prompt(data: dict, max_items: int = 50) -> str:
+def format_module_blocks_for_prompt(data: dict, max_items: int = 50) -> List[str]:
     """
-    Convierte los datos del módulo a formato natural para el prompt.
+    Convierte los datos del módulo a bloques de texto natural para el prompt.
     Evita JSON técnico y presenta los datos de forma legible.
+
+    Cada bloque es una unidad completa (campos de un registro, o un item
+    relacionado con todo su detalle), de modo que el presupuesto de tokens del
+    prompt pueda descartar bloques enteros sin cortar campos.
     
     Args:
         data: Dict con estructura de datos del módulo
         max_items: Máximo de items a incluir por tabla
         
     Returns:
-        String con datos formateados de forma natural para el contexto
+        Lista de bloques: encabezado, registros/items y cierre
     """
     try:
         if data.get("status") == "error":
-            return f"(No hay datos disponibles: {data.get('message', 'Error desconocido')})"
+            return [f"(No hay datos disponibles: {data.get('message', 'Error desconocido')})"]
         
         total_records = data.get("total_records", 0)
         records = data.get("records", [])[:max_items]
         module = data.get("module", "módulo")
         
         if total_records == 0:
-            return f"(No hay información registrada en {module})"
+            return [f"(No hay información registrada en {module})"]
         
         # Mapeo de nombres de módulos a descripciones
         module_names = {
@@ -566,35 +688,35 @@ def format_module_data_for_prompt(data: dict, max_items: int = 50) -> str:
         
         module_display = module_names.get(module, module)
         
-        # Construir resumen natural
-        lines = []
-        lines.append(f"INFORMACIÓN REGISTRADA EN {module_display.upper()}:")
-        lines.append("-" * 60)
-        
         def format_value(val):
             """Formatea valores de forma natural."""
             if val is None or val == "":
                 return "(sin información)"
             if isinstance(val, bool):
                 return "Sí" if val else "No"
-            if isinstance(val, (int, float)):
-                return str(val)
-            return str(val)[:200]  # Truncar valores muy largos
+            return str(val)
         
-        def format_record(record, indent=0, depth=0, current_table=None):
-            """Formatea un registro de forma natural, incluyendo relaciones anidadas."""
+        def format_record_parts(record, indent=0, depth=0, current_table=None):
+            """
+            Formatea un registro incluyendo relaciones anidadas.
+
+            Returns:
+                Lista de partes: la primera con los campos simples y una por cada
+                item relacionado (con su detalle anidado)
+            """
             prefix = "  " * indent
-            parts = []
             table_name = current_table or module
 
             # 1) Campos simples
+            fields = []
             for key, value in record.items():
                 if isinstance(value, list):
                     continue
                 clean_key = get_column_label(table_name, key)
                 clean_val = format_value(value)
                 if clean_val != "(sin información)":
-                    parts.append(f"{prefix}• {clean_key}: {clean_val}")
+                    fields.append(f"{prefix}• {clean_key}: {clean_val}")
+            parts = ["\n".join(fields)] if fields else []
 
             # 2) Relaciones (listas) con detalle jerárquico
             for key, value in record.items():
@@ -605,48 +727,64 @@ def format_module_data_for_prompt(data: dict, max_items: int = 50) -> str:
                 list_label = get_table_label(key)
                 item_label = get_table_label(key, singular=True)
                 shown_items = value[:max_items]
-                parts.append(f"{prefix}• {list_label}: {total_count} registro{'s' if total_count > 1 else ''}")
+                summary = f"{prefix}• {list_label}: {total_count} registro{'s' if total_count > 1 else ''}"
 
                 # Evitar recursión excesiva en estructuras muy profundas
                 if depth >= 3:
+                    parts.append(summary)
                     continue
 
+                item_parts = []
                 for idx, item in enumerate(shown_items, 1):
-                    item_prefix = "  " * (indent + 1)
-                    parts.append(f"{item_prefix}- {item_label} {idx}:")
+                    item_lines = [f"{'  ' * (indent + 1)}- {item_label} {idx}:"]
                     if isinstance(item, dict):
                         nested = format_record(item, indent=indent + 2, depth=depth + 1, current_table=key)
                         if nested:
-                            parts.append(nested)
+                            item_lines.append(nested)
                     else:
-                        parts.append(f"{'  ' * (indent + 2)}• Valor: {format_value(item)}")
+                        item_lines.append(f"{'  ' * (indent + 2)}• Valor: {format_value(item)}")
+                    item_parts.append("\n".join(item_lines))
 
+                # El resumen viaja con el primer item y la nota de recorte con el último
+                item_parts[0] = f"{summary}\n{item_parts[0]}"
                 if total_count > len(shown_items):
-                    parts.append(
-                        f"{'  ' * (indent + 1)}(Mostrando {len(shown_items)} de {total_count} registros)"
+                    item_parts[-1] += (
+                        f"\n{'  ' * (indent + 1)}(Mostrando {len(shown_items)} de {total_count} registros)"
                     )
+                parts.extend(item_parts)
 
-            return "\n".join(parts) if parts else f"{prefix}(sin información completa)"
+            return parts
+
+        def format_record(record, indent=0, depth=0, current_table=None):
+            """Formatea un registro completo como un solo texto."""
+            parts = format_record_parts(record, indent=indent, depth=depth, current_table=current_table)
+            return "\n".join(parts) if parts else f"{'  ' * indent}(sin información completa)"
         
-        # Agregar registros formateados
+        # Construir bloques
+        blocks = [f"INFORMACIÓN REGISTRADA EN {module_display.upper()}:\n" + "-" * 60]
         for idx, record in enumerate(records, 1):
+            record_parts = format_record_parts(record, current_table=module) or ["(sin información completa)"]
             if len(records) > 1:
-                lines.append(f"\nRegistro {idx}:")
-            lines.append(format_record(record, current_table=module))
-        
-        lines.append("-" * 60)
+                record_parts[0] = f"\nRegistro {idx}:\n{record_parts[0]}"
+            blocks.extend(record_parts)
         
+        closing = "-" * 60
         # Agregar nota sobre cantidad de registros
         if total_records > max_items:
-            lines.append(f"(Mostrando {len(records)} de {total_records} registro{'s' if total_records > 1 else ''})")
+            closing += f"\n(Mostrando {len(records)} de {total_records} registro{'s' if total_records > 1 else ''})"
+        blocks.append(closing)
         
-        return "\n".join(lines)
+        return blocks
         
     except Exception as e:
         logger.error(f"❌ Error formateando datos: {str(e)}")
-        return f"(Error al procesar los datos del módulo: {str(e)[:50]})"
+        return [f"(Error al procesar los datos del módulo: {str(e)[:50]})"]
 
 
+def format_module_data_for_prompt(data: dict, max_items: int = 50) -> str:
+    """Versión en texto plano de `format_module_blocks_for_prompt`."""
+    return "\n".join(format_module_blocks_for_prompt(data, max_items=max_items))
+
 
 def get_module_data(db: Session, project_id: int, tab: str) -> str:
     """
@@ -667,84 +805,24 @@ def get_module_data(db: Session, project_id: int, tab: str) -> str:
         context_lines.append(f"INFORMACIÓN REGISTRADA EN {tab.upper()}:")
         context_lines.append("="*70)
         
-        from sqlalchemy import text, inspect, MetaData, Table
-        
-        # 1. Obtener información de la tabla
-        metadata = MetaData()
-        metadata.reflect(bind=db.bind)
-        
-        if tab not in metadata.tables:
+        # 1. Obtener información de la tabla (metadata ORM en memoria)
+        table = Base.metadata.tables.get(tab)
+        if table is None:
             context_lines.append(f"(Tabla '{tab}' no encontrada)")
             context_lines.append("="*70)
             return "\n".join(context_lines)
-        
-        table = metadata.tables[tab]
+
         columns = [col.name for col in table.columns]
-        
-        # 2. Determinar cómo filtrar por proyecto
-        # Algunas tablas tienen project_id directo, otras vía relación
-        
-        has_project_id = 'project_id' in columns
-        
-        if has_project_id:
-            # Tabla con project_id directo
-            query = f"SELECT * FROM {tab} WHERE project_id = :project_id"
-            params = {"project_id": project_id}
-        else:
-            # Intentar encontrar relación a través de otra tabla
-            # Mapeo de relaciones comunes
-            relation_map = {
-                'participants': 'participants_general',
-                'objectives_causes': 'objectives',
-                'objectives_indicators': 'objectives',
-                'direct_causes': 'problems',
-                'direct_effects': 'problems',
-                'indirect_causes': 'problems',
-                'indirect_effects': 'problems',
-                'affected_population': 'population',
-                'intervention_population': 'population',
-                'characteristics_population': 'population',
-                'alternatives': 'alternatives_general',
-            }
-            
-            parent_table = relation_map.get(tab)
-            
-            if parent_table and parent_table in metadata.tables:
-                # Obtener columna de FK a tabla padre
-                parent_col = f"{parent_table}_id"
-                if parent_col in columns:
-                    # Query con JOIN
-                    query = f"""
-                        SELECT {tab}.* FROM {tab}
-                        INNER JOIN {parent_table} ON {tab}.{parent_col} = {parent_table}.id
-                        WHERE {parent_table}.project_id = :project_id
-                    """
-                else:
-                    query = None
-            else:
-                query = None
-            
-            params = {"project_id": project_id}
-        
-        if not query:
-            # Último intento: buscar FK que apunte a project_id
-            query_result = db.execute(
-                text(f"""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_name = :table AND column_name LIKE '%project_id%'
-                """),
-                {"table": tab}
-            ).fetchone()
-            
-            if query_result:
-                query = f"SELECT * FROM {tab} WHERE {query_result[0]} = :project_id"
-            else:
-                context_lines.append(f"(No hay relación con proyecto para tabla '{tab}')")
-                context_lines.append("="*70)
-                return "\n".join(context_lines)
-        
+
+        # 2. Plan precalculado para filtrar por proyecto (directo o vía tabla padre)
+        query = build_project_filter_plans().get(tab)
+        if query is None:
+            context_lines.append(f"(No hay relación con proyecto para tabla '{tab}')")
+            context_lines.append("="*70)
+            return "\n".join(context_lines)
+
         # 3. Ejecutar query y recuperar datos
-        result = db.execute(text(query), params).fetchall()
+        result = db.execute(query, {"project_id": project_id}).fetchall()
         
         if not result:
             context_lines.append(f"(No hay registros en {tab} para este proyecto)")
@@ -798,16 +876,329 @@ router = APIRouter(prefix="/chat_history", tags=["chat"])
 llm_manager = LLMManager()
 
 
+# Las rutas /cache/* se declaran antes de /{project_id}/{tab} para no quedar ocultas.
+@router.get("/cache/stats")
+def get_cache_stats():
+    """
+    Devuelve las estadísticas de los caches de respuestas del LLM y de recuperación RAG.
+
+    Returns:
+        Dict con hits, misses y tasa de acierto del cache exacto, del semántico y del RAG
+    """
+    return {
+        "response_cache": llm_manager.response_cache.stats(),
+        "semantic_cache": llm_manager.semantic_cache.stats(),
+        "rag_query_cache": llm_manager.rag_manager.query_cache.stats(),
+    }
+
+
+@router.delete("/cache/semantic")
+def purge_semantic_cache(tab: Optional[str] = None):
+    """
+    Vacía el cache semántico de respuestas.
+
+    Args:
+        tab: Componente MGA a purgar (opcional; sin él se purgan todos)
+
+    Returns:
+        Cantidad de entradas eliminadas
+    """
+    removed = llm_manager.semantic_cache.purge(tab)
+    logger.info(f"🧹 Cache semántico purgado (tab={tab or 'todos'}, entradas={removed})")
+    return {
+        "message": f"Se eliminaron {removed} respuestas del cache semántico",
+        "deleted_count": removed,
+    }
+
+
+def _normalize_tab(tab: str, valid_tabs: Sequence[str]) -> str:
+    """Normaliza singular/plural del tab o lanza HTTP 400 si no es válido."""
+    normalized_tab = tab
+    if tab not in valid_tabs:
+        # intentar agregar o quitar 's'
+        if not tab.endswith('s') and f"{tab}s" in valid_tabs:
+            normalized_tab = f"{tab}s"
+        elif tab.endswith('s') and tab[:-1] in valid_tabs:
+            normalized_tab = tab[:-1]
+        # también casos especiales con 'es' (no hay por ahora)
+
+    if normalized_tab not in valid_tabs:
+        logger.warning(f"⚠️ Tab no válido: {tab}. Opciones: {', '.join(valid_tabs)}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tab '{tab}' no válido. Opciones disponibles: {', '.join(valid_tabs)}"
+        )
+    return normalized_tab
+
+
+async def _prepare_chat_turn(db: AsyncSession, project_id: int, tab: str, question: str) -> dict:
+    """
+    Ejecuta los pasos previos a la invocación del LLM comunes a los endpoints de chat.
+
+    Valida el tab, resuelve la sesión, guarda la pregunta del usuario y recupera
+    el historial y el contexto del módulo. Todo el acceso a BD es async; la
+    construcción del contexto (ORM con relaciones) corre vía `run_sync`.
+
+    Returns:
+        Dict con tab normalizado, session_id, historial, contexto y tiempos por fase
+    """
+    tab_validation_start = perf_counter()
+    valid_tabs = _get_valid_tabs()
+    tab = _normalize_tab(tab, valid_tabs)
+    tab_validation_ms = (perf_counter() - tab_validation_start) * 1000
+    
+    # Obtener o crear sesión
+    session_start = perf_counter()
+    session_id = await aget_existing_session_id(db, project_id, tab) or str(uuid.uuid4())
+    session_ms = (perf_counter() - session_start) * 1000
+    logger.info(f"🔗 Session ID: {session_id[:8]}...")
+
+    # Guardar pregunta del usuario
+    await asave_chat_message(db, project_id, tab, session_id, "user", question)
+
+    # 🆕 Recuperar historial de chat anterior para contexto
+    # (solo los mensajes que aún no están condensados en el resumen de la sesión)
+    logger.info(f"📜 Recuperando historial de chat para contexto...")
+    history_start = perf_counter()
+    summary = (
+        await db.execute(select(ChatSummary).where(ChatSummary.session_id == session_id))
+    ).scalar_one_or_none()
+    result = await db.execute(
+        select(ChatHistory)
+        .where(
+            ChatHistory.project_id == project_id,
+            ChatHistory.tab == tab,
+            ChatHistory.session_id == session_id,
+            ChatHistory.id > (summary.last_message_id if summary else 0)
+        )
+        .order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc())
+        .limit(_DEFAULT_CONTEXT_MESSAGES + 1)
+    )
+    previous_messages = list(result.scalars().all())
+
+    previous_messages.reverse()
+    history_ms = (perf_counter() - history_start) * 1000
+    
+    # Convertir mensajes ORM a diccionarios para el LLM
+    chat_history = [
+        {
+            "sender": msg.sender,
+            "message": msg.message,
+            "timestamp": msg.timestamp
+        }
+        for msg in previous_messages[:-1]  # Excluir el mensaje del usuario que acabamos de guardar
+    ]
+    
+    logger.info(
+        f"📚 Historial de {len(chat_history)} mensajes anteriores recuperado"
+        f"{' + resumen de la sesión' if summary else ''}"
+    )
+
+    # Contexto del módulo: reutilizar el bloque formateado si los datos no cambiaron
+    context_version = data_version(project_id, _module_tables(tab))
+    module_context = module_context_cache.get(project_id, tab, context_version)
+    module_data_ms = format_ms = 0.0
+    context_cache_status = "hit" if module_context is not None else "miss"
+
+    if module_context is None:
+        # 🆕 MEJORADO: Recuperar datos COMPLETOS del módulo con estructura jerárquica
+        logger.info(f"📊 Recuperando datos COMPLETOS del módulo {tab} (incluyendo subtablas)...")
+        module_data_start = perf_counter()
+        comprehensive_data = await db.run_sync(get_comprehensive_module_data, project_id, tab)
+        module_data_ms = (perf_counter() - module_data_start) * 1000
+        
+        # Formatear datos para el prompt
+        format_start = perf_counter()
+        # Bloques completos: el presupuesto de tokens del LLM decide cuántos entran
+        module_context = tuple(format_module_blocks_for_prompt(comprehensive_data, max_items=_DEFAULT_CONTEXT_ITEMS))
+        format_ms = (perf_counter() - format_start) * 1000
+
+        if comprehensive_data.get("status") != "error":
+            module_context_cache.set(project_id, tab, context_version, module_context)
+        
+        logger.info(f"✅ Contexto del módulo {tab} recuperado ({comprehensive_data.get('total_records', 0)} registros en BD)")
+    else:
+        logger.info(f"♻️ Contexto del módulo {tab} reutilizado desde cache (sin cambios en BD)")
+
+    return {
+        "tab": tab,
+        "session_id": session_id,
+        "chat_history": chat_history,
+        "conversation_summary": summary.summary if summary else None,
+        "module_context": module_context,
+        "timings": {
+            "tab_validation_ms": tab_validation_ms,
+            "session_ms": session_ms,
+            "history_ms": history_ms,
+            "module_data_ms": module_data_ms,
+            "format_ms": format_ms,
+        },
+        "context_cache": context_cache_status,
+    }
+
+
+_SUMMARY_LOCKS: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+async def refresh_conversation_summary(project_id: int, tab: str, session_id: str) -> None:
+    """
+    Condensa en el resumen de la sesión los mensajes que ya salieron de la
+    ventana de historial literal (`LLM_MAX_CHAT_HISTORY_MESSAGES`).
+
+    Corre como tarea de fondo después de cada respuesta del bot, así el prompt
+    del siguiente turno mantiene un tamaño constante sin perder coherencia.
+    """
+    if not llm_manager.summary_enabled:
+        return
+
+    lock = _SUMMARY_LOCKS.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _SUMMARY_LOCKS[session_id] = lock
+
+    async with lock:
+        start = perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                summary = (
+                    await db.execute(select(ChatSummary).where(ChatSummary.session_id == session_id))
+                ).scalar_one_or_none()
+                last_message_id = summary.last_message_id if summary else 0
+
+                # Límite de la ventana literal: el N-ésimo mensaje más reciente
+                window_ids = (
+                    await db.execute(
+                        select(ChatHistory.id)
+                        .where(ChatHistory.session_id == session_id)
+                        .order_by(ChatHistory.id.desc())
+                        .limit(llm_manager.max_chat_history_messages)
+                    )
+                ).scalars().all()
+                if len(window_ids) < llm_manager.max_chat_history_messages:
+                    return
+
+                to_fold = (
+                    await db.execute(
+                        select(ChatHistory)
+                        .where(
+                            ChatHistory.session_id == session_id,
+                            ChatHistory.id > last_message_id,
+                            ChatHistory.id < window_ids[-1],
+                        )
+                        .order_by(ChatHistory.id.asc())
+                        .limit(_SUMMARY_MAX_FOLD_MESSAGES)
+                    )
+                ).scalars().all()
+                if not to_fold:
+                    return
+
+                new_summary = await llm_manager.asummarize(
+                    summary.summary if summary else None,
+                    [{"sender": msg.sender, "message": msg.message} for msg in to_fold],
+                )
+                if not new_summary:
+                    return
+
+                if summary is None:
+                    db.add(ChatSummary(
+                        project_id=project_id,
+                        tab=tab,
+                        session_id=session_id,
+                        summary=new_summary,
+                        last_message_id=to_fold[-1].id,
+                    ))
+                else:
+                    summary.summary = new_summary
+                    summary.last_message_id = to_fold[-1].id
+                await db.commit()
+
+            logger.info(
+                "⏱️ Chat summary timing | project=%s tab=%s session=%s folded=%s summary_chars=%s total_ms=%.1f",
+                project_id,
+                tab,
+                session_id[:8],
+                len(to_fold),
+                len(new_summary),
+                (perf_counter() - start) * 1000,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ No fue posible actualizar el resumen de la sesión {session_id[:8]}: {str(e)}")
+
+
+def _log_chat_timing(
+    project_id: int,
+    tab: str,
+    total_start: float,
+    turn: dict,
+    llm_ms: float,
+    question: str,
+    ttft_ms: Optional[float] = None,
+) -> None:
+    """Registra la línea de tiempos del endpoint de chat (con TTFT en modo streaming)."""
+    total_ms = (perf_counter() - total_start) * 1000
+    timings = turn["timings"]
+    module_context = turn["module_context"]
+    logger.info(
+        "⏱️ Chat endpoint timing | project=%s tab=%s total_ms=%.1f tab_validation_ms=%.1f "
+        "session_ms=%.1f history_ms=%.1f module_data_ms=%.1f format_ms=%.1f context_cache=%s llm_ms=%.1f "
+        "ttft_ms=%s question_chars=%s module_context_chars=%s",
+        project_id,
+        tab,
+        total_ms,
+        timings["tab_validation_ms"],
+        timings["session_ms"],
+        timings["history_ms"],
+        timings["module_data_ms"],
+        timings["format_ms"],
+        turn["context_cache"],
+        llm_ms,
+        f"{ttft_ms:.1f}" if ttft_ms is not None else "-",
+        len(question or ""),
+        sum(len(block) for block in module_context or ()),
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Serializa un evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+_RATE_LIMITED_DETAIL = "El asistente está atendiendo muchas solicitudes. Intenta de nuevo en unos segundos."
+_TRUNCATED_DETAIL = "La respuesta se interrumpió por un error del asistente. Intenta de nuevo."
+
+
+def _retry_after_seconds(retry_after: float) -> int:
+    """Valor entero (>= 1) para la cabecera `Retry-After`."""
+    return max(math.ceil(retry_after), 1)
+
+
+def _check_llm_admission() -> None:
+    """
+    Rechaza con 429 antes de guardar la pregunta si ningún proveedor LLM admite
+    más llamadas (colas llenas o espera estimada mayor al plazo).
+    """
+    retry_after = llm_manager.provider_pool.admission_retry_after()
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=_RATE_LIMITED_DETAIL,
+            headers={"Retry-After": str(_retry_after_seconds(retry_after))},
+        )
+
+
 @router.post("/chat/{project_id}/{tab}", response_model=ChatMessageResponse)
-def chat_with_ai(
+async def chat_with_ai(
     project_id: int,
     tab: str,
+    background_tasks: BackgroundTasks,
     question: str = Body(..., embed=True),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Envía un mensaje al chatbot y guarda tanto la pregunta como la respuesta.
     El LLM recibe el historial completo de la conversación para mayor contexto.
+    La ruta es async de extremo a extremo (BD async + `ainvoke`), por lo que
+    una llamada lenta al proveedor no ocupa un worker del threadpool.
     
     Args:
         project_id: ID del proyecto
@@ -821,119 +1212,44 @@ def chat_with_ai(
     total_start = perf_counter()
     try:
         logger.info(f"📨 Chat recibido: project={project_id}, tab={tab}")
+        _check_llm_admission()
 
-        tab_validation_start = perf_counter()
-        valid_tabs = _get_valid_tabs(db)
-        tab_validation_ms = (perf_counter() - tab_validation_start) * 1000
-        
-        # Normalizar singular/plural para comodidad del usuario
-        normalized_tab = tab
-        if tab not in valid_tabs:
-            # intentar agregar o quitar 's'
-            if not tab.endswith('s') and f"{tab}s" in valid_tabs:
-                normalized_tab = f"{tab}s"
-            elif tab.endswith('s') and tab[:-1] in valid_tabs:
-                normalized_tab = tab[:-1]
-            # también casos especiales con 'es' (no hay por ahora)
-
-        if normalized_tab not in valid_tabs:
-            logger.warning(f"⚠️ Tab no válido: {tab}. Opciones: {', '.join(valid_tabs)}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Tab '{tab}' no válido. Opciones disponibles: {', '.join(valid_tabs)}"
-            )
-        else:
-            tab = normalized_tab  # usar versión corregida en adelante
-        
-        # Obtener o crear sesión
-        session_start = perf_counter()
-        session_id = get_existing_session_id(db, project_id, tab) or str(uuid.uuid4())
-        session_ms = (perf_counter() - session_start) * 1000
-        logger.info(f"🔗 Session ID: {session_id[:8]}...")
-
-        # Guardar pregunta del usuario
-        user_message = save_chat_message(db, project_id, tab, session_id, "user", question)
-
-        # 🆕 Recuperar historial de chat anterior para contexto
-        logger.info(f"📜 Recuperando historial de chat para contexto...")
-        history_start = perf_counter()
-        previous_messages = (
-            db.query(ChatHistory)
-            .filter(
-                ChatHistory.project_id == project_id,
-                ChatHistory.tab == tab,
-                ChatHistory.session_id == session_id
-            )
-            .order_by(ChatHistory.timestamp.desc())
-            .limit(_DEFAULT_CONTEXT_MESSAGES + 1)
-            .all()
-        )
-
-        previous_messages.reverse()
-        history_ms = (perf_counter() - history_start) * 1000
-        
-        # Convertir mensajes ORM a diccionarios para el LLM
-        chat_history = [
-            {
-                "sender": msg.sender,
-                "message": msg.message,
-                "timestamp": msg.timestamp
-            }
-            for msg in previous_messages[:-1]  # Excluir el mensaje del usuario que acabamos de guardar
-        ]
-        
-        logger.info(f"📚 Historial de {len(chat_history)} mensajes anteriores recuperado")
-
-        # 🆕 MEJORADO: Recuperar datos COMPLETOS del módulo con estructura jerárquica
-        logger.info(f"📊 Recuperando datos COMPLETOS del módulo {tab} (incluyendo subtablas)...")
-        module_data_start = perf_counter()
-        comprehensive_data = get_comprehensive_module_data(db, project_id, tab)
-        module_data_ms = (perf_counter() - module_data_start) * 1000
-        
-        # Formatear datos para el prompt
-        format_start = perf_counter()
-        module_context = format_module_data_for_prompt(comprehensive_data, max_items=_DEFAULT_CONTEXT_ITEMS)
-        if len(module_context) > _DEFAULT_CONTEXT_CHARS:
-            module_context = module_context[:_DEFAULT_CONTEXT_CHARS]
-        format_ms = (perf_counter() - format_start) * 1000
-        
-        logger.info(f"✅ Contexto del módulo {tab} recuperado ({comprehensive_data.get('total_records', 0)} registros en BD)")
+        turn = await _prepare_chat_turn(db, project_id, tab, question)
+        tab = turn["tab"]
+        session_id = turn["session_id"]
+        chat_history = turn["chat_history"]
+        module_context = turn["module_context"]
 
         # Llamar modelo LLM con historial Y datos COMPLETOS del módulo
         logger.info(f"🤖 Invocando LLM para tab={tab} con contexto completo de chat y módulo")
         llm_start = perf_counter()
-        answer = llm_manager.ask(
+        answer = await llm_manager.aask(
             question=question,
             tab=tab,
             context=module_context,  # 🆕 Datos COMPLETOS con estructura jerárquica
             chat_history=chat_history if chat_history else None,  # Pasar historial si existe
-            session_id=session_id
+            session_id=session_id,
+            conversation_summary=turn["conversation_summary"],
         )
         llm_ms = (perf_counter() - llm_start) * 1000
 
         # Guardar respuesta del bot
-        bot_message = save_chat_message(db, project_id, tab, session_id, "bot", answer)
+        bot_message = await asave_chat_message(db, project_id, tab, session_id, "bot", answer)
         logger.info(f"✅ Respuesta guardada (id={bot_message.id}, con historial de {len(chat_history)} msgs)")
-        total_ms = (perf_counter() - total_start) * 1000
-        logger.info(
-            "⏱️ Chat endpoint timing | project=%s tab=%s total_ms=%.1f tab_validation_ms=%.1f "
-            "session_ms=%.1f history_ms=%.1f module_data_ms=%.1f format_ms=%.1f llm_ms=%.1f "
-            "question_chars=%s module_context_chars=%s",
-            project_id,
-            tab,
-            total_ms,
-            tab_validation_ms,
-            session_ms,
-            history_ms,
-            module_data_ms,
-            format_ms,
-            llm_ms,
-            len(question or ""),
-            len(module_context or ""),
-        )
+        _log_chat_timing(project_id, tab, total_start, turn, llm_ms, question)
+
+        # Actualizar el resumen de la sesión después de enviar la respuesta
+        background_tasks.add_task(refresh_conversation_summary, project_id, tab, session_id)
 
         return bot_message
         
+    except LLMRateLimited as e:
+        logger.warning("⏱️ Chat endpoint rechazado | project=%s tab=%s retry_after=%.1f", project_id, tab, e.retry_after)
+        raise HTTPException(
+            status_code=429,
+            detail=_RATE_LIMITED_DETAIL,
+            headers={"Retry-After": str(_retry_after_seconds(e.retry_after))},
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -946,6 +1262,127 @@ def chat_with_ai(
         )
 
 
+@router.post("/chat/{project_id}/{tab}/stream")
+async def chat_with_ai_stream(
+    project_id: int,
+    tab: str,
+    background_tasks: BackgroundTasks,
+    question: str = Body(..., embed=True),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Variante en streaming (Server-Sent Events) de `chat_with_ai`.
+
+    Emite un evento `token` por cada fragmento generado por el proveedor y,
+    al terminar, guarda la respuesta completa del bot y emite un evento `done`
+    con el mensaje persistido (mismo esquema que `ChatMessageResponse`).
+    Si ocurre un error se emite un evento `error` (con `status=429` y `retry_after`
+    si el LLM está saturado). Si el proveedor falla a mitad de la respuesta, el
+    evento `error` lleva `truncated=true`: la respuesta parcial no se guarda ni se
+    incorpora al resumen de la conversación.
+
+    Args:
+        project_id: ID del proyecto
+        tab: Componente MGA
+        question: Pregunta del usuario
+        db: Sesión de BD
+
+    Returns:
+        StreamingResponse con `text/event-stream`
+    """
+    total_start = perf_counter()
+    try:
+        logger.info(f"📨 Chat (stream) recibido: project={project_id}, tab={tab}")
+        _check_llm_admission()
+        turn = await _prepare_chat_turn(db, project_id, tab, question)
+    except HTTPException:
+        raise
+    except Exception as e:
+        total_ms = (perf_counter() - total_start) * 1000
+        logger.error("⏱️ Chat endpoint fallo | project=%s tab=%s stream=true total_ms=%.1f", project_id, tab, total_ms)
+        logger.error(f"❌ Error en chat_with_ai_stream: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error en el chat: {str(e)}"
+        )
+
+    tab = turn["tab"]
+    session_id = turn["session_id"]
+    chat_history = turn["chat_history"]
+    module_context = turn["module_context"]
+    answer_saved = False
+
+    async def event_stream():
+        nonlocal answer_saved
+        llm_start = perf_counter()
+        ttft_ms = None
+        answer_parts: List[str] = []
+        try:
+            yield _sse_event("session", {"session_id": session_id, "tab": tab})
+            async for token in llm_manager.astream(
+                question=question,
+                tab=tab,
+                context=module_context,
+                chat_history=chat_history if chat_history else None,
+                session_id=session_id,
+                conversation_summary=turn["conversation_summary"],
+            ):
+                if ttft_ms is None:
+                    ttft_ms = (perf_counter() - llm_start) * 1000
+                answer_parts.append(token)
+                yield _sse_event("token", {"token": token})
+            llm_ms = (perf_counter() - llm_start) * 1000
+
+            # La sesión de la dependencia puede cerrarse antes de terminar el stream:
+            # usar una sesión propia para persistir la respuesta.
+            async with AsyncSessionLocal() as stream_db:
+                bot_message = await asave_chat_message(
+                    stream_db, project_id, tab, session_id, "bot", "".join(answer_parts)
+                )
+                payload = ChatMessageResponse.model_validate(bot_message).model_dump(mode="json")
+            answer_saved = True
+
+            logger.info(f"✅ Respuesta (stream) guardada (id={payload['id']}, con historial de {len(chat_history)} msgs)")
+            _log_chat_timing(project_id, tab, total_start, turn, llm_ms, question, ttft_ms=ttft_ms)
+            yield _sse_event("done", payload)
+        except LLMRateLimited as e:
+            logger.warning(
+                "⏱️ Chat endpoint rechazado | project=%s tab=%s stream=true retry_after=%.1f", project_id, tab, e.retry_after
+            )
+            yield _sse_event(
+                "error",
+                {"detail": _RATE_LIMITED_DETAIL, "status": 429, "retry_after": _retry_after_seconds(e.retry_after)},
+            )
+        except LLMStreamInterrupted as e:
+            total_ms = (perf_counter() - total_start) * 1000
+            logger.warning(
+                "⏱️ Chat endpoint truncado | project=%s tab=%s stream=true total_ms=%.1f emitted_chars=%s",
+                project_id,
+                tab,
+                total_ms,
+                e.emitted_chars,
+            )
+            yield _sse_event("error", {"detail": _TRUNCATED_DETAIL, "truncated": True})
+        except Exception as e:
+            total_ms = (perf_counter() - total_start) * 1000
+            logger.error("⏱️ Chat endpoint fallo | project=%s tab=%s stream=true total_ms=%.1f", project_id, tab, total_ms)
+            logger.error(f"❌ Error en chat_with_ai_stream: {str(e)}", exc_info=True)
+            yield _sse_event("error", {"detail": f"Error en el chat: {str(e)}"})
+
+    async def refresh_summary_if_saved() -> None:
+        # Se ejecuta al terminar el stream; sin respuesta guardada no hay turno que resumir
+        if answer_saved:
+            await refresh_conversation_summary(project_id, tab, session_id)
+
+    background_tasks.add_task(refresh_summary_if_saved)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks,
+    )
+
+
 @router.get("/{project_id}/{tab}", response_model=List[ChatMessageResponse])
 def get_chat_history(
     project_id: int,
@@ -1015,6 +1452,10 @@ def clear_chat_history(
             )
             .delete()
         )
+        db.query(ChatSummary).filter(
+            ChatSummary.project_id == project_id,
+            ChatSummary.tab == tab
+        ).delete()
         db.commit()
         
         if deleted == 0:
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session, selectinload
 from app.core.database import SessionLocal
+from app.utils.row_serializers import serialize_instance
 from importlib import import_module
 import json
 import os
@@ -19,31 +20,6 @@ def get_db():
         db.close()
 
 
-# ----------------------------
-# Serializador seguro de instancias
-# ----------------------------
-def serialize_instance(obj):
-    """Convierte una instancia SQLAlchemy en un dict plano con relaciones directas."""
-    data = {}
-    for col in obj.__table__.columns:
-        data[col.name] = getattr(obj, col.name)
-
-    for rel in obj.__mapper__.relationships:
-        related = getattr(obj, rel.key)
-        if related is None:
-            data[rel.key] = None
-        elif isinstance(related, list):
-            data[rel.key] = [
-                {c.name: getattr(item, c.name) for c in item.__table__.columns}
-                for item in related
-            ]
-        else:
-            data[rel.key] = {
-                c.name: getattr(related, c.name) for c in related.__table__.columns
-            }
-    return data
-
-
 # ----------------------------
 # Utilidad para convertir snake_case a PascalCase
 # ----------------------------
@@ -0,0 +1,172 @@
+"""
+Cache del bloque de contexto de módulo que se inyecta al prompt del chat.
+
+Cada entrada (project_id, tab) guarda los bloques ya formateados junto con la
+"versión de datos" de las tablas que lo componen. Las versiones se incrementan
+desde eventos de sesión de SQLAlchemy, por lo que cualquier endpoint de escritura
+(problems, population, objectives, alternatives_general, ...) invalida el
+contexto sin tener que tocar cada router:
+
+- `after_flush` y `do_orm_execute` (UPDATE/DELETE masivos) anotan en la sesión
+  las tablas tocadas.
+- `after_commit` incrementa sus versiones; `after_rollback` las descarta.
+
+- Filas con `project_id` incrementan la versión de (tabla, project_id).
+- Filas sin `project_id` (tablas hijas) incrementan la versión global de la tabla.
+
+Incrementar recién al confirmar evita que otro request, entre el flush y el
+commit, lea los datos aún no confirmados bajo la versión nueva y los deje en
+cache como vigentes.
+
+Límites:
+- Las versiones viven en memoria del proceso: una escritura en otro worker no
+  invalida este cache (solo lo acota el TTL, `CHAT_MODULE_CONTEXT_CACHE_TTL_SECONDS`).
+  Por eso el cache viene desactivado si `WEB_CONCURRENCY` (o `UVICORN_WORKERS`)
+  indica más de un worker; `CHAT_MODULE_CONTEXT_CACHE_ENABLED` lo fuerza.
+- Solo se detectan escrituras que pasan por la sesión ORM. Un `text()` o un
+  statement Core ejecutado con `connection.execute` no dispara estos eventos:
+  quien escriba así debe llamar a `ModuleContextCache.clear` o aceptar el TTL.
+"""
+
+import logging
+import os
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_TABLE_VERSIONS: Dict[str, int] = {}
+_PROJECT_TABLE_VERSIONS: Dict[Tuple[str, int], int] = {}
+_VERSIONS_LOCK = Lock()
+# Clave en `session.info` de los pares (tabla, project_id) pendientes de confirmar
+_PENDING_KEY = "module_context_pending_bumps"
+
+
+def _bump(table_name: str, project_id: Optional[int]) -> None:
+    with _VERSIONS_LOCK:
+        if project_id is None:
+            _TABLE_VERSIONS[table_name] = _TABLE_VERSIONS.get(table_name, 0) + 1
+        else:
+            key = (table_name, project_id)
+            _PROJECT_TABLE_VERSIONS[key] = _PROJECT_TABLE_VERSIONS.get(key, 0) + 1
+
+
+def _mark_pending(session, table_name: str, project_id: Optional[int]) -> None:
+    session.info.setdefault(_PENDING_KEY, set()).add((table_name, project_id))
+
+
+def _table_name_of(obj) -> Optional[str]:
+    table = getattr(obj, "__table__", None)
+    return table.name if table is not None else None
+
+
+# Solo escrituras ORM: `session.execute(text(...))` y los statements Core sobre una
+# conexión no pasan por after_flush ni se reconocen en do_orm_execute (ver docstring).
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_flush(session, flush_context) -> None:
+    """Anota las tablas (y proyectos) tocados en el flush; se invalidan al hacer commit."""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table_name = _table_name_of(obj)
+        if table_name:
+            _mark_pending(session, table_name, getattr(obj, "project_id", None))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state) -> None:
+    """`query.delete()` / `update()` masivos no pasan por flush: invalidar la tabla completa."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    for mapper in orm_execute_state.all_mappers:
+        _mark_pending(orm_execute_state.session, mapper.local_table.name, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session) -> None:
+    """Incrementa las versiones de lo anotado una vez que los datos están confirmados."""
+    for table_name, project_id in session.info.pop(_PENDING_KEY, ()):
+        _bump(table_name, project_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session) -> None:
+    """Los cambios revertidos no modifican datos: no hay nada que invalidar."""
+    session.info.pop(_PENDING_KEY, None)
+
+
+def data_version(project_id: int, tables: Iterable[str]) -> tuple:
+    """Huella de versión de un conjunto de tablas para un proyecto."""
+    with _VERSIONS_LOCK:
+        return tuple(
+            (table, _TABLE_VERSIONS.get(table, 0), _PROJECT_TABLE_VERSIONS.get((table, project_id), 0))
+            for table in sorted(tables)
+        )
+
+
+class ModuleContextCache:
+    """Cache (project_id, tab) -> bloques de contexto formateados + versión de datos."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Tuple[int, str], Tuple[tuple, float, Tuple[str, ...]]] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_env(cls) -> "ModuleContextCache":
+        raw_enabled = os.getenv("CHAT_MODULE_CONTEXT_CACHE_ENABLED", "").strip().lower()
+        if raw_enabled:
+            enabled = raw_enabled in {"1", "true", "yes", "on"}
+        else:
+            workers = max(int(os.getenv("WEB_CONCURRENCY", os.getenv("UVICORN_WORKERS", "1")) or 1), 1)
+            enabled = workers == 1
+            if not enabled:
+                logger.info(
+                    f"ℹ️ Cache de contexto de módulo desactivado: {workers} workers no comparten la "
+                    "invalidación (CHAT_MODULE_CONTEXT_CACHE_ENABLED=true lo fuerza)"
+                )
+        return cls(
+            max_entries=max(int(os.getenv("CHAT_MODULE_CONTEXT_CACHE_MAX_ENTRIES", "500")), 1),
+            ttl_seconds=max(int(os.getenv("CHAT_MODULE_CONTEXT_CACHE_TTL_SECONDS", "60")), 1),
+            enabled=enabled,
+        )
+
+    def get(self, project_id: int, tab: str, version: tuple) -> Optional[Tuple[str, ...]]:
+        """Retorna los bloques si existen, no expiraron y su versión coincide."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get((project_id, tab))
+            if entry is not None and (entry[0] != version or entry[1] <= monotonic()):
+                del self._entries[(project_id, tab)]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2]
+
+    def set(self, project_id: int, tab: str, version: tuple, context: Tuple[str, ...]) -> None:
+        """
+        Guarda los bloques formateados.
+
+        `version` debe calcularse ANTES de leer los datos, para que una escritura
+        concurrente deje la entrada obsoleta en lugar de fijar datos viejos.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries and (project_id, tab) not in self._entries:
+                # Expulsar la entrada más antigua por inserción.
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[(project_id, tab)] = (version, monotonic() + self.ttl_seconds, context)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
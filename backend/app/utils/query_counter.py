@@ -0,0 +1,41 @@
+"""
+Conteo de consultas ORM emitidas por una sesión.
+
+Se apoya en el evento `do_orm_execute` registrado sobre la instancia de sesión
+(no sobre el engine), por lo que solo cuenta las consultas de esa petición,
+incluidas las cargas de relaciones (selectin/lazy).
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+@dataclass
+class QueryCounter:
+    """Acumula las consultas vistas mientras el contexto está activo."""
+
+    count: int = 0
+    relationship_loads: int = 0
+    statements: List[str] = field(default_factory=list)
+
+
+@contextmanager
+def count_orm_queries(session: Session) -> Iterator[QueryCounter]:
+    """Cuenta las consultas ORM emitidas por `session` dentro del bloque."""
+    counter = QueryCounter()
+
+    def _on_execute(orm_execute_state) -> None:
+        counter.count += 1
+        if orm_execute_state.is_relationship_load:
+            counter.relationship_loads += 1
+        counter.statements.append(str(orm_execute_state.statement)[:200])
+
+    event.listen(session, "do_orm_execute", _on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(session, "do_orm_execute", _on_execute)
@@ -0,0 +1,148 @@
+"""
+Serializadores de filas ORM compilados por clase de modelo.
+
+En lugar de inspeccionar el mapper y filtrar columnas en cada fila, cada clase
+se compila una sola vez (al primer uso) en una tupla de claves, un
+`operator.attrgetter` y los conversores por columna. Serializar una fila queda
+reducido a un `attrgetter` + `zip`.
+
+Perfiles:
+- context: columnas visibles para el prompt del chat (sin ids, FKs ni JSON),
+  con valores convertidos a tipos JSON (datetime -> isoformat, etc.)
+- instance: todas las columnas de la tabla con su valor crudo, más las
+  relaciones directas (usado por /get_table_data)
+"""
+
+from datetime import date, datetime, time
+from operator import attrgetter
+from threading import Lock
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import inspect
+
+# Columnas que nunca se envían al prompt (JSON, timestamps, IDs internos)
+CONTEXT_IGNORED_COLUMNS = frozenset({
+    'id', 'created_at', 'updated_at', 'deleted_at',
+    'problem_tree_json', 'population_json', 'participants_json',
+    'alternatives_json', '_json'
+})
+
+_PASSTHROUGH_TYPES = (str, int, float, bool)
+
+
+def _to_isoformat(value):
+    return value.isoformat()
+
+
+def _to_json_compatible(value):
+    """Conversión genérica para columnas cuyo tipo Python no se conoce de antemano."""
+    if isinstance(value, _PASSTHROUGH_TYPES):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _converter_for(column) -> Optional[Callable]:
+    """Elige el conversor de una columna según su tipo (None = sin conversión)."""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return _to_json_compatible
+    if issubclass(python_type, _PASSTHROUGH_TYPES):
+        return None
+    if issubclass(python_type, (datetime, date, time)):
+        return _to_isoformat
+    return str
+
+
+class RowSerializer:
+    """Serializa instancias de una clase con getters y conversores precalculados."""
+
+    __slots__ = ("keys", "_getter", "_converters", "_single")
+
+    def __init__(self, keys: Tuple[str, ...], attributes: Tuple[str, ...], converters: Tuple[Optional[Callable], ...]):
+        self.keys = keys
+        self._getter = attrgetter(*attributes) if attributes else None
+        self._single = len(attributes) == 1
+        self._converters = converters if any(converters) else None
+
+    def __call__(self, obj) -> dict:
+        if self._getter is None:
+            return {}
+        values = self._getter(obj)
+        if self._single:
+            values = (values,)
+        if self._converters is None:
+            return dict(zip(self.keys, values))
+        return {
+            key: value if converter is None or value is None else converter(value)
+            for key, converter, value in zip(self.keys, self._converters, values)
+        }
+
+
+_CONTEXT_SERIALIZERS: Dict[type, RowSerializer] = {}
+_COLUMN_SERIALIZERS: Dict[type, RowSerializer] = {}
+_INSTANCE_RELATIONSHIPS: Dict[type, Tuple[Tuple[str, bool], ...]] = {}
+_REGISTRY_LOCK = Lock()
+
+
+def _compile_context_serializer(model_class) -> RowSerializer:
+    keys, attributes, converters = [], [], []
+    for prop in inspect(model_class).column_attrs:
+        column = prop.columns[0]
+        col_name = column.name
+        if col_name in CONTEXT_IGNORED_COLUMNS:
+            continue
+        if col_name.endswith('_id') and col_name != 'project_id':
+            continue
+        keys.append(col_name)
+        attributes.append(prop.key)
+        converters.append(_converter_for(column))
+    return RowSerializer(tuple(keys), tuple(attributes), tuple(converters))
+
+
+def _compile_column_serializer(model_class) -> RowSerializer:
+    names = tuple(column.name for column in model_class.__table__.columns)
+    return RowSerializer(names, names, (None,) * len(names))
+
+
+def _get_or_compile(registry: dict, model_class, compiler) -> RowSerializer:
+    serializer = registry.get(model_class)
+    if serializer is None:
+        with _REGISTRY_LOCK:
+            serializer = registry.get(model_class)
+            if serializer is None:
+                serializer = compiler(model_class)
+                registry[model_class] = serializer
+    return serializer
+
+
+def serialize_context_row(obj) -> dict:
+    """Columnas de `obj` visibles en el contexto del chat, listas para JSON."""
+    return _get_or_compile(_CONTEXT_SERIALIZERS, obj.__class__, _compile_context_serializer)(obj)
+
+
+def serialize_columns(obj) -> dict:
+    """Todas las columnas de la tabla de `obj` con su valor crudo."""
+    return _get_or_compile(_COLUMN_SERIALIZERS, obj.__class__, _compile_column_serializer)(obj)
+
+
+def serialize_instance(obj) -> dict:
+    """Columnas de `obj` más sus relaciones directas (solo columnas de las relacionadas)."""
+    model_class = obj.__class__
+    relationships = _INSTANCE_RELATIONSHIPS.get(model_class)
+    if relationships is None:
+        relationships = tuple((rel.key, rel.uselist) for rel in inspect(model_class).relationships)
+        _INSTANCE_RELATIONSHIPS[model_class] = relationships
+
+    data = serialize_columns(obj)
+    for key, uselist in relationships:
+        related = getattr(obj, key)
+        if related is None:
+            data[key] = None
+        elif uselist:
+            data[key] = [serialize_columns(item) for item in related]
+        else:
+            data[key] = serialize_columns(related)
+    return data